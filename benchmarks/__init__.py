@@ -0,0 +1,4 @@
+"""Micro-benchmarks for Flask-OpenHeart.
+
+Each module in this package is a standalone benchmark which can be run with ``python -m benchmarks.<name>``.
+"""
@@ -0,0 +1,84 @@
+"""Measure the throughput of adding reactions to a single page, against the number of sub-counters.
+
+Several writer processes add reactions to the same page at once, through `Storage`, so each reaction is followed by
+reading back the reactions for the page, as it is when handling a request. Each number of sub-counters is measured with
+a single SQLite database and with reactions sharded across several SQLite databases. Pass database URIs on the command
+line to measure those instead (e.g. Valkey servers); more than one URI is treated as a list of shards.
+"""
+
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from flask_openheart.config import OpenHeartConfig
+from flask_openheart.internal import Storage
+
+WRITERS = 8
+REACTIONS = 500
+COUNTER_SHARDS = (1, 2, 4, 8, 16)
+DATABASES = 4
+SLUG = "hot"
+
+
+def write(options, start, count):
+    """Add reactions to the same page, once every writer is ready."""
+    with Storage(SLUG, OpenHeartConfig(**options)) as storage:
+        storage.reactions  # noqa: B018 connect (and migrate) before the clock starts
+        start.wait()
+        for _ in range(count):
+            storage.react("❤️")
+
+
+def total(options):
+    """Get the number of reactions on the page."""
+    with Storage(SLUG, OpenHeartConfig(**options)) as storage:
+        return storage.version
+
+
+def measure(database_uri, counter_shards):
+    """Run all writers to completion, returning the number of reactions added per second."""
+    options = {"database_uri": database_uri, "counter_shards": counter_shards, "sqlite_busy_timeout": 60000}
+    before = total(options)
+    start = multiprocessing.Barrier(WRITERS + 1)
+    writers = [multiprocessing.Process(target=write, args=(options, start, REACTIONS)) for _ in range(WRITERS)]
+    for writer in writers:
+        writer.start()
+    start.wait()
+    began = time.perf_counter()
+    for writer in writers:
+        writer.join()
+    elapsed = time.perf_counter() - began
+    if total(options) - before != WRITERS * REACTIONS:
+        msg = "Some reactions were lost."
+        raise RuntimeError(msg)
+    return WRITERS * REACTIONS / elapsed
+
+
+def layouts(directory, counter_shards):
+    """Get the databases to measure, as (name, database URI) tuples, using fresh SQLite databases for every run."""
+    if len(sys.argv) > 2:  # noqa: PLR2004
+        return [("given shards", sys.argv[1:])]
+    if len(sys.argv) > 1:
+        return [("given database", sys.argv[1])]
+    run = Path(directory) / str(counter_shards)
+    run.mkdir()
+    return [
+        ("single SQLite", f"file:{run / 'openheart.db'}"),
+        (f"{DATABASES} SQLite shards", [f"file:{run / f'shard{i}.db'}" for i in range(DATABASES)]),
+    ]
+
+
+def main():
+    """Run the benchmark and print the throughput for each database layout and number of sub-counters."""
+    print(f"{WRITERS} writers, {REACTIONS} reactions each, to a single page")
+    print(f"{'database':<20} {'sub-counters':>12} {'reactions/s':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for counter_shards in COUNTER_SHARDS:
+            for name, uri in layouts(directory, counter_shards):
+                print(f"{name:<20} {counter_shards:>12} {measure(uri, counter_shards):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Compare the cost of loading the emoji set from the compact data file against loading the full emoji database.
+
+Each measurement runs in a fresh interpreter, after some setup, reporting the time taken and the growth of the peak
+resident set size.
+"""
+
+import subprocess
+import sys
+
+CASES = {
+    "import storage": ("import flask", "import flask_openheart.internal.storage"),
+    "full emoji database": (
+        "import flask_openheart.internal.storage",
+        "from emoji import EMOJI_DATA; frozenset(EMOJI_DATA)",
+    ),
+    "compact data file": (
+        "from flask_openheart.internal import emojis",
+        "emojis.load()",
+    ),
+}
+REPEAT = 5
+
+SCRIPT = """
+import resource, time
+{setup}
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+"""
+
+
+def measure(setup, code):
+    """Run some code in a fresh interpreter, returning the best time (in seconds) and the RSS growth (in KiB)."""
+    results = []
+    for _ in range(REPEAT):
+        output = subprocess.run(  # noqa: S603 the interpreter and script are fixed
+            [sys.executable, "-c", SCRIPT.format(setup=setup, code=code)], capture_output=True, check=True, text=True
+        ).stdout
+        elapsed, rss = output.split()
+        results.append((float(elapsed), int(rss)))
+    return min(results)
+
+
+def main():
+    """Run the benchmark and print the time and memory cost of each way of loading emojis."""
+    print(f"{'case':<22} {'time (ms)':>10} {'RSS (KiB)':>10}")
+    for name, (setup, code) in CASES.items():
+        elapsed, rss = measure(setup, code)
+        print(f"{name:<22} {elapsed * 1e3:>10.1f} {rss:>10}")
+
+
+if __name__ == "__main__":
+    main()
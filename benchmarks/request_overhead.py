@@ -0,0 +1,64 @@
+"""Measure the overhead Flask-OpenHeart adds to requests for endpoints which do not have OpenHeart enabled."""
+
+import timeit
+
+from flask import Flask, current_app, request
+
+from flask_openheart import OpenHeart
+from flask_openheart.controller import OpenHeartRequestController
+from flask_openheart.extension import before_request
+
+NUMBER = 20_000
+
+
+def original_before_request():
+    """The original implementation, which computes a slug for every request."""
+    enabled = current_app.openheart.is_enabled_for(request.endpoint, **request.view_args)
+    if enabled:
+        request.openheart = OpenHeartRequestController(request.endpoint, **request.view_args)
+    else:
+        request.openheart = None
+
+
+def create_app(*, openheart):
+    """Create an application with one OpenHeart-enabled endpoint and one plain endpoint."""
+    app = Flask(__name__)
+    if openheart:
+        OpenHeart(app)
+
+        @app.route("/enabled/<int:page_id>/", openheart=True)
+        def enabled(page_id):
+            return str(page_id)
+
+    @app.route("/plain/<int:page_id>/")
+    def plain(page_id):
+        return str(page_id)
+
+    return app
+
+
+def time_hook(app, hook):
+    """Time a before_request hook, in microseconds per call, on the plain endpoint."""
+    with app.test_request_context("/plain/1/"):
+        request.endpoint  # noqa: B018 make sure the URL has been matched
+        return timeit.timeit(hook, number=NUMBER) / NUMBER * 1e6
+
+
+def time_request(app):
+    """Time a full request to the plain endpoint through the test client, in microseconds per request."""
+    client = app.test_client()
+    number = NUMBER // 10
+    return timeit.timeit(lambda: client.get("/plain/1/"), number=number) / number * 1e6
+
+
+def main():
+    """Run the benchmark and print the results."""
+    app = create_app(openheart=True)
+    print(f"before_request, original:   {time_hook(app, original_before_request):8.2f} us")
+    print(f"before_request, current:    {time_hook(app, before_request):8.2f} us")
+    print(f"full request, without ext:  {time_request(create_app(openheart=False)):8.2f} us")
+    print(f"full request, with ext:     {time_request(app):8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
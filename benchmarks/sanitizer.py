@@ -0,0 +1,46 @@
+"""Compare the indexed emoji sanitizer against the original linear scan of the emoji database."""
+
+import timeit
+
+from emoji import EMOJI_DATA
+
+from flask_openheart.internal.storage import InvalidReactionError, sanitize_reaction
+
+SAMPLES = ["❤️", "🥨", "👍🏽", "👨‍👩‍👧‍👦", "🏴󠁧󠁢󠁳󠁣󠁴󠁿", "❤️ with some trailing data", "a"]
+NUMBER = 200
+
+
+def linear_sanitize_reaction(data):
+    """The original implementation, which compares the input against every known emoji."""
+    match = None
+    for emoji in EMOJI_DATA:
+        if match is not None and len(match) >= len(emoji):
+            continue
+        if data.startswith(emoji):
+            match = emoji
+    if match is None:
+        return None
+    return match, data[len(match) :]
+
+
+def indexed_sanitize_reaction(data):
+    """The current implementation, which looks up prefixes in a precomputed index."""
+    try:
+        return sanitize_reaction(data)
+    except InvalidReactionError:
+        return None
+
+
+def main():
+    """Run the benchmark and print the mean time per call for each sample."""
+    indexed_sanitize_reaction("")  # build the index outside of the timed section
+    print(f"{'input':<30} {'linear (us)':>12} {'indexed (us)':>12} {'speedup':>8}")
+    for sample in SAMPLES:
+        assert linear_sanitize_reaction(sample) == indexed_sanitize_reaction(sample)  # noqa: S101
+        linear = timeit.timeit(lambda s=sample: linear_sanitize_reaction(s), number=NUMBER) / NUMBER
+        indexed = timeit.timeit(lambda s=sample: indexed_sanitize_reaction(s), number=NUMBER) / NUMBER
+        print(f"{sample!r:<30} {linear * 1e6:>12.2f} {indexed * 1e6:>12.2f} {linear / indexed:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
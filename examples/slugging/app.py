@@ -22,8 +22,15 @@ app = create_app()
 
 @app.route("/")
 def index():
-    """A Flask endpoint that renders a listing of all sub-pages."""
-    return render_template("index.html", pages=dict(enumerate(pages)))
+    """A Flask endpoint that renders a listing of all sub-pages, along with how many hearts each page has received."""
+    # fetch the reactions for every page with a single query, rather than calling reactions_for once per page
+    items = [("page", {"page_id": page_id}) for page_id in range(len(pages))]
+    reactions = app.openheart.reactions_for_many(items)
+    hearts = {
+        page_id: reactions[app.openheart.slug_for(endpoint, **values)].get("❤️", 0)
+        for page_id, (endpoint, values) in enumerate(items)
+    }
+    return render_template("index.html", pages=dict(enumerate(pages)), hearts=hearts)
 
 
 @app.route("/page/<int:page_id>/", openheart=True)
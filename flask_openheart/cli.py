@@ -0,0 +1,79 @@
+"""Command-line tools for managing Flask-OpenHeart databases, available under the `flask openheart` command."""
+
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from flask_openheart.internal import get_backend
+from flask_openheart.internal.sharding import rebalance
+
+cli = AppGroup("openheart", help="Manage Flask-OpenHeart reaction databases.")
+
+
+def _database_uris(uris):
+    if uris:
+        return list(uris)
+    configured = set()
+    for config in current_app.openheart.configs.values():
+        uri = config.database_uri
+        configured.update(uri if isinstance(uri, tuple) else (uri,))
+    return sorted(configured)
+
+
+@cli.command("migrate")
+@click.option(
+    "--uri",
+    "uris",
+    multiple=True,
+    help="A database URI to migrate. May be repeated. Defaults to every database used by an OpenHeart endpoint.",
+)
+def migrate_command(uris):
+    """Bring stored reactions up to date with the layout expected by this version of Flask-OpenHeart."""
+    for uri in _database_uris(uris):
+        with get_backend(uri) as backend:
+            backend.migrate()
+        click.echo(f"Migrated {uri}")
+
+
+@cli.command("rebalance")
+@click.option(
+    "--drain",
+    "drain",
+    multiple=True,
+    help="A database URI which is no longer a shard, whose pages should be moved to the current shards. May be "
+    "repeated.",
+)
+def rebalance_command(drain):
+    """Move pages to the shards they are assigned to, after shards have been added to (or removed from) a database."""
+    configs = {}
+    for config in current_app.openheart.configs.values():
+        if isinstance(config.database_uri, tuple):
+            configs.setdefault(config.database_uri, config)
+    if not configs:
+        msg = "No OpenHeart endpoint uses a sharded database."
+        raise click.UsageError(msg)
+    for uris, config in configs.items():
+        moved = rebalance(uris, drain=drain, pragmas=config.sqlite_pragmas)
+        click.echo(f"Moved {moved} pages across {len(uris)} shards")
+
+
+@cli.command("compact")
+def compact_command():
+    """Roll up the history of reactions into hour and day buckets, and remove history older than its retention period.
+
+    Run this regularly (e.g. hourly), and more often than the retention period for minute buckets.
+    """
+    configs = {}
+    for config in current_app.openheart.configs.values():
+        if config.history:
+            configs.setdefault((config.database_uri, config.history_retention), config)
+    if not configs:
+        msg = "No OpenHeart endpoint records history."
+        raise click.UsageError(msg)
+    now = time.time()
+    for (uri, retention), config in configs.items():
+        with get_backend(uri, pragmas=config.sqlite_pragmas) as backend:
+            backend.compact(now, retention)
+        click.echo(f"Compacted {', '.join(uri) if isinstance(uri, tuple) else uri}")
@@ -1,7 +1,27 @@
 """Configuration for OpenHeart-enabled endpoints."""
 
+from flask_openheart.internal import history
+
 DEFAULT_DATABASE_URI = "file:openheart.db"
 DEFAULT_URL_PREFIX = "/openheart"
+DEFAULT_POOL_SIZE = 4
+DEFAULT_POOL_CHECK_INTERVAL = 30
+DEFAULT_WRITE_BEHIND_INTERVAL = 1000
+DEFAULT_WRITE_BEHIND_MAX_EVENTS = 1000
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_MAX_REACTION_PAYLOAD = 1024
+DEFAULT_STREAM_QUEUE_SIZE = 16
+DEFAULT_STREAM_KEEPALIVE = 15
+DEFAULT_RATE_LIMIT_PERIOD = 60
+DEFAULT_RATE_LIMIT_SIZE = 10000
+DEFAULT_DEDUP_SIZE = 65536
+DEFAULT_SQLITE_JOURNAL_MODE = "WAL"
+DEFAULT_SQLITE_SYNCHRONOUS = "NORMAL"
+DEFAULT_SQLITE_BUSY_TIMEOUT = 5000
+DEFAULT_REPLICA_RETRY_INTERVAL = 30
+DEFAULT_COUNTER_SHARDS = 1
+DEFAULT_HISTORY_MINUTE_RETENTION = 24 * 60 * 60
+DEFAULT_HISTORY_HOUR_RETENTION = 30 * 24 * 60 * 60
 
 
 class OpenHeartConfig(dict):
@@ -9,8 +29,55 @@ class OpenHeartConfig(dict):
 
     @property
     def database_uri(self):
-        """The database URI."""
-        return self.get("database_uri", DEFAULT_DATABASE_URI)
+        """The database URI, or a tuple of database URIs to shard reactions across."""
+        uri = self.get("database_uri", DEFAULT_DATABASE_URI)
+        if isinstance(uri, list):
+            return tuple(uri)
+        return uri
+
+    @property
+    def read_database_uris(self):
+        """The database URIs of read replicas, as a tuple. Reactions are read from them, but added to `database_uri`."""
+        return tuple(tuple(uri) if isinstance(uri, list) else uri for uri in self.get("read_database_uris", ()))
+
+    @property
+    def replica_retry_interval(self):
+        """The number of seconds for which a read replica which has failed is skipped."""
+        return self.get("replica_retry_interval", DEFAULT_REPLICA_RETRY_INTERVAL)
+
+    @property
+    def counter_shards(self):
+        """The number of sub-counters to spread the reactions for each page across."""
+        return self.get("counter_shards", DEFAULT_COUNTER_SHARDS)
+
+    @property
+    def history(self):
+        """Whether to record the history of reactions, so that reactions within a time window can be counted."""
+        return self.get("history", False)
+
+    @property
+    def history_minute_retention(self):
+        """The number of seconds for which to keep minute buckets of history."""
+        return self.get("history_minute_retention", DEFAULT_HISTORY_MINUTE_RETENTION)
+
+    @property
+    def history_hour_retention(self):
+        """The number of seconds for which to keep hour buckets of history."""
+        return self.get("history_hour_retention", DEFAULT_HISTORY_HOUR_RETENTION)
+
+    @property
+    def history_day_retention(self):
+        """The number of seconds for which to keep day buckets of history. None keeps them forever."""
+        return self.get("history_day_retention", None)
+
+    @property
+    def history_retention(self):
+        """The retention period of each resolution of history, as a tuple of (resolution, seconds) pairs."""
+        return (
+            (history.MINUTE, self.history_minute_retention),
+            (history.HOUR, self.history_hour_retention),
+            (history.DAY, self.history_day_retention),
+        )
 
     @property
     def url_prefix(self):
@@ -21,3 +88,160 @@ class OpenHeartConfig(dict):
     def post_url_prefix(self):
         """The URL prefix for OpenHeart API SET requests. Defaults to `url_prefix`."""
         return self.get("post_url_prefix", self.url_prefix)
+
+    @property
+    def pool_size(self):
+        """The maximum number of idle database connections to keep open for reuse. Zero disables reuse."""
+        return self.get("pool_size", DEFAULT_POOL_SIZE)
+
+    @property
+    def pool_check_interval(self):
+        """The number of seconds a pooled connection can sit idle before it gets a health check on reuse."""
+        return self.get("pool_check_interval", DEFAULT_POOL_CHECK_INTERVAL)
+
+    @property
+    def write_behind(self):
+        """Whether to buffer reactions in memory and write them to the database in batches."""
+        return self.get("write_behind", False)
+
+    @property
+    def write_behind_interval(self):
+        """The maximum number of milliseconds to buffer reactions before writing them, in write-behind mode."""
+        return self.get("write_behind_interval", DEFAULT_WRITE_BEHIND_INTERVAL)
+
+    @property
+    def write_behind_max_events(self):
+        """The maximum number of reactions to buffer before writing them, in write-behind mode."""
+        return self.get("write_behind_max_events", DEFAULT_WRITE_BEHIND_MAX_EVENTS)
+
+    @property
+    def cache_ttl(self):
+        """The number of seconds to cache reactions in memory. Zero disables the cache."""
+        return self.get("cache_ttl", 0)
+
+    @property
+    def cache_size(self):
+        """The maximum number of pages for which to cache reactions in memory."""
+        return self.get("cache_size", DEFAULT_CACHE_SIZE)
+
+    @property
+    def pubsub_uri(self):
+        """The URI of a Valkey or Redis server, used to notify other processes when reactions change."""
+        return self.get("pubsub_uri", None)
+
+    @property
+    def slug_cache_size(self):
+        """The number of slugs to memoize per endpoint, for deterministic slug functions. Zero disables memoization."""
+        return self.get("slug_cache_size", 0)
+
+    @property
+    def cache_max_age(self):
+        """The max-age, in seconds, for the Cache-Control header of OpenHeart GET responses. None omits the header."""
+        return self.get("cache_max_age", None)
+
+    @property
+    def stream(self):
+        """Whether to serve a Server-Sent Events stream of reaction updates."""
+        return self.get("stream", False)
+
+    @property
+    def async_handler(self):
+        """Whether to serve OpenHeart GET and POST requests from an async view."""
+        return self.get("async_handler", False)
+
+    @property
+    def stream_url_prefix(self):
+        """The URL prefix for OpenHeart Server-Sent Events streams. Defaults to `url_prefix` followed by "/stream"."""
+        return self.get("stream_url_prefix", f"{self.url_prefix}/stream")
+
+    @property
+    def stream_queue_size(self):
+        """The maximum number of undelivered updates to hold for each stream."""
+        return self.get("stream_queue_size", DEFAULT_STREAM_QUEUE_SIZE)
+
+    @property
+    def stream_keepalive(self):
+        """The number of seconds between keepalive comments on an idle stream."""
+        return self.get("stream_keepalive", DEFAULT_STREAM_KEEPALIVE)
+
+    @property
+    def max_reaction_payload(self):
+        """The maximum size of a reaction request body, in bytes. Larger requests are rejected without being read."""
+        return self.get("max_reaction_payload", DEFAULT_MAX_REACTION_PAYLOAD)
+
+    @property
+    def rate_limit(self):
+        """The number of reactions each client may make to each page per `rate_limit_period`. Zero disables limits."""
+        return self.get("rate_limit", 0)
+
+    @property
+    def rate_limit_period(self):
+        """The number of seconds over which `rate_limit` applies."""
+        return self.get("rate_limit_period", DEFAULT_RATE_LIMIT_PERIOD)
+
+    @property
+    def rate_limit_size(self):
+        """The maximum number of limits, one per client and page, tracked in each process across all pages."""
+        return self.get("rate_limit_size", DEFAULT_RATE_LIMIT_SIZE)
+
+    @property
+    def rate_limit_uri(self):
+        """The URI of a Valkey or Redis server used to share rate limits between processes, or None."""
+        return self.get("rate_limit_uri", None)
+
+    @property
+    def dedup(self):
+        """Whether to allow each client to make each reaction to each page only once."""
+        return self.get("dedup", False)
+
+    @property
+    def dedup_size(self):
+        """The size, in bits, of the filter which records the clients that have reacted to a page."""
+        return self.get("dedup_size", DEFAULT_DEDUP_SIZE)
+
+    @property
+    def dedup_cookie(self):
+        """The name of a cookie used to identify clients for deduplication, or None to identify them by address."""
+        return self.get("dedup_cookie", None)
+
+    @property
+    def dedup_key(self):
+        """A secret used to key the hashes of client identifiers, or None. The extension defaults it to SECRET_KEY."""
+        return self.get("dedup_key", None)
+
+    @property
+    def sqlite_journal_mode(self):
+        """The SQLite journal mode, e.g. "WAL" or "DELETE". None leaves the database's journal mode as it is."""
+        return self.get("sqlite_journal_mode", DEFAULT_SQLITE_JOURNAL_MODE)
+
+    @property
+    def sqlite_synchronous(self):
+        """The SQLite synchronous level, e.g. "NORMAL" or "FULL". None uses SQLite's default."""
+        return self.get("sqlite_synchronous", DEFAULT_SQLITE_SYNCHRONOUS)
+
+    @property
+    def sqlite_busy_timeout(self):
+        """The number of milliseconds to wait for a locked SQLite database before giving up."""
+        return self.get("sqlite_busy_timeout", DEFAULT_SQLITE_BUSY_TIMEOUT)
+
+    @property
+    def sqlite_cache_size(self):
+        """The SQLite page cache size, per connection. None uses SQLite's default."""
+        return self.get("sqlite_cache_size", None)
+
+    @property
+    def sqlite_mmap_size(self):
+        """The maximum number of bytes of the SQLite database to memory-map. None uses SQLite's default."""
+        return self.get("sqlite_mmap_size", None)
+
+    @property
+    def sqlite_pragmas(self):
+        """The pragmas to apply to every SQLite connection, as a tuple of (name, value) pairs."""
+        pragmas = (
+            ("busy_timeout", self.sqlite_busy_timeout),
+            ("journal_mode", self.sqlite_journal_mode),
+            ("synchronous", self.sqlite_synchronous),
+            ("cache_size", self.sqlite_cache_size),
+            ("mmap_size", self.sqlite_mmap_size),
+        )
+        return tuple((name, value) for name, value in pragmas if value is not None)
@@ -1,8 +1,32 @@
 """The mapper module provides convenient ways to use OpenHeart reactions programmatically."""
 
+import asyncio
+import functools
+import logging
+import threading
+import time
+
 from flask import current_app
 
-from flask_openheart.internal import Storage
+from flask_openheart.internal import (
+    BackendError,
+    ReactionCache,
+    Storage,
+    get_broadcaster,
+    get_rate_limiter,
+    get_replica_set,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _memoize(func, maxsize):
+    @functools.lru_cache(maxsize=maxsize)
+    def memoized(key):
+        return func(**dict(key))
+
+    memoized.func = func
+    return memoized
 
 
 class OpenHeartController:
@@ -11,9 +35,50 @@ class OpenHeartController:
     def __init__(self):
         """Initialize a new instance of the OpenHeartExtension."""
         self.configs = {}
+        self.enabled_endpoints = frozenset()
         self.slug_functions = {}
+        self.caches = {}
+        self._caches_lock = threading.Lock()
+        self._memoized_slug_functions = {}
+
+    def _cache_for(self, config):
+        if not config.cache_ttl:
+            return None
+        key = (config.database_uri, config.cache_size, config.cache_ttl, config.pubsub_uri)
+        with self._caches_lock:
+            cache = self.caches.get(key)
+            if cache is None:
+                cache = ReactionCache(config.cache_size, config.cache_ttl)
+                if config.pubsub_uri is not None:
+                    get_broadcaster(config.pubsub_uri).subscribe(cache.on_message)
+                self.caches[key] = cache
+        return cache
+
+    def _read(self, config, slug, read):
+        replicas = get_replica_set(config.read_database_uris, config.replica_retry_interval)
+        for uri in replicas.candidates():
+            try:
+                with Storage(slug, config, database_uri=uri) as storage:
+                    return read(storage)
+            except BackendError:
+                logger.warning("Failed to read from replica %s; trying another.", uri, exc_info=True)
+                replicas.failed(uri)
+        with Storage(slug, config) as storage:
+            return read(storage)
+
+    async def _aread(self, config, slug, read):
+        replicas = get_replica_set(config.read_database_uris, config.replica_retry_interval)
+        for uri in replicas.candidates():
+            try:
+                with Storage(slug, config, database_uri=uri) as storage:
+                    return await read(storage)
+            except BackendError:
+                logger.warning("Failed to read from replica %s; trying another.", uri, exc_info=True)
+                replicas.failed(uri)
+        with Storage(slug, config) as storage:
+            return await read(storage)
 
-    def url_for(self, endpoint, _method=None, **values):
+    def url_for(self, endpoint, _method=None, _slug=None, **values):
         """Get the OpenHeart URL associated with a given endpoint.
 
         This function behaves like `flask.url_for`.
@@ -22,15 +87,20 @@ class OpenHeartController:
         accepts reactions, use the `_method` arg or use `post_url_for` instead.
 
         :param endpoint: The name of the endpoint which supports OpenHeart.
-        :param _method (optional): The HTTP method. Defaults to GET. Supported values: GET, POST.
+        :param _method (optional): The HTTP method. Defaults to GET. Supported values: GET, POST, STREAM (for the
+            Server-Sent Events stream, if enabled).
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
         :param values: Values to use for the variable parts of the URL rule. Passed to `flask.url_for`.
 
-        :return: The URL for the OpenHeart endpoint associated with the specified endpoint.
+        :return: The URL for the OpenHeart endpoint associated with the specified endpoint, or None if OpenHeart (or the
+            stream, for STREAM) is not enabled for it.
         """
-        if not self.is_enabled_for(endpoint, **values):
+        if _slug is None and not self.is_enabled_for(endpoint, **values):
             return None
         if _method is None:
             _method = "GET"
+        if _method.upper() == "STREAM" and not self.config_for(endpoint).stream:
+            return None
         endpoint = f"openheart.{_method.lower()}.{endpoint}"
         return current_app.url_for(endpoint, **values)
 
@@ -46,6 +116,20 @@ class OpenHeartController:
         """
         return self.url_for(endpoint, _method="POST", **values)
 
+    def stream_url_for(self, endpoint, **values):
+        """Get the OpenHeart Server-Sent Events stream URL associated with a given endpoint.
+
+        This is an alias for `url_for` but with the `_method` arg set to "STREAM". The stream must be enabled for the
+        endpoint with the `stream` option.
+
+        :param endpoint: The name of the endpoint which supports OpenHeart.
+        :param values: Values to use for the variable parts of the URL rule.
+
+        :return: The URL for the OpenHeart stream associated with the specified endpoint, or None if the stream is not
+            enabled for it.
+        """
+        return self.url_for(endpoint, _method="STREAM", **values)
+
     def slug_for(self, endpoint, **values):
         """Compute a unique slug for the resource represented by the given endpoint with the given values.
 
@@ -62,34 +146,204 @@ class OpenHeartController:
             return None
         if endpoint in self.slug_functions:
             current_app.inject_url_defaults(endpoint, values)
-            slug = self.slug_functions[endpoint](**values)
+            slug = self._call_slug_function(endpoint, values)
             if slug is not None:
                 slug = f"{endpoint}.{slug!s}"
             return slug
         return endpoint
 
-    def reactions_for(self, endpoint, **values):
+    def _call_slug_function(self, endpoint, values):
+        func = self.slug_functions[endpoint]
+        cache_size = self.configs[endpoint].slug_cache_size
+        if not cache_size:
+            return func(**values)
+        key = frozenset(values.items())
+        try:
+            hash(key)
+        except TypeError:
+            return func(**values)
+        memoized = self._memoized_slug_functions.get(endpoint)
+        if memoized is None or memoized.func is not func:
+            memoized = _memoize(func, cache_size)
+            self._memoized_slug_functions[endpoint] = memoized
+        return memoized(key)
+
+    def reactions_for(self, endpoint, _slug=None, **values):
         """Get all reactions for the given endpoint.
 
         Similar to `flask.url_for`, you must provide an endpoint name and all of the values needed to build the
         endpoint's URL.
 
         This function returns a dictionary containing all reactions for that endpoint (with the given values), where the
-        reaction is the key and the count is the value.
+        reaction is the key and the count is the value. If the read cache is enabled, the result may be up to
+        `cache_ttl` seconds old, unless the reactions were changed by this process. If read replicas are configured, the
+        reactions are read from one of them (or from the primary database, if none of them can be reached), so they may
+        lag behind the reactions returned by `react_to`, which always come from the primary database.
 
         :param endpoint: The endpoint name associated with the slug to generate.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
         :param values: Values to use for the variable parts of the URL rule.
 
         :return: The reactions associated with this endpoint (with the given values), as a dict.
         """
-        slug = self.slug_for(endpoint, **values)
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
         if slug is None:
-            raise RuntimeError  # TODO better exception
+            msg = f"OpenHeart is not enabled for '{endpoint}' with these values."
+            raise RuntimeError(msg)
         config = self.configs[endpoint]
-        with Storage(slug, config) as storage:
-            return storage.reactions
+        cache = self._cache_for(config)
+        if cache is not None:
+            reactions = cache.get(slug)
+            if reactions is not None:
+                return reactions
+        reactions = self._read(config, slug, lambda storage: storage.reactions)
+        if cache is not None:
+            cache.set(slug, reactions)
+        return reactions
+
+    async def areactions_for(self, endpoint, _slug=None, **values):
+        """Get all reactions for the given endpoint, without blocking the event loop.
+
+        This is the asyncio variant of `reactions_for`, for use in async views.
+
+        :param endpoint: The endpoint name associated with the slug to generate.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
+        :param values: Values to use for the variable parts of the URL rule.
 
-    def react_to(self, reaction, endpoint, **values):
+        :return: The reactions associated with this endpoint (with the given values), as a dict.
+        """
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
+        if slug is None:
+            msg = f"OpenHeart is not enabled for '{endpoint}' with these values."
+            raise RuntimeError(msg)
+        config = self.configs[endpoint]
+        cache = self._cache_for(config)
+        if cache is not None:
+            reactions = cache.get(slug)
+            if reactions is not None:
+                return reactions
+        reactions = await self._aread(config, slug, lambda storage: storage.areactions())
+        if cache is not None:
+            cache.set(slug, reactions)
+        return reactions
+
+    def version_for(self, endpoint, _slug=None, **values):
+        """Get the version of the reactions for the given endpoint.
+
+        The version changes whenever the reactions change. It is always equal to the sum of the counts returned by
+        `reactions_for`, but it can usually be read more cheaply than the reactions themselves.
+
+        :param endpoint: The endpoint name associated with the slug to generate.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
+        :param values: Values to use for the variable parts of the URL rule.
+
+        :return: The version, as an int.
+        """
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
+        if slug is None:
+            msg = f"OpenHeart is not enabled for '{endpoint}' with these values."
+            raise RuntimeError(msg)
+        config = self.configs[endpoint]
+        cache = self._cache_for(config)
+        if cache is not None:
+            reactions = cache.get(slug)
+            if reactions is not None:
+                return sum(reactions.values())
+        return self._read(config, slug, lambda storage: storage.version)
+
+    async def aversion_for(self, endpoint, _slug=None, **values):
+        """Get the version of the reactions for the given endpoint, without blocking the event loop.
+
+        This is the asyncio variant of `version_for`, for use in async views.
+
+        :param endpoint: The endpoint name associated with the slug to generate.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
+        :param values: Values to use for the variable parts of the URL rule.
+
+        :return: The version, as an int.
+        """
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
+        if slug is None:
+            msg = f"OpenHeart is not enabled for '{endpoint}' with these values."
+            raise RuntimeError(msg)
+        config = self.configs[endpoint]
+        cache = self._cache_for(config)
+        if cache is not None:
+            reactions = cache.get(slug)
+            if reactions is not None:
+                return sum(reactions.values())
+        return await self._aread(config, slug, lambda storage: storage.aversion())
+
+    def reactions_within(self, endpoint, _window, _slug=None, **values):
+        """Get the reactions made to the given endpoint within the last `_window` seconds.
+
+        History must be enabled for the endpoint with the `history` option. The start of the window is rounded down to
+        the start of a minute, hour or day, depending on how far back it is and how long history is kept for. Reactions
+        made before history was enabled are not counted; a window which starts before the epoch counts every recorded
+        reaction.
+
+        :param endpoint: The endpoint name associated with the slug to generate.
+        :param _window: The length of the window, in seconds.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
+        :param values: Values to use for the variable parts of the URL rule.
+
+        :return: The reactions associated with this endpoint (with the given values), as a dict.
+        """
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
+        if slug is None:
+            msg = f"OpenHeart is not enabled for '{endpoint}' with these values."
+            raise RuntimeError(msg)
+        config = self.configs[endpoint]
+        if not config.history:
+            msg = f"History is not enabled for '{endpoint}'."
+            raise RuntimeError(msg)
+        now = time.time()
+        start = now - min(_window, now)
+        return self._read(config, slug, lambda storage: storage.reactions_between(start))
+
+    def reactions_for_many(self, items):
+        """Get all reactions for many endpoints at once.
+
+        This is useful for pages which list many resources, such as an index page. Rather than calling `reactions_for`
+        once per resource, all of the reactions are queried with a single round trip per database.
+
+        Items for which OpenHeart is not enabled are skipped. Items whose endpoints have the same configuration are
+        queried together, so endpoints with different options are queried separately, even if they share a database.
+
+        :param items: An iterable of (endpoint, values) tuples, where values is a dict of values to use for the
+            variable parts of the URL rule.
+
+        :return: A dict in which the keys are slugs (see `slug_for`) and the values are dicts of reactions.
+        """
+        results = {}
+        pending = []
+        for endpoint, values in items:
+            slug = self.slug_for(endpoint, **values)
+            if slug is None or slug in results:
+                continue
+            config = self.configs[endpoint]
+            cache = self._cache_for(config)
+            reactions = cache.get(slug) if cache is not None else None
+            if reactions is not None:
+                results[slug] = reactions
+                continue
+            results[slug] = None
+            # any option may change how the reactions are read, e.g. the number of sub-counters to add up
+            slugs = next((group for other, group in pending if other == config), None)
+            if slugs is None:
+                slugs = []
+                pending.append((config, slugs))
+            slugs.append(slug)
+        for config, slugs in pending:
+            reactions = self._read(config, None, lambda storage, slugs=slugs: storage.reactions_many(slugs))
+            cache = self._cache_for(config)
+            for slug in slugs:
+                results[slug] = reactions[slug]
+                if cache is not None:
+                    cache.set(slug, reactions[slug])
+        return results
+
+    def react_to(self, reaction, endpoint, _slug=None, _client=None, **values):
         """Add a reaction for the given endpoint.
 
         Similar to `flask.url_for`, you must provide an endpoint name and all of the values needed to build the
@@ -99,16 +353,83 @@ class OpenHeartController:
 
         :param reaction: The desired reaction emoji, as a string, optionally with trailing data.
         :param endpoint: The endpoint name associated with the slug to generate.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
+        :param _client (optional): A string identifying the client, used for deduplication (if enabled).
         :param values: Values to use for the variable parts of the URL rule.
 
+        :exception DuplicateReactionError: The client has already made this reaction to this page.
+
         :return: The reactions associated with this endpoint (with the given values), as a dict.
         """
-        slug = self.slug_for(endpoint, **values)
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
         if slug is None:
-            raise RuntimeError  # TODO better exception
+            msg = f"OpenHeart is not enabled for '{endpoint}' with these values."
+            raise RuntimeError(msg)
         config = self.configs[endpoint]
         with Storage(slug, config) as storage:
-            return storage.react(reaction)
+            reactions = storage.react(reaction, client=_client)
+        cache = self._cache_for(config)
+        if cache is not None:
+            cache.set(slug, reactions)
+        get_broadcaster(config.pubsub_uri).publish(slug, reactions)
+        return reactions
+
+    async def areact_to(self, reaction, endpoint, _slug=None, _client=None, **values):
+        """Add a reaction for the given endpoint, without blocking the event loop.
+
+        This is the asyncio variant of `react_to`, for use in async views.
+
+        :param reaction: The desired reaction emoji, as a string, optionally with trailing data.
+        :param endpoint: The endpoint name associated with the slug to generate.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
+        :param _client (optional): A string identifying the client, used for deduplication (if enabled).
+        :param values: Values to use for the variable parts of the URL rule.
+
+        :exception DuplicateReactionError: The client has already made this reaction to this page.
+
+        :return: The reactions associated with this endpoint (with the given values), as a dict.
+        """
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
+        if slug is None:
+            msg = f"OpenHeart is not enabled for '{endpoint}' with these values."
+            raise RuntimeError(msg)
+        config = self.configs[endpoint]
+        with Storage(slug, config) as storage:
+            reactions = await storage.areact(reaction, client=_client)
+        cache = self._cache_for(config)
+        if cache is not None:
+            cache.set(slug, reactions)
+        broadcaster = get_broadcaster(config.pubsub_uri)
+        if config.pubsub_uri is not None:
+            # publishing to a message broker is a network round trip
+            await asyncio.to_thread(broadcaster.publish, slug, reactions)
+        else:
+            broadcaster.publish(slug, reactions)
+        return reactions
+
+    def throttle(self, client, endpoint, _slug=None, **values):
+        """Count a reaction from a client against the rate limit for the given endpoint.
+
+        This does not add the reaction; it only checks (and records) whether the client may add one. No storage is
+        touched, so it is cheap enough to call before anything else when handling a reaction.
+
+        :param client: A string identifying the client, e.g. its address.
+        :param endpoint: The endpoint name associated with the slug to generate.
+        :param _slug (optional): The slug for this endpoint with these values, if already known.
+        :param values: Values to use for the variable parts of the URL rule.
+
+        :return: Zero if the reaction is allowed, or else the number of seconds until it would be.
+        """
+        config = self.configs[endpoint]
+        if not config.rate_limit:
+            return 0
+        slug = _slug if _slug is not None else self.slug_for(endpoint, **values)
+        if slug is None:
+            return 0
+        limiter = get_rate_limiter(
+            config.rate_limit, config.rate_limit_period, config.rate_limit_size, config.rate_limit_uri
+        )
+        return limiter.hit(client, slug)
 
     def config_for(self, endpoint):
         """Get the OpenHeartConfig associated with a given endpoint."""
@@ -128,18 +449,28 @@ class OpenHeartController:
 class OpenHeartRequestController:
     """OpenHeartRequest gets attached to each request to expose OpenHeart functionality."""
 
-    def __init__(self, endpoint, **values):
+    def __init__(self, endpoint, _slug=None, **values):
         """Create a new OpenHeartRequest instance.
 
         :param endpoint: The endpoint name.
+        :param _slug (optional): The slug for this endpoint with these values, if already known. Otherwise, it is
+            computed the first time it is needed.
         :param values: Values to use for the variable parts of the URL rule.
         """
         self.endpoint = endpoint
         self.values = values
+        self._slug = _slug
 
     def _url(self, **args):
         args.update(self.values)
-        return current_app.openheart.url_for(self.endpoint, **args)
+        return current_app.openheart.url_for(self.endpoint, _slug=self.slug, **args)
+
+    @property
+    def slug(self):
+        """The OpenHeart slug for this request. It is computed at most once per request."""
+        if self._slug is None:
+            self._slug = current_app.openheart.slug_for(self.endpoint, **self.values)
+        return self._slug
 
     @property
     def config(self):
@@ -166,10 +497,15 @@ class OpenHeartRequestController:
         """The OpenHeart reactions POST URL for this request, formatted as an external link."""
         return self._url(_method="POST", _external=True)
 
+    @property
+    def stream_url(self):
+        """The OpenHeart Server-Sent Events stream URL for this request, if the stream is enabled."""
+        return self._url(_method="STREAM")
+
     @property
     def reactions(self):
         """The OpenHeart reactions for this request."""
-        return current_app.reactions_for(self.endpoint, **self.values)
+        return current_app.openheart.reactions_for(self.endpoint, _slug=self.slug, **self.values)
 
     def react(self, reaction):
         """Add an OpenHeart reaction for this page.
@@ -178,4 +514,26 @@ class OpenHeartRequestController:
 
         :return: The updated reactions, as a dict.
         """
-        return current_app.react_to(reaction, self.endpoint, **self.values)
+        return current_app.openheart.react_to(reaction, self.endpoint, _slug=self.slug, **self.values)
+
+    def reactions_within(self, window):
+        """The OpenHeart reactions for this request, made within the last `window` seconds.
+
+        :param window: The length of the window, in seconds.
+
+        :return: The reactions, as a dict.
+        """
+        return current_app.openheart.reactions_within(self.endpoint, window, _slug=self.slug, **self.values)
+
+    async def areactions(self):
+        """Get the OpenHeart reactions for this request, without blocking the event loop."""
+        return await current_app.openheart.areactions_for(self.endpoint, _slug=self.slug, **self.values)
+
+    async def areact(self, reaction):
+        """Add an OpenHeart reaction for this page, without blocking the event loop.
+
+        :param reaction: The desired reaction emoji, as a string, optionally with trailing data.
+
+        :return: The updated reactions, as a dict.
+        """
+        return await current_app.openheart.areact_to(reaction, self.endpoint, _slug=self.slug, **self.values)
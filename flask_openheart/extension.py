@@ -1,31 +1,205 @@
 """A Flask extension to add support for OpenHeart protocol."""
 
+import asyncio
+import codecs
+import contextlib
+import json
+import math
+import secrets
 from functools import wraps
+from http import HTTPStatus
 
-from flask import current_app, jsonify, request
+from flask import abort, current_app, jsonify, request
 
+from flask_openheart.cli import cli
 from flask_openheart.config import OpenHeartConfig
 from flask_openheart.controller import OpenHeartController, OpenHeartRequestController
+from flask_openheart.internal import DuplicateReactionError, InvalidReactionError, max_reaction_size
+from flask_openheart.internal.events import get_event_hub
+
+CLIENT_COOKIE_MAX_AGE = 10 * 365 * 24 * 60 * 60
+"""The lifetime of a deduplication cookie, in seconds."""
 
 
 def before_request():
     """If the request is for an OpenHeart-enabled endpoint, inject OpenHeart data about the request."""
-    enabled = current_app.openheart.is_enabled_for(request.endpoint, **request.view_args)
-    if enabled:
-        request.openheart = OpenHeartRequestController(request.endpoint, **request.view_args)
+    if request.endpoint not in current_app.openheart.enabled_endpoints:
+        request.openheart = None
+        return
+    slug = current_app.openheart.slug_for(request.endpoint, **request.view_args)
+    if slug is not None:
+        request.openheart = OpenHeartRequestController(request.endpoint, _slug=slug, **request.view_args)
     else:
         request.openheart = None
 
 
+def _cacheable(response, version, config):
+    response.set_etag(str(version))
+    if config.cache_max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.max_age = config.cache_max_age
+    return response
+
+
+def _read_reaction(config):
+    """Read just enough of the request body to find the emoji at the start of it.
+
+    Bodies larger than the configured maximum are rejected without being read. Otherwise, only as many bytes as the
+    longest known emoji are read and decoded; the rest of the body is never buffered.
+    """
+    if request.content_length is not None and request.content_length > config.max_reaction_payload:
+        abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    data = request.stream.read(min(max_reaction_size(), config.max_reaction_payload))
+    try:
+        # an incremental decoder tolerates a multi-byte character cut off by the end of the prefix
+        return codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+    except UnicodeDecodeError:
+        abort(HTTPStatus.BAD_REQUEST, description="The reaction is not valid UTF-8.")
+
+
+def _client_for(config):
+    """Identify the client making a reaction, for deduplication.
+
+    :return: A tuple of: the client identifier (or None), and whether it is new and must be set as a cookie.
+    """
+    if not config.dedup:
+        return None, False
+    if config.dedup_cookie is None:
+        return request.remote_addr, False
+    client = request.cookies.get(config.dedup_cookie)
+    if client is None:
+        return secrets.token_urlsafe(16), True
+    return client, False
+
+
+def _begin_reaction(endpoint, config, args):
+    """Check the rate limit, then read the reaction and identify the client making it.
+
+    :return: A tuple of: the slug, the reaction data, the client identifier, and whether the client is new.
+    """
+    slug = current_app.openheart.slug_for(endpoint, **args)
+    retry_after = current_app.openheart.throttle(request.remote_addr, endpoint, _slug=slug, **args)
+    if retry_after:
+        abort(HTTPStatus.TOO_MANY_REQUESTS, retry_after=math.ceil(retry_after))
+    data = _read_reaction(config)
+    client, new_client = _client_for(config)
+    return slug, data, client, new_client
+
+
+@contextlib.contextmanager
+def _reaction_errors():
+    """Turn the errors raised for rejected reactions into HTTP errors."""
+    try:
+        yield
+    except InvalidReactionError as e:
+        abort(HTTPStatus.BAD_REQUEST, description=str(e))
+    except DuplicateReactionError:
+        abort(HTTPStatus.CONFLICT, description="You have already made this reaction.")
+
+
+def _reaction_response(reactions, config, client, new_client):
+    response = jsonify(reactions)
+    if new_client:
+        response.set_cookie(config.dedup_cookie, client, max_age=CLIENT_COOKIE_MAX_AGE, httponly=True, samesite="Lax")
+    return response
+
+
+def _not_modified(version, config):
+    if request.if_none_match.contains(str(version)):
+        return _cacheable(current_app.response_class(status=HTTPStatus.NOT_MODIFIED), version, config)
+    return None
+
+
+def _reactions_within(endpoint, config, slug, args):
+    """Respond with the reactions made within the number of seconds given by the "window" query parameter."""
+    window = request.args.get("window", type=int)
+    if window is None or window <= 0:
+        abort(HTTPStatus.BAD_REQUEST, description="The window must be a positive number of seconds.")
+    if not config.history:
+        abort(HTTPStatus.BAD_REQUEST, description="History is not enabled for this endpoint.")
+    return jsonify(current_app.openheart.reactions_within(endpoint, window, _slug=slug, **args))
+
+
 def handler(**args):
     """The Flask endpoint handler for all OpenHeart requests."""
     endpoint = request.endpoint.removeprefix(f"openheart.{request.method.lower()}.")
+    config = current_app.openheart.config_for(endpoint)
     if request.method == "POST":
-        data = request.get_data(as_text=True)
-        reactions = current_app.openheart.react_to(data, endpoint, **args)
-    else:
-        reactions = current_app.openheart.reactions_for(endpoint, **args)
-    return jsonify(reactions)
+        slug, data, client, new_client = _begin_reaction(endpoint, config, args)
+        with _reaction_errors():
+            reactions = current_app.openheart.react_to(data, endpoint, _slug=slug, _client=client, **args)
+        return _reaction_response(reactions, config, client, new_client)
+    slug = current_app.openheart.slug_for(endpoint, **args)
+    if "window" in request.args:
+        return _reactions_within(endpoint, config, slug, args)
+    if request.if_none_match and slug is not None:
+        # the version can be checked without reading (or serializing) the reactions themselves
+        version = current_app.openheart.version_for(endpoint, _slug=slug, **args)
+        response = _not_modified(version, config)
+        if response is not None:
+            return response
+    reactions = current_app.openheart.reactions_for(endpoint, _slug=slug, **args)
+    return _cacheable(jsonify(reactions), sum(reactions.values()), config)
+
+
+async def async_handler(**args):
+    """The Flask endpoint handler for all OpenHeart requests, as an async view.
+
+    This behaves exactly like `handler`, but reads and adds reactions without blocking the event loop.
+    """
+    endpoint = request.endpoint.removeprefix(f"openheart.{request.method.lower()}.")
+    config = current_app.openheart.config_for(endpoint)
+    if request.method == "POST":
+        slug, data, client, new_client = _begin_reaction(endpoint, config, args)
+        with _reaction_errors():
+            reactions = await current_app.openheart.areact_to(data, endpoint, _slug=slug, _client=client, **args)
+        return _reaction_response(reactions, config, client, new_client)
+    slug = current_app.openheart.slug_for(endpoint, **args)
+    if "window" in request.args:
+        return await asyncio.to_thread(_reactions_within, endpoint, config, slug, args)
+    if request.if_none_match and slug is not None:
+        version = await current_app.openheart.aversion_for(endpoint, _slug=slug, **args)
+        response = _not_modified(version, config)
+        if response is not None:
+            return response
+    reactions = await current_app.openheart.areactions_for(endpoint, _slug=slug, **args)
+    return _cacheable(jsonify(reactions), sum(reactions.values()), config)
+
+
+def _event(reactions):
+    return f"id: {sum(reactions.values())}\ndata: {json.dumps(reactions)}\n\n"
+
+
+def stream_handler(**args):
+    """The Flask endpoint handler for OpenHeart Server-Sent Events streams.
+
+    The stream starts with the current reactions, then sends the updated reactions every time they change. A comment is
+    sent periodically while there are no changes, to keep the connection open. Each open stream occupies a worker for as
+    long as the client stays connected.
+    """
+    endpoint = request.endpoint.removeprefix("openheart.stream.")
+    slug = current_app.openheart.slug_for(endpoint, **args)
+    if slug is None:
+        abort(HTTPStatus.NOT_FOUND)
+    config = current_app.openheart.config_for(endpoint)
+    # subscribe before reading the current reactions, so that no change can be missed in between
+    subscription = get_event_hub(config.pubsub_uri, config.stream_queue_size).subscribe(slug)
+    try:
+        reactions = current_app.openheart.reactions_for(endpoint, _slug=slug, **args)
+    except Exception:
+        subscription.close()
+        raise
+
+    def generate():
+        yield _event(reactions)
+        while True:
+            update = subscription.get(timeout=config.stream_keepalive)
+            yield ": keepalive\n\n" if update is None else _event(update)
+
+    response = current_app.response_class(generate(), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    response.call_on_close(subscription.close)
+    return response
 
 
 def _get_options(options, config):
@@ -44,6 +218,9 @@ def _adapt_rule(config, method, rule, endpoint, **options):
     prefix = config.url_prefix
     if method.upper() == "POST":
         prefix = config.post_url_prefix
+    elif method.upper() == "STREAM":
+        options.update({"methods": ["GET"]})
+        prefix = config.stream_url_prefix
     return f"{prefix}{rule}", f"openheart.{method.lower()}.{endpoint}", options
 
 
@@ -67,11 +244,13 @@ class OpenHeart:
         :param options: (optional) Configuration overrides.
         """
         config = {
-            key.remove_prefix("OPENHEART_").lower(): value
+            key.removeprefix("OPENHEART_").lower(): value
             for key, value in app.config.items()
             if key.startswith("OPENHEART_")
         }
         config.update(options)
+        if config.get("dedup_key") is None:
+            config["dedup_key"] = app.config.get("SECRET_KEY")
 
         @wraps(app.route)
         def route(rule, **options):
@@ -90,11 +269,16 @@ class OpenHeart:
                 endpoint = options.get("endpoint", func.__name__)
                 func.slug = slug(endpoint)
                 if oh_enabled:
+                    oh_handler = async_handler if oh_config.async_handler else handler
                     oh_rule, oh_endpoint, oh_options = _adapt_rule(oh_config, "GET", rule, endpoint, **options)
-                    app.add_url_rule(oh_rule, oh_endpoint, handler, **oh_options)
+                    app.add_url_rule(oh_rule, oh_endpoint, oh_handler, **oh_options)
                     oh_rule, oh_endpoint, oh_options = _adapt_rule(oh_config, "POST", rule, endpoint, **options)
-                    app.add_url_rule(oh_rule, oh_endpoint, handler, **oh_options)
+                    app.add_url_rule(oh_rule, oh_endpoint, oh_handler, **oh_options)
+                    if oh_config.stream:
+                        oh_rule, oh_endpoint, oh_options = _adapt_rule(oh_config, "STREAM", rule, endpoint, **options)
+                        app.add_url_rule(oh_rule, oh_endpoint, stream_handler, **oh_options)
                     app.openheart.configs[endpoint] = oh_config
+                    app.openheart.enabled_endpoints = frozenset(app.openheart.configs)
                 return decorator(func)
 
             return wrapper
@@ -103,3 +287,4 @@ class OpenHeart:
         app.route = route
         app.openheart = OpenHeartController()
         app.before_request(before_request)
+        app.cli.add_command(cli)
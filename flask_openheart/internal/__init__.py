@@ -1,6 +1,33 @@
 """A Flask extension to add support for OpenHeart protocol."""
 
 from flask_openheart.internal.backend import Backend, BackendError, get_backend
-from flask_openheart.internal.storage import Storage
+from flask_openheart.internal.broadcast import Broadcaster, get_broadcaster
+from flask_openheart.internal.cache import ReactionCache
+from flask_openheart.internal.pool import BackendPool, get_pool
+from flask_openheart.internal.ratelimit import RateLimiter, get_rate_limiter
+from flask_openheart.internal.replicas import ReplicaSet, get_replica_set
+from flask_openheart.internal.storage import (
+    DuplicateReactionError,
+    InvalidReactionError,
+    Storage,
+    max_reaction_size,
+)
 
-__all__ = ["Backend", "BackendError", "Storage", "get_backend"]
+__all__ = [
+    "Backend",
+    "BackendError",
+    "BackendPool",
+    "Broadcaster",
+    "DuplicateReactionError",
+    "InvalidReactionError",
+    "RateLimiter",
+    "ReactionCache",
+    "ReplicaSet",
+    "Storage",
+    "get_backend",
+    "get_broadcaster",
+    "get_pool",
+    "get_rate_limiter",
+    "get_replica_set",
+    "max_reaction_size",
+]
@@ -1,25 +1,34 @@
 """A backend supports a storage mechanism such as a database. Multiple backends are available."""
 
 import abc
+import asyncio
 
+from flask_openheart.internal import history
 
-def get_backend(uri, *args, **kwargs):
+
+def get_backend(uri, *args, pragmas=(), **kwargs):
     """Get a backend context manager, automatically detecting the type from URI.
 
-    :param uri: The database uri.
+    :param uri: The database uri, or a list of database URIs to shard reactions across.
     :param args: Additional args passed to the backend connection function.
+    :param pragmas: (optional) SQLite pragmas to apply to every connection, as (name, value) pairs. Ignored by other
+        backends.
     :param kwargs: Additional keyword args passed to the backend connection function.
 
     :exception RuntimeError: Unrecognized URI prefix
 
     :return: An OpenHeartBackend object (not yet connected).
     """
+    if isinstance(uri, (list, tuple)):
+        from flask_openheart.internal.sharding import ShardedBackend  # noqa: PLC0415 it imports this module
+
+        return ShardedBackend(uri, *args, pragmas=pragmas, **kwargs)
     if uri.startswith(("file:", "memory:")):
-        from flask_openheart.internal.sqlite import SqliteBackend
+        from flask_openheart.internal.sqlite import SqliteBackend  # noqa: PLC0415 it imports this module
 
-        return SqliteBackend(uri, *args, **kwargs)
+        return SqliteBackend(uri, *args, pragmas=pragmas, **kwargs)
     if uri.startswith(("valkey:", "redis:")):
-        from flask_openheart.internal.keystore import ValkeyBackend
+        from flask_openheart.internal.keystore import ValkeyBackend  # noqa: PLC0415 valkey is optional
 
         return ValkeyBackend(uri, *args, **kwargs)
     msg = "Unrecognized URI prefix"
@@ -33,6 +42,9 @@ class BackendError(Exception):
 class Backend(abc.ABC):
     """A simple protocol for allowing emoji-based reactions to URIs."""
 
+    thread_bound = False
+    """Whether a connection may only be used by the thread which created it."""
+
     def __init__(self, *args, **kwargs):
         """Create a new OpenHeart controller instance.
 
@@ -54,6 +66,20 @@ class Backend(abc.ABC):
         """
         raise NotImplementedError
 
+    def ping(self):
+        """Check whether the connection is healthy and usable.
+
+        :return: True if healthy, False otherwise.
+        """
+        return self.is_connected()
+
+    def migrate(self):
+        """Bring the stored data up to date with the layout expected by this version of Flask-OpenHeart.
+
+        Backends which store data in a layout that has changed over time should override this.
+        """
+        return
+
     @abc.abstractmethod
     def iter(self, slug):
         """Iterate all reactions for a given page.
@@ -64,6 +90,33 @@ class Backend(abc.ABC):
         """
         raise NotImplementedError
 
+    def version(self, slug):
+        """Get the version of the reactions on a given page.
+
+        The version of a page is the total number of reactions it has received, i.e. the sum of all of its counts. It
+        changes whenever the reactions change, so it can be used to tell whether a client's copy is up to date.
+
+        Backends should override this if they are able to get the version without reading every reaction.
+
+        :param slug: A slug representing the page.
+
+        :return: The version, as an int.
+        """
+        return sum(count for _, count in self.iter(slug))
+
+    def iter_many(self, slugs):
+        """Iterate all reactions for many pages at once.
+
+        Backends should override this if they are able to query many pages in a single round trip.
+
+        :param slugs: A collection of slugs representing the pages.
+
+        :return: A generator yielding: slug, reaction, count.
+        """
+        for slug in slugs:
+            for reaction, count in self.iter(slug):
+                yield slug, reaction, count
+
     @abc.abstractmethod
     def incr(self, slug, reaction):
         """Add a reaction for a given page.
@@ -73,6 +126,189 @@ class Backend(abc.ABC):
         """
         raise NotImplementedError
 
+    def incr_many(self, increments):
+        """Add many reactions, for any number of pages, at once.
+
+        Backends should override this if they are able to apply all of the increments in a single transaction.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        """
+        for (slug, reaction), count in increments.items():
+            for _ in range(count):
+                self.incr(slug, reaction)
+
+    def incr_and_fetch(self, slug, reaction):
+        """Add a reaction for a given page, then get all reactions for that page.
+
+        Backends should override this if they are able to do both in a single round trip.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+
+        :return: The updated reactions, as a dict.
+        """
+        self.incr(slug, reaction)
+        return dict(self.iter(slug))
+
+    async def aiter(self, slug):
+        """Iterate all reactions for a given page, without blocking the event loop.
+
+        By default, `iter` runs in a worker thread. Backends with a native asyncio client should override this.
+
+        :param slug: A slug representing the page.
+
+        :return: An async generator yielding: reaction, count.
+        """
+        for row in await asyncio.to_thread(lambda: list(self.iter(slug))):
+            yield row
+
+    async def aversion(self, slug):
+        """Get the version of the reactions on a given page, without blocking the event loop.
+
+        By default, `version` runs in a worker thread. Backends with a native asyncio client should override this.
+
+        :param slug: A slug representing the page.
+
+        :return: The version, as an int.
+        """
+        return await asyncio.to_thread(self.version, slug)
+
+    async def aincr(self, slug, reaction):
+        """Add a reaction for a given page, without blocking the event loop.
+
+        By default, `incr` runs in a worker thread. Backends with a native asyncio client should override this.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+        """
+        await asyncio.to_thread(self.incr, slug, reaction)
+
+    async def aincr_and_fetch(self, slug, reaction):
+        """Add a reaction for a given page, then get all reactions for that page, without blocking the event loop.
+
+        By default, `incr_and_fetch` runs in a worker thread. Backends with a native asyncio client should override
+        this.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+
+        :return: The updated reactions, as a dict.
+        """
+        return await asyncio.to_thread(self.incr_and_fetch, slug, reaction)
+
+    def mark(self, slug, positions, size):
+        """Set bits in the deduplication filter for a given page.
+
+        Backends which support deduplication should override this, setting all of the bits atomically.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to set.
+        :param size: The size of the filter, in bits.
+
+        :return: The positions of the bits which were not already set, as a list. It is empty if all of them were set,
+            i.e. if the reaction is a duplicate.
+        """
+        raise NotImplementedError
+
+    def unmark(self, slug, positions, size):
+        """Clear bits in the deduplication filter for a given page, to undo a `mark` whose reaction was not counted.
+
+        Only the positions returned by `mark` should be cleared. Another client which set one of them in the meantime
+        may then be allowed to repeat its reaction once, which is better than losing a reaction.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to clear.
+        :param size: The size of the filter, in bits.
+        """
+        raise NotImplementedError
+
+    def slugs(self):
+        """Iterate the slugs of all pages which have reactions.
+
+        Backends which support rebalancing between shards should override this.
+
+        :return: A generator yielding slugs.
+        """
+        raise NotImplementedError
+
+    def pop(self, slug):
+        """Remove all reactions for a given page, and return them.
+
+        Backends which support rebalancing between shards should override this, reading and removing the reactions
+        atomically.
+
+        :param slug: A slug representing the page.
+
+        :return: The removed reactions, as a dict.
+        """
+        raise NotImplementedError
+
+    def record(self, increments, timestamp):
+        """Record reactions in the history, in the minute bucket for a given point in time.
+
+        Backends which support history should override this, recording all of the increments atomically.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        :param timestamp: The time at which the reactions were made, in seconds since the epoch.
+        """
+        raise NotImplementedError
+
+    def history(self, slug, resolution, start, end):
+        """Iterate the history buckets of a given resolution for a given page, within a time range.
+
+        Backends which support history should override this, using an index on the start of the buckets.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds.
+        :param start: The earliest bucket start to include, in seconds since the epoch.
+        :param end: The bucket start at which to stop (exclusive), in seconds since the epoch.
+
+        :return: A generator yielding: bucket start, reaction, count.
+        """
+        raise NotImplementedError
+
+    def rolled_up(self, slug, resolution):
+        """Get the time up to which history buckets of a given resolution are complete, for a given page.
+
+        Backends which support history should override this.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds. Must not be the resolution reactions are recorded at.
+
+        :return: The time, in seconds since the epoch, as an int. Zero if the buckets have never been rolled up.
+        """
+        raise NotImplementedError
+
+    def compact(self, now, retention):
+        """Roll up complete history buckets into coarser buckets, then remove buckets older than their retention period.
+
+        Backends which support history should override this. Buckets must only be removed once they have been rolled
+        up into the next coarser resolution (if any).
+
+        :param now: The current time, in seconds since the epoch.
+        :param retention: The number of seconds for which to keep buckets of each resolution (or None, to keep them
+            forever), as a tuple of (resolution, seconds) pairs, finest first.
+        """
+        raise NotImplementedError
+
+    def reactions_between(self, slug, start, end, retention):
+        """Count the reactions made to a given page within a time window, from its history.
+
+        :param slug: A slug representing the page.
+        :param start: The start of the window, in seconds since the epoch. It is rounded down to the start of a bucket
+            (see `history.plan`).
+        :param end: The end of the window, in seconds since the epoch.
+        :param retention: The number of seconds for which buckets of each resolution are kept, as a tuple of
+            (resolution, seconds) pairs, finest first.
+
+        :return: The reactions, as a dict.
+        """
+        reactions = {}
+        for resolution, first, last in history.plan(start, end, retention, lambda r: self.rolled_up(slug, r)):
+            for _, reaction, count in self.history(slug, resolution, first, last):
+                reactions[reaction] = reactions.get(reaction, 0) + count
+        return reactions
+
     @abc.abstractmethod
     def connect(self, *args, **kwargs):
         """Initiate the connection.
@@ -0,0 +1,95 @@
+"""A broadcaster notifies subscribers whenever reactions change, optionally across processes."""
+
+import os
+import threading
+import uuid
+
+ORIGIN = uuid.uuid4().hex
+"""A unique identifier for this process, included in every message it publishes."""
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster(uri=None):
+    """Get the process-wide broadcaster for a given pub/sub URI, creating it if necessary.
+
+    :param uri: (optional) The URI of a Valkey or Redis server used to exchange messages with other processes. If not
+        supplied, messages are only delivered within this process.
+
+    :exception RuntimeError: Unrecognized URI prefix
+
+    :return: A Broadcaster object.
+    """
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(uri)
+        if broadcaster is None:
+            if uri is None:
+                broadcaster = Broadcaster()
+            elif uri.startswith(("valkey:", "redis:")):
+                from flask_openheart.internal.keystore import ValkeyBroadcaster  # noqa: PLC0415 valkey is optional
+
+                broadcaster = ValkeyBroadcaster(uri)
+            else:
+                msg = "Unrecognized URI prefix"
+                raise RuntimeError(msg)
+            _broadcasters[uri] = broadcaster
+    return broadcaster
+
+
+def reset_broadcasters():
+    """Forget all broadcasters and their subscribers, and give this process a new origin identifier.
+
+    This is called automatically in a child process after a fork, since listener threads do not survive a fork.
+    """
+    global ORIGIN, _broadcasters_lock  # noqa: PLW0603 the lock may have been held by another thread during the fork
+    ORIGIN = uuid.uuid4().hex
+    _broadcasters_lock = threading.Lock()
+    _broadcasters.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_broadcasters)
+
+
+class Broadcaster:
+    """Delivers messages about changed reactions to subscribers within this process."""
+
+    def __init__(self):
+        """Create a new Broadcaster instance."""
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Register a callback to be called with every message.
+
+        Callbacks may be called from a background thread, and must not block.
+
+        :param callback: A function which accepts a message, as a dict with "origin", "slug" and "reactions" keys.
+        """
+        with self._lock:
+            self._subscribers = [*self._subscribers, callback]
+
+    def unsubscribe(self, callback):
+        """Stop calling a previously subscribed callback.
+
+        :param callback: The callback passed to `subscribe`.
+        """
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber is not callback]
+
+    def publish(self, slug, reactions):
+        """Notify all subscribers that the reactions for a page have changed.
+
+        :param slug: A slug representing the page.
+        :param reactions: The updated reactions, as a dict.
+        """
+        self.deliver({"origin": ORIGIN, "slug": slug, "reactions": reactions})
+
+    def deliver(self, message):
+        """Call every subscribed callback with a message.
+
+        :param message: The message, as a dict.
+        """
+        for subscriber in self._subscribers:
+            subscriber(message)
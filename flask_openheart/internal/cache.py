@@ -0,0 +1,72 @@
+"""The reaction cache keeps recently read reactions in memory, so that repeated reads skip the backend."""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask_openheart.internal import broadcast
+from flask_openheart.internal.counts import Counts
+
+
+class ReactionCache:
+    """An in-process, least-recently-used cache of reactions, keyed by slug, whose entries expire after a fixed time.
+
+    Entries are held as compact Counts, and only converted to dicts when they are read.
+    """
+
+    def __init__(self, max_size, ttl):
+        """Create a new ReactionCache instance.
+
+        :param max_size: The maximum number of slugs to cache. The least recently used slug is evicted first.
+        :param ttl: The number of seconds after which a cached entry expires.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, slug):
+        """Get the cached reactions for a page.
+
+        :param slug: A slug representing the page.
+
+        :return: The reactions, as a dict, or None if the page is not cached or its entry has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(slug)
+            if entry is None:
+                return None
+            expires, reactions = entry
+            if expires <= time.monotonic():
+                del self._entries[slug]
+                return None
+            self._entries.move_to_end(slug)
+            return reactions.as_dict()
+
+    def set(self, slug, reactions):
+        """Cache the reactions for a page.
+
+        :param slug: A slug representing the page.
+        :param reactions: The reactions, as a dict.
+        """
+        with self._lock:
+            self._entries[slug] = (time.monotonic() + self.ttl, Counts(reactions))
+            self._entries.move_to_end(slug)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, slug):
+        """Remove the cached reactions for a page, if any.
+
+        :param slug: A slug representing the page.
+        """
+        with self._lock:
+            self._entries.pop(slug, None)
+
+    def on_message(self, message):
+        """Handle a message from a Broadcaster, invalidating the entry for any page changed by another process.
+
+        :param message: The message, as a dict.
+        """
+        if message["origin"] != broadcast.ORIGIN:
+            self.invalidate(message["slug"])
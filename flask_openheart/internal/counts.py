@@ -0,0 +1,96 @@
+"""Compact reaction counts, for holding the reactions of many pages in memory at once.
+
+A dict of reactions costs a hash table, plus a string and an int object for every reaction, for every page. Instead,
+each distinct reaction is given a small integer id, once per process, and the counts for a page are stored in a flat
+array of unsigned 64-bit ints, indexed by id. Ids are given out in the order in which reactions are first seen, so the
+most common reactions (which are seen first) have the lowest ids, and the arrays stay short.
+"""
+
+import threading
+from array import array
+
+_ids = {}
+_reactions = []
+_lock = threading.Lock()
+
+
+def intern(reaction):
+    """Get the id of a reaction, giving it a new one if it has none yet.
+
+    :param reaction: The reaction.
+
+    :return: The id, as an int.
+    """
+    reaction_id = _ids.get(reaction)
+    if reaction_id is None:
+        with _lock:
+            reaction_id = _ids.get(reaction)
+            if reaction_id is None:
+                reaction_id = len(_reactions)
+                _reactions.append(reaction)
+                _ids[reaction] = reaction_id
+    return reaction_id
+
+
+class Counts:
+    """The reaction counts for a single page.
+
+    This is not thread-safe; callers which share an instance between threads must hold their own lock.
+    """
+
+    __slots__ = ("_counts",)
+
+    def __init__(self, reactions=None):
+        """Create a new Counts instance.
+
+        :param reactions: (optional) The initial counts, as a dict or another Counts instance.
+        """
+        self._counts = array("Q")
+        if reactions is not None:
+            self.update(reactions)
+
+    def add(self, reaction, amount=1):
+        """Add to the count for a reaction.
+
+        :param reaction: The reaction.
+        :param amount: (optional) The amount to add. Defaults to one.
+        """
+        reaction_id = intern(reaction)
+        if reaction_id >= len(self._counts):
+            self._counts.frombytes(bytes((reaction_id + 1 - len(self._counts)) * self._counts.itemsize))
+        self._counts[reaction_id] += amount
+
+    def update(self, reactions):
+        """Add all of the counts from a dict or another Counts instance.
+
+        :param reactions: The counts to add.
+        """
+        for reaction, count in reactions.items():
+            self.add(reaction, count)
+
+    def items(self):
+        """Iterate the reactions with a non-zero count.
+
+        :return: A generator yielding: reaction, count.
+        """
+        for reaction_id, count in enumerate(self._counts):
+            if count:
+                yield _reactions[reaction_id], count
+
+    def total(self):
+        """Get the sum of all counts.
+
+        :return: The sum, as an int.
+        """
+        return sum(self._counts)
+
+    def as_dict(self):
+        """Convert the counts to a dict, e.g. for serialization.
+
+        :return: A dict in which the reactions are the keys and the counts are the values.
+        """
+        return dict(self.items())
+
+    def __bool__(self):
+        """Check whether any reaction has a non-zero count."""
+        return any(self._counts)
@@ -0,0 +1,73 @@
+"""Deduplication records which clients have reacted to each page, without storing the clients themselves.
+
+Each page has a Bloom filter: a fixed-size array of bits. A client's reaction to a page sets a few bits, chosen by
+hashing the client's identifier together with the reaction. If all of those bits were already set, the client has
+(almost certainly) made that reaction before. False positives become more likely as more clients react to a page, but
+the filter never grows, and the client identifiers are not stored in it.
+
+The hash is keyed with a secret. Without the key, nobody can tell whether a given client has reacted to a page, even
+when clients are identified by something easy to enumerate, such as an IPv4 address. Without a key, anyone who can read
+a filter can test it for every possible address.
+"""
+
+import functools
+import hashlib
+
+HASHES = 4
+"""The number of bits set for each reaction."""
+
+
+@functools.cache
+def _hash_key(key):
+    if key is None:
+        return b""
+    if isinstance(key, str):
+        key = key.encode()
+    return hashlib.blake2b(key, digest_size=32, person=b"openheart-key").digest()
+
+
+def positions(client, reaction, size, key=None):
+    """Get the positions of the bits which represent a client's reaction in a filter.
+
+    :param client: A string identifying the client, e.g. its address or a cookie value.
+    :param reaction: The reaction.
+    :param size: The size of the filter, in bits.
+    :param key: (optional) A secret, as a string or bytes, used to key the hash. Changing it changes every position.
+
+    :return: A list of bit positions.
+    """
+    digest = hashlib.blake2b(
+        f"{client}\0{reaction}".encode(), digest_size=16, key=_hash_key(key), person=b"openheart"
+    ).digest()
+    first = int.from_bytes(digest[:8], "little")
+    second = int.from_bytes(digest[8:], "little") | 1
+    return [(first + i * second) % size for i in range(HASHES)]
+
+
+def mark(bits, positions):
+    """Set bits in a filter.
+
+    :param bits: The filter, as a bytearray. It is modified in place.
+    :param positions: The positions of the bits to set.
+
+    :return: The positions of the bits which were not already set, as a list. It is empty if all of them were set.
+    """
+    added = []
+    for position in positions:
+        index, mask = divmod(position, 8)
+        mask = 1 << mask
+        if not bits[index] & mask:
+            bits[index] |= mask
+            added.append(position)
+    return added
+
+
+def unmark(bits, positions):
+    """Clear bits in a filter.
+
+    :param bits: The filter, as a bytearray. It is modified in place.
+    :param positions: The positions of the bits to clear.
+    """
+    for position in positions:
+        index, mask = divmod(position, 8)
+        bits[index] &= ~(1 << mask)
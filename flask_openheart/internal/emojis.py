@@ -0,0 +1,74 @@
+"""The set of known emojis, loaded from a compact data file rather than from the full emoji database.
+
+The `emoji` package holds names, aliases and translations for every emoji, but only the emojis themselves are needed to
+validate reactions. They are kept in "emojis.txt", next to this module: a header line recording the version of `emoji`
+it was generated from and a digest of that version's emoji data, followed by one emoji per line. To regenerate it after
+upgrading `emoji`, run::
+
+    python -m flask_openheart.internal.emojis
+
+The data file is used whenever the installed `emoji` package has the same emoji data, whatever its version. Otherwise,
+the full emoji database is used instead.
+"""
+
+import hashlib
+import importlib.metadata
+import importlib.util
+from pathlib import Path
+
+DATA_FILE = Path(__file__).with_name("emojis.txt")
+HEADER_PREFIX = "# emoji "
+DIGEST_PREFIX = "sha256="
+SOURCE = ("unicode_codes", "emoji.json")
+"""The path of the emoji data within the `emoji` package, from which the full emoji database is built."""
+
+
+def _installed_version():
+    try:
+        return importlib.metadata.version("emoji")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def _installed_digest():
+    # find_spec locates the package without importing it, which would load the full emoji database
+    spec = importlib.util.find_spec("emoji")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    try:
+        data = Path(next(iter(spec.submodule_search_locations)), *SOURCE).read_bytes()
+    except OSError:
+        return None
+    return f"{DIGEST_PREFIX}{hashlib.sha256(data).hexdigest()}"
+
+
+def load():
+    """Load the set of known emojis.
+
+    :return: The emojis, as a frozenset of strings.
+    """
+    try:
+        header, *emojis = DATA_FILE.read_text(encoding="utf-8").split("\n")
+    except OSError:
+        header, emojis = "", []
+    digest = _installed_digest()
+    if digest is not None and header.startswith(HEADER_PREFIX) and header.rpartition(" ")[2] == digest:
+        return frozenset(emoji for emoji in emojis if emoji)
+    from emoji import EMOJI_DATA  # noqa: PLC0415 the full emoji database is slow to load, so only load it if needed
+
+    return frozenset(EMOJI_DATA)
+
+
+def generate(path=DATA_FILE):
+    """Write the data file from the installed emoji database.
+
+    :param path: (optional) The path of the file to write. Defaults to the data file used by `load`.
+    """
+    from emoji import EMOJI_DATA  # noqa: PLC0415 the full emoji database is slow to load, so only load it if needed
+
+    lines = [f"{HEADER_PREFIX}{_installed_version()} {_installed_digest()}", *sorted(EMOJI_DATA), ""]
+    Path(path).write_text("\n".join(lines), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    generate()
@@ -0,0 +1,146 @@
+"""The event hub fans out changed reactions to subscribers of individual pages, such as Server-Sent Events streams."""
+
+import contextlib
+import os
+import queue
+import threading
+from collections import defaultdict
+
+from flask_openheart.internal.broadcast import get_broadcaster
+
+_hubs = {}
+_hubs_lock = threading.Lock()
+
+
+def get_event_hub(pubsub_uri, queue_size):
+    """Get the process-wide event hub for a given pub/sub URI, creating it if necessary.
+
+    :param pubsub_uri: The URI passed to `get_broadcaster`, or None to only receive changes made by this process.
+    :param queue_size: The maximum number of undelivered updates to hold for each subscriber.
+
+    :return: An EventHub object.
+    """
+    key = (pubsub_uri, queue_size)
+    with _hubs_lock:
+        hub = _hubs.get(key)
+        if hub is None:
+            hub = EventHub(queue_size)
+            get_broadcaster(pubsub_uri).subscribe(hub.on_message)
+            _hubs[key] = hub
+    return hub
+
+
+def reset_event_hubs():
+    """Forget all event hubs and their subscribers. This is called automatically in a child process after a fork."""
+    global _hubs_lock  # noqa: PLW0603 the lock may have been held by another thread at the time of the fork
+    _hubs_lock = threading.Lock()
+    _hubs.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_event_hubs)
+
+
+class EventHub:
+    """Delivers messages from a Broadcaster to the subscribers of the page each message is about.
+
+    Each subscriber has its own bounded queue. Since every update carries the complete set of reactions, a subscriber
+    only ever needs the most recent update; when a slow subscriber's queue is full, its oldest update is dropped.
+    """
+
+    def __init__(self, queue_size):
+        """Create a new EventHub instance.
+
+        :param queue_size: The maximum number of undelivered updates to hold for each subscriber.
+        """
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, slug):
+        """Start receiving updates for a page.
+
+        :param slug: A slug representing the page.
+
+        :return: A Subscription object, which must be closed when no longer needed.
+        """
+        subscription = Subscription(self, slug, queue.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers[slug].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop delivering updates to a subscription.
+
+        :param subscription: A Subscription returned by `subscribe`.
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.slug)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.slug]
+
+    def on_message(self, message):
+        """Handle a message from a Broadcaster, delivering its reactions to every subscriber of its page.
+
+        :param message: The message, as a dict.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(message["slug"], ()))
+        for subscription in subscribers:
+            subscription.offer(message["reactions"])
+
+
+class Subscription:
+    """A subscriber's queue of updates for a single page."""
+
+    def __init__(self, hub, slug, updates):
+        """Create a new Subscription instance. Use `EventHub.subscribe` instead of calling this directly.
+
+        :param hub: The EventHub which delivers updates to this subscription.
+        :param slug: A slug representing the page.
+        :param updates: The bounded queue in which updates are held until they are read.
+        """
+        self.hub = hub
+        self.slug = slug
+        self.updates = updates
+
+    def offer(self, reactions):
+        """Add an update to the queue without blocking, dropping the oldest update if the queue is full.
+
+        :param reactions: The updated reactions, as a dict.
+        """
+        while True:
+            try:
+                self.updates.put_nowait(reactions)
+            except queue.Full:
+                with contextlib.suppress(queue.Empty):
+                    self.updates.get_nowait()
+            else:
+                return
+
+    def get(self, timeout):
+        """Wait for the next update.
+
+        :param timeout: The maximum number of seconds to wait.
+
+        :return: The updated reactions, as a dict, or None if no update arrived in time.
+        """
+        try:
+            return self.updates.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Stop receiving updates."""
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        """Enter a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        """Exit a context manager. This closes the subscription."""
+        self.close()
@@ -0,0 +1,104 @@
+"""Reaction history is kept as counts per time bucket, at several resolutions.
+
+Every reaction is recorded in the bucket for the minute in which it was made. A compaction job (`Backend.compact`, or
+the `flask openheart compact` command) rolls minute buckets up into hour buckets, and hour buckets up into day buckets,
+once they are complete, and removes buckets older than the retention period for their resolution. Each resolution
+records the time up to which it has been rolled up, so a bucket is never rolled up twice, and buckets are only removed
+once they have been rolled up.
+
+To count the reactions in a time window, the coarsest buckets needed are read up to the time they have been rolled up
+to, and the rest of the window is read from finer buckets. This bounds the number of buckets read by the retention
+period of each resolution, however long the window.
+"""
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+RESOLUTIONS = (MINUTE, HOUR, DAY)
+"""The sizes of the buckets, in seconds, finest first. Reactions are recorded in buckets of the first size."""
+
+ROLLUP_DELAY = MINUTE
+"""The number of seconds a bucket must have been complete for before it is rolled up, so that late writes (such as those
+held in a write buffer) are still included."""
+
+
+def bucket(timestamp, resolution):
+    """Get the start of the bucket which contains a point in time.
+
+    :param timestamp: The point in time, in seconds since the epoch.
+    :param resolution: The size of the bucket, in seconds.
+
+    :return: The start of the bucket, in seconds since the epoch, as an int.
+    """
+    timestamp = int(timestamp)
+    return timestamp - timestamp % resolution
+
+
+def rollup_through(now, resolution, finer_through=None):
+    """Get the time up to which buckets of a given resolution can be rolled up from the next finer resolution.
+
+    :param now: The current time, in seconds since the epoch.
+    :param resolution: The size of the buckets to roll up into, in seconds.
+    :param finer_through: (optional) The time up to which the finer buckets have been rolled up themselves, if they
+        are not the buckets in which reactions are recorded.
+
+    :return: The time, in seconds since the epoch, as an int. Only finer buckets which start before it are rolled up.
+    """
+    through = bucket(now - ROLLUP_DELAY, resolution)
+    if finer_through is not None:
+        through = min(through, bucket(finer_through, resolution))
+    return through
+
+
+def remove_before(now, resolution, keep, coarser_through=None):
+    """Get the time before which buckets of a given resolution are removed.
+
+    Buckets which overlap the retention period are kept, and so are buckets which have not been rolled up yet.
+
+    :param now: The current time, in seconds since the epoch.
+    :param resolution: The size of the buckets, in seconds.
+    :param keep: The retention period for the buckets, in seconds.
+    :param coarser_through: (optional) The time up to which the buckets have been rolled up into the next coarser
+        resolution, if there is one.
+
+    :return: The time, in seconds since the epoch, as an int. Only buckets which start before it are removed.
+    """
+    cutoff = bucket(now - keep, resolution)
+    if coarser_through is not None:
+        cutoff = min(cutoff, coarser_through)
+    return cutoff
+
+
+def plan(start, end, retention, rolled_up):
+    """Plan which buckets to read to count the reactions in a time window.
+
+    The window starts with the finest resolution whose retention period covers its start, or else with the coarsest
+    resolution (and is cut short to that resolution's retention period). Its start is rounded down to the start of a
+    bucket of that resolution.
+
+    :param start: The start of the window, in seconds since the epoch.
+    :param end: The end of the window, in seconds since the epoch. Retention periods are counted back from here.
+    :param retention: The number of seconds for which to keep buckets of each resolution (or None, to keep them
+        forever), as a tuple of (resolution, seconds) pairs, finest first.
+    :param rolled_up: A function which takes a resolution, and returns the time up to which its buckets are complete.
+
+    :return: A list of (resolution, start, end) tuples. The buckets of each resolution which start within the range are
+        to be read.
+    """
+    chosen = len(retention) - 1
+    for index, (_, keep) in enumerate(retention):
+        if keep is None or start >= end - keep:
+            chosen = index
+            break
+    else:
+        start = max(start, end - retention[chosen][1])
+    current = bucket(start, retention[chosen][0])
+    ranges = []
+    for index in range(chosen, -1, -1):
+        resolution = retention[index][0]
+        through = end if index == 0 else min(rolled_up(resolution), bucket(end, resolution))
+        if through > current:
+            ranges.append((resolution, current, through))
+            current = through
+    return ranges
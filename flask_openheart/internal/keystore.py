@@ -1,8 +1,61 @@
-"""The valkey backend can be used to connect to Valkey or Redis servers."""
+"""The valkey backend can be used to connect to Valkey or Redis servers.
+
+Reactions for each page are stored in a single hash, named "openheart:{slug}", which maps each reaction to its count.
+The version of each page (the sum of its counts) is stored alongside it, in a key named "openheart-version:{slug}".
+The deduplication filter of each page, if used, is a bitmap in a key named "openheart-seen:{slug}".
+
+If history is recorded, each bucket of each page is a hash named "openheart-history:{resolution}:{bucket}:{slug}",
+mapping reactions to counts. The buckets of each resolution for a page are indexed by a sorted set named
+"openheart-history-index:{resolution}:{slug}", scored by the start of the bucket. The time up to which each page has
+been rolled up is stored in a hash per resolution, named "openheart-rollup:{resolution}".
+"""
+
+import itertools
+import json
+import logging
+import math
+import threading
+import time
 
 import valkey
 
-from flask_openheart.internal import Backend, BackendError
+from flask_openheart.internal import Backend, BackendError, broadcast, history
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "openheart"
+VERSION_KEY_PREFIX = "openheart-version"
+SEEN_KEY_PREFIX = "openheart-seen"
+RATE_LIMIT_KEY_PREFIX = "openheart-ratelimit"
+HISTORY_KEY_PREFIX = "openheart-history"
+HISTORY_INDEX_KEY_PREFIX = "openheart-history-index"
+ROLLUP_KEY_PREFIX = "openheart-rollup"
+CHANNEL = f"{KEY_PREFIX}:events"
+RECONNECT_DELAY = 1
+
+
+def _key(slug):
+    return f"{KEY_PREFIX}:{slug}"
+
+
+def _version_key(slug):
+    return f"{VERSION_KEY_PREFIX}:{slug}"
+
+
+def _seen_key(slug):
+    return f"{SEEN_KEY_PREFIX}:{slug}"
+
+
+def _history_key(resolution, bucket, slug):
+    return f"{HISTORY_KEY_PREFIX}:{resolution}:{bucket}:{slug}"
+
+
+def _history_index_key(resolution, slug):
+    return f"{HISTORY_INDEX_KEY_PREFIX}:{resolution}:{slug}"
+
+
+def _rollup_key(resolution):
+    return f"{ROLLUP_KEY_PREFIX}:{resolution}"
 
 
 class ValkeyBackend(Backend):
@@ -27,6 +80,7 @@ class ValkeyBackend(Backend):
         if self.connection is not None:
             self.disconnect()
 
+        kwargs.setdefault("decode_responses", True)
         try:
             self.connection = valkey.from_url(uri, *args, **kwargs)
         except valkey.exceptions.ConnectionError as e:
@@ -46,6 +100,18 @@ class ValkeyBackend(Backend):
         """
         return self.connection is not None
 
+    def ping(self):
+        """Check whether the connection is healthy and usable.
+
+        :return: True if healthy, False otherwise.
+        """
+        if not self.is_connected():
+            return False
+        try:
+            return bool(self.connection.ping())
+        except valkey.exceptions.ValkeyError:
+            return False
+
     def incr(self, slug, reaction):
         """Increment the reaction count for a certain reaction on a certain page.
 
@@ -54,11 +120,93 @@ class ValkeyBackend(Backend):
         """
         self._check_if_connected()
         try:
-            self.connection.incr(f"openheart:{slug}:{reaction}")
+            with self.connection.pipeline(transaction=True) as pipe:
+                pipe.hincrby(_key(slug), reaction, 1)
+                pipe.incr(_version_key(slug))
+                pipe.execute()
         except valkey.exceptions.ValkeyError as e:
             msg = f"A database error occurred while processing a reaction for '{slug}'."
             raise BackendError(msg) from e
 
+    def incr_many(self, increments):
+        """Increment the counts for many reactions, on any number of pages, in a single transaction.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        """
+        self._check_if_connected()
+        try:
+            with self.connection.pipeline(transaction=True) as pipe:
+                for (slug, reaction), count in increments.items():
+                    pipe.hincrby(_key(slug), reaction, count)
+                    pipe.incr(_version_key(slug), count)
+                pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = "A database error occurred while processing a batch of reactions."
+            raise BackendError(msg) from e
+
+    def incr_and_fetch(self, slug, reaction):
+        """Increment the reaction count for a certain reaction on a certain page, then get all reactions for that page.
+
+        All commands are sent as a single MULTI/EXEC transaction, costing a single round trip.
+
+        :param slug: A slug representing the page.
+        :param reaction: The emoji reaction to be incremented.
+
+        :return: The updated reactions, as a dict.
+        """
+        self._check_if_connected()
+        try:
+            with self.connection.pipeline(transaction=True) as pipe:
+                pipe.hincrby(_key(slug), reaction, 1)
+                pipe.incr(_version_key(slug))
+                pipe.hgetall(_key(slug))
+                _, _, reactions = pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = f"A database error occurred while processing a reaction for '{slug}'."
+            raise BackendError(msg) from e
+        return {reaction: int(count) for reaction, count in reactions.items()}
+
+    def mark(self, slug, positions, size):  # noqa: ARG002 a bitmap grows as needed, so the size is not used
+        """Set bits in the deduplication filter for a certain page.
+
+        All bits are set with SETBIT, in a single MULTI/EXEC transaction.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to set.
+        :param size: The size of the filter, in bits.
+
+        :return: The positions of the bits which were not already set, as a list.
+        """
+        self._check_if_connected()
+        try:
+            with self.connection.pipeline(transaction=True) as pipe:
+                for position in positions:
+                    pipe.setbit(_seen_key(slug), position, 1)
+                previous = pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = f"A database error occurred while checking for a duplicate reaction to '{slug}'."
+            raise BackendError(msg) from e
+        return [position for position, bit in zip(positions, previous, strict=True) if not bit]
+
+    def unmark(self, slug, positions, size):  # noqa: ARG002 a bitmap grows as needed, so the size is not used
+        """Clear bits in the deduplication filter for a certain page.
+
+        All bits are cleared with SETBIT, in a single MULTI/EXEC transaction.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to clear.
+        :param size: The size of the filter, in bits.
+        """
+        self._check_if_connected()
+        try:
+            with self.connection.pipeline(transaction=True) as pipe:
+                for position in positions:
+                    pipe.setbit(_seen_key(slug), position, 0)
+                pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = f"A database error occurred while undoing a reaction to '{slug}'."
+            raise BackendError(msg) from e
+
     def iter(self, slug):
         """Iterate through all the reactions on a certain page.
 
@@ -68,16 +216,367 @@ class ValkeyBackend(Backend):
         """
         self._check_if_connected()
         try:
-            generator = self.connection.scan_iter(f"openheart:{slug}:*")
+            reactions = self.connection.hgetall(_key(slug))
         except valkey.exceptions.ValkeyError as e:
             msg = f"A database error occurred while querying reactions for '{slug}'."
             raise BackendError(msg) from e
+        for reaction, count in reactions.items():
+            yield reaction, int(count)
+
+    def version(self, slug):
+        """Get the version of the reactions on a certain page, without reading the reactions themselves.
+
+        :param slug: A slug representing the page.
+
+        :return: The version, as an int.
+        """
+        self._check_if_connected()
+        try:
+            version = self.connection.get(_version_key(slug))
+        except valkey.exceptions.ValkeyError as e:
+            msg = f"A database error occurred while querying the version for '{slug}'."
+            raise BackendError(msg) from e
+        return int(version) if version is not None else 0
+
+    def iter_many(self, slugs):
+        """Iterate through all the reactions on many pages at once.
+
+        The hashes for all pages are fetched in a single pipeline, costing a single round trip.
+
+        :param slugs: A collection of slugs representing the pages.
+
+        :return: A generator yielding: slug, reaction, count.
+        """
+        self._check_if_connected()
+        slugs = list(slugs)
+        try:
+            with self.connection.pipeline(transaction=False) as pipe:
+                for slug in slugs:
+                    pipe.hgetall(_key(slug))
+                results = pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = "A database error occurred while querying reactions for many pages."
+            raise BackendError(msg) from e
+        for slug, reactions in zip(slugs, results, strict=True):
+            for reaction, count in reactions.items():
+                yield slug, reaction, int(count)
+
+    def slugs(self):
+        """Iterate the slugs of all pages which have reactions.
+
+        This scans the entire keyspace.
+
+        :return: A generator yielding slugs.
+        """
+        self._check_if_connected()
+        try:
+            keys = list(self.connection.scan_iter(f"{KEY_PREFIX}:*", _type="HASH"))
+        except valkey.exceptions.ValkeyError as e:
+            msg = "A database error occurred while listing pages."
+            raise BackendError(msg) from e
+        for key in keys:
+            yield key.removeprefix(f"{KEY_PREFIX}:")
+
+    def pop(self, slug):
+        """Remove all reactions (and the deduplication filter) for a certain page, and return the reactions.
+
+        All commands are sent as a single MULTI/EXEC transaction.
+
+        :param slug: A slug representing the page.
 
-        for key in generator:
-            reaction = key.split(":")[-1]
+        :return: The removed reactions, as a dict.
+        """
+        self._check_if_connected()
+        try:
+            with self.connection.pipeline(transaction=True) as pipe:
+                pipe.hgetall(_key(slug))
+                pipe.delete(_key(slug), _version_key(slug), _seen_key(slug))
+                reactions, _ = pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = f"A database error occurred while removing reactions for '{slug}'."
+            raise BackendError(msg) from e
+        return {reaction: int(count) for reaction, count in reactions.items()}
+
+    def record(self, increments, timestamp):
+        """Record reactions in the minute bucket for a given point in time.
+
+        All commands are sent as a single MULTI/EXEC transaction.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        :param timestamp: The time at which the reactions were made, in seconds since the epoch.
+        """
+        self._check_if_connected()
+        minute = history.bucket(timestamp, history.MINUTE)
+        try:
+            with self.connection.pipeline(transaction=True) as pipe:
+                for (slug, reaction), count in increments.items():
+                    pipe.hincrby(_history_key(history.MINUTE, minute, slug), reaction, count)
+                    pipe.zadd(_history_index_key(history.MINUTE, slug), {minute: minute})
+                pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = "A database error occurred while recording the history of reactions."
+            raise BackendError(msg) from e
+
+    def history(self, slug, resolution, start, end):
+        """Iterate the history buckets of a given resolution for a certain page, within a time range.
+
+        The buckets are found in the index for the page, then fetched in a single pipeline, costing two round trips.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds.
+        :param start: The earliest bucket start to include, in seconds since the epoch.
+        :param end: The bucket start at which to stop (exclusive), in seconds since the epoch.
+
+        :return: A generator yielding: bucket start, reaction, count.
+        """
+        self._check_if_connected()
+        try:
+            buckets = [
+                int(b) for b in self.connection.zrangebyscore(_history_index_key(resolution, slug), start, f"({end}")
+            ]
+            with self.connection.pipeline(transaction=False) as pipe:
+                for bucket in buckets:
+                    pipe.hgetall(_history_key(resolution, bucket, slug))
+                results = pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            msg = f"A database error occurred while querying the history for '{slug}'."
+            raise BackendError(msg) from e
+        for bucket, reactions in zip(buckets, results, strict=True):
+            for reaction, count in reactions.items():
+                yield bucket, reaction, int(count)
+
+    def rolled_up(self, slug, resolution):
+        """Get the time up to which history buckets of a given resolution are complete, for a certain page.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds.
+
+        :return: The time, in seconds since the epoch, as an int.
+        """
+        self._check_if_connected()
+        try:
+            through = self.connection.hget(_rollup_key(resolution), slug)
+        except valkey.exceptions.ValkeyError as e:
+            msg = f"A database error occurred while querying the history for '{slug}'."
+            raise BackendError(msg) from e
+        return int(through) if through is not None else 0
+
+    def compact(self, now, retention):
+        """Roll up complete history buckets into coarser buckets, then remove buckets older than their retention period.
+
+        Each page is rolled up in its own transaction, which also records the time it has been rolled up to. The
+        transaction watches that record, and starts over if another compaction changes it first. So it is safe to run
+        this while the application is serving requests, to run it again after a failure, and to run two at once.
+
+        This scans the keyspace for the history indexes of every page, so it does not run automatically.
+
+        :param now: The current time, in seconds since the epoch.
+        :param retention: The number of seconds for which to keep buckets of each resolution (or None, to keep them
+            forever), as a tuple of (resolution, seconds) pairs, finest first.
+        """
+        self._check_if_connected()
+        try:
+            slugs = {
+                key.split(":", 2)[2]
+                for key in self.connection.scan_iter(f"{HISTORY_INDEX_KEY_PREFIX}:*", count=1000, _type="ZSET")
+            }
+        except valkey.exceptions.ValkeyError as e:
+            msg = "A database error occurred while listing the history of pages."
+            raise BackendError(msg) from e
+        for slug in slugs:
+            self._compact(slug, now, retention)
+
+    def _compact(self, slug, now, retention):
+        resolutions = [resolution for resolution, _ in retention]
+        finer_through = None
+        for fine, coarse in itertools.pairwise(resolutions):
+            try:
+                finer_through = self._roll_up(slug, fine, coarse, history.rollup_through(now, coarse, finer_through))
+            except valkey.exceptions.ValkeyError as e:
+                msg = f"A database error occurred while compacting the history for '{slug}'."
+                raise BackendError(msg) from e
+        for index, (resolution, keep) in enumerate(retention):
+            if keep is None:
+                continue
+            coarser_through = self.rolled_up(slug, resolutions[index + 1]) if index + 1 < len(retention) else None
+            cutoff = history.remove_before(now, resolution, keep, coarser_through)
+            index_key = _history_index_key(resolution, slug)
             try:
-                count = self.connection.get(f"openheart:{slug}:{reaction}")
+                buckets = self.connection.zrangebyscore(index_key, "-inf", f"({cutoff}")
+                if not buckets:
+                    continue
+                with self.connection.pipeline(transaction=True) as pipe:
+                    pipe.delete(*(_history_key(resolution, bucket, slug) for bucket in buckets))
+                    pipe.zremrangebyscore(index_key, "-inf", f"({cutoff}")
+                    pipe.execute()
             except valkey.exceptions.ValkeyError as e:
-                msg = f"A database error occurred while querying reactions for '{slug}'."
+                msg = f"A database error occurred while compacting the history for '{slug}'."
                 raise BackendError(msg) from e
-            yield reaction, count
+
+    def _roll_up(self, slug, fine, coarse, through):
+        rollup_key = _rollup_key(coarse)
+        with self.connection.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(rollup_key)
+                    start = pipe.hget(rollup_key, slug)
+                    start = int(start) if start is not None else 0
+                    if through <= start:
+                        return start
+                    totals = {}
+                    for bucket, reaction, count in self.history(slug, fine, start, through):
+                        key = (history.bucket(bucket, coarse), reaction)
+                        totals[key] = totals.get(key, 0) + count
+                    pipe.multi()
+                    for (bucket, reaction), count in totals.items():
+                        pipe.hincrby(_history_key(coarse, bucket, slug), reaction, count)
+                        pipe.zadd(_history_index_key(coarse, slug), {bucket: bucket})
+                    pipe.hset(rollup_key, slug, through)
+                    pipe.execute()
+                except valkey.exceptions.WatchError:
+                    continue  # another compaction rolled up this page while we were reading it; start over
+                return through
+
+    def migrate(self):
+        """Convert reactions stored in the legacy key layout into the current layout.
+
+        Older versions of Flask-OpenHeart stored each count in its own string key, named "openheart:{slug}:{reaction}".
+        Those keys are merged into the hash for their slug, then deleted. Each key is moved in its own transaction, so
+        it is safe to run this while the application is serving requests, and safe to run it more than once.
+
+        This scans the entire keyspace, so it does not run automatically; run it once after upgrading.
+
+        :return: The number of legacy keys which were converted.
+        """
+        self._check_if_connected()
+        converted = 0
+        try:
+            for key in self.connection.scan_iter(f"{KEY_PREFIX}:*:*", _type="STRING"):
+                converted += self._migrate_key(key)
+        except valkey.exceptions.ValkeyError as e:
+            msg = "A database error occurred while migrating legacy keys."
+            raise BackendError(msg) from e
+        return converted
+
+    def _migrate_key(self, key):
+        slug, reaction = key.removeprefix(f"{KEY_PREFIX}:").rsplit(":", maxsplit=1)
+        with self.connection.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    count = pipe.get(key)
+                    if count is None:
+                        return 0
+                    pipe.multi()
+                    pipe.hincrby(_key(slug), reaction, int(count))
+                    pipe.incr(_version_key(slug), int(count))
+                    pipe.delete(key)
+                    pipe.execute()
+                except valkey.exceptions.WatchError:
+                    continue  # the key was incremented while we were moving it; try again
+                return 1
+
+
+class ValkeyBroadcaster(broadcast.Broadcaster):
+    """Exchanges messages about changed reactions with other processes, using Valkey (or Redis) pub/sub.
+
+    Messages published by this process are delivered to local subscribers immediately. Messages published by other
+    processes are received by a background thread, which is started when the first callback subscribes.
+    """
+
+    def __init__(self, uri):
+        """Create a new ValkeyBroadcaster instance.
+
+        :param uri: The URI of the Valkey or Redis server.
+        """
+        super().__init__()
+        self.connection = valkey.from_url(uri, decode_responses=True)
+        self._thread = None
+
+    def subscribe(self, callback):
+        """Register a callback to be called with every message, from this process or any other.
+
+        :param callback: A function which accepts a message, as a dict with "origin", "slug" and "reactions" keys.
+        """
+        super().subscribe(callback)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name="openheart-broadcaster", daemon=True)
+                self._thread.start()
+
+    def publish(self, slug, reactions):
+        """Notify all subscribers, in this process and others, that the reactions for a page have changed.
+
+        A failure to reach the server is logged, and does not prevent delivery to subscribers in this process.
+
+        :param slug: A slug representing the page.
+        :param reactions: The updated reactions, as a dict.
+        """
+        message = {"origin": broadcast.ORIGIN, "slug": slug, "reactions": reactions}
+        self.deliver(message)
+        try:
+            self.connection.publish(CHANNEL, json.dumps(message))
+        except valkey.exceptions.ValkeyError:
+            logger.exception("Failed to publish reactions for '%s'.", slug)
+
+    def receive(self, data):
+        """Handle a raw message received from the server, delivering it unless it was published by this process.
+
+        :param data: The message, as a JSON string.
+        """
+        message = json.loads(data)
+        if message["origin"] != broadcast.ORIGIN:
+            self.deliver(message)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                for item in pubsub.listen():
+                    if item["type"] == "message":
+                        self.receive(item["data"])
+            except valkey.exceptions.ValkeyError:
+                logger.exception("Lost connection to the pub/sub server; reconnecting.")
+                time.sleep(RECONNECT_DELAY)
+
+
+class ValkeyRateLimiter:
+    """A rate limiter shared by every process connected to the same Valkey (or Redis) server.
+
+    Reactions are counted in fixed windows of one period each, in short-lived keys named
+    "openheart-ratelimit:{window}:{client}:{slug}". A failure to reach the server is logged, and the reaction is
+    allowed.
+    """
+
+    def __init__(self, uri, rate, period):
+        """Create a new ValkeyRateLimiter instance.
+
+        :param uri: The URI of the Valkey or Redis server.
+        :param rate: The number of reactions each client may make to each page per period.
+        :param period: The length of the period, in seconds.
+        """
+        self.connection = valkey.from_url(uri, decode_responses=True)
+        self.rate = rate
+        self.period = period
+
+    def hit(self, client, slug):
+        """Count a reaction from a client to a page, if the client's limit allows it.
+
+        :param client: A string identifying the client, e.g. its address.
+        :param slug: A slug representing the page.
+
+        :return: Zero if the reaction is allowed, or else the number of seconds until it would be.
+        """
+        now = time.time()
+        window = int(now // self.period)
+        key = f"{RATE_LIMIT_KEY_PREFIX}:{window}:{client}:{slug}"
+        try:
+            with self.connection.pipeline() as pipeline:
+                pipeline.incr(key)
+                pipeline.expire(key, math.ceil(self.period))
+                count, _ = pipeline.execute()
+        except valkey.exceptions.ValkeyError:
+            logger.exception("Failed to check the rate limit for '%s'.", slug)
+            return 0
+        return 0 if count <= self.rate else (window + 1) * self.period - now
@@ -0,0 +1,149 @@
+"""A pool keeps backend connections open between requests, so that they can be reused."""
+
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+
+from flask_openheart.internal.backend import get_backend
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(uri, size, check_interval, pragmas=()):
+    """Get the process-wide pool for a given database URI, creating it if necessary.
+
+    :param uri: The database URI.
+    :param size: The maximum number of idle connections to keep open (per thread, for thread-bound backends).
+    :param check_interval: Connections which have been idle for at least this many seconds get a health check before
+        being reused.
+    :param pragmas: (optional) SQLite pragmas to apply to every new connection, as a tuple of (name, value) pairs.
+
+    :return: A BackendPool object.
+    """
+    key = (uri, size, check_interval, pragmas)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = BackendPool(uri, size, check_interval, pragmas)
+            _pools[key] = pool
+    return pool
+
+
+def reset_pools():
+    """Forget all pools, without closing any of their connections.
+
+    This is called automatically in a child process after a fork (e.g. when gunicorn forks workers from a preloaded
+    application). Connections inherited from the parent process must not be used by the child, and must not be closed
+    by the child either, since closing them could interfere with the parent.
+    """
+    global _pools_lock  # noqa: PLW0603 the lock may have been held by another thread at the time of the fork
+    _pools_lock = threading.Lock()
+    _pools.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_pools)
+
+
+class BackendPool:
+    """A pool of connected backends for a single database URI.
+
+    Backends which are bound to the thread that created them (such as SQLite) are pooled per-thread. All other backends
+    are shared by all threads.
+    """
+
+    def __init__(self, uri, size, check_interval, pragmas=()):
+        """Create a new BackendPool instance.
+
+        :param uri: The database URI.
+        :param size: The maximum number of idle connections to keep open (per thread, for thread-bound backends).
+        :param check_interval: Connections which have been idle for at least this many seconds get a health check
+            before being reused.
+        :param pragmas: (optional) SQLite pragmas to apply to every new connection, as a tuple of (name, value) pairs.
+            Since connections are reused, the pragmas are applied once per connection rather than once per request.
+        """
+        self.uri = uri
+        self.size = size
+        self.check_interval = check_interval
+        self.pragmas = pragmas
+        self.thread_bound = get_backend(uri).thread_bound
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._shared = deque()
+        self._local = threading.local()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # the pool was inherited through a fork; abandon the parent's connections
+            self._reset()
+
+    def _idle(self):
+        if not self.thread_bound:
+            return self._shared
+        if not hasattr(self._local, "idle"):
+            self._local.idle = deque()
+        return self._local.idle
+
+    def _is_healthy(self, backend, last_used):
+        if time.monotonic() - last_used < self.check_interval:
+            return True
+        try:
+            return backend.ping()
+        except Exception:  # noqa: BLE001 any failure means the connection is unusable
+            return False
+
+    def acquire(self):
+        """Get a connected backend, reusing an idle connection if a healthy one is available.
+
+        :exception BackendError: If a new connection could not be established.
+
+        :return: A connected Backend object.
+        """
+        self._check_pid()
+        idle = self._idle()
+        while True:
+            with self._lock:
+                if not idle:
+                    break
+                backend, last_used = idle.pop()
+            if self._is_healthy(backend, last_used):
+                return backend
+            self.discard(backend)
+        return get_backend(self.uri, pragmas=self.pragmas).__enter__()
+
+    def release(self, backend):
+        """Return a backend to the pool. If the pool is full, the connection is closed instead.
+
+        :param backend: A backend previously returned by `acquire`.
+        """
+        self._check_pid()
+        idle = self._idle()
+        with self._lock:
+            if len(idle) < self.size:
+                idle.append((backend, time.monotonic()))
+                return
+        self.discard(backend)
+
+    def discard(self, backend):
+        """Close a backend's connection without returning it to the pool.
+
+        :param backend: A backend previously returned by `acquire`.
+        """
+        with contextlib.suppress(Exception):
+            backend.__exit__(None, None, None)
+
+    def close(self):
+        """Close all idle connections which are usable from the current thread."""
+        idle = self._idle()
+        while True:
+            with self._lock:
+                if not idle:
+                    return
+                backend, _ = idle.pop()
+            self.discard(backend)
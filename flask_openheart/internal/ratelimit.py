@@ -0,0 +1,97 @@
+"""A rate limiter restricts how often each client may react to each page."""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(rate, period, max_size, uri=None):
+    """Get the process-wide rate limiter for the given limits and URI, creating it if necessary.
+
+    :param rate: The number of reactions each client may make to each page per period.
+    :param period: The length of the period, in seconds.
+    :param max_size: The maximum number of limits, one per client and page, to track in this process across all pages.
+        Ignored with a URI.
+    :param uri: (optional) The URI of a Valkey or Redis server used to share limits with other processes. If not
+        supplied, limits are tracked within this process only.
+
+    :exception RuntimeError: Unrecognized URI prefix
+
+    :return: A RateLimiter object.
+    """
+    key = (rate, period, max_size, uri)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            if uri is None:
+                limiter = RateLimiter(rate, period, max_size)
+            elif uri.startswith(("valkey:", "redis:")):
+                from flask_openheart.internal.keystore import ValkeyRateLimiter  # noqa: PLC0415 valkey is optional
+
+                limiter = ValkeyRateLimiter(uri, rate, period)
+            else:
+                msg = "Unrecognized URI prefix"
+                raise RuntimeError(msg)
+            _limiters[key] = limiter
+    return limiter
+
+
+def reset_rate_limiters():
+    """Forget all rate limiters.
+
+    This is called automatically in a child process after a fork, since connections must not be shared with a parent.
+    """
+    global _limiters_lock  # noqa: PLW0603 the lock may have been held by another thread during the fork
+    _limiters_lock = threading.Lock()
+    _limiters.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_rate_limiters)
+
+
+class RateLimiter:
+    """An in-process token bucket for each client and page.
+
+    Each bucket holds up to `rate` tokens and refills continuously, at `rate` tokens per `period`. A reaction costs one
+    token. Only the most recently active buckets are kept; an evicted client starts over with a full bucket.
+    """
+
+    def __init__(self, rate, period, max_size):
+        """Create a new RateLimiter instance.
+
+        :param rate: The number of reactions each client may make to each page per period.
+        :param period: The length of the period, in seconds.
+        :param max_size: The maximum number of buckets to keep. The least recently used bucket is evicted first.
+        """
+        self.rate = rate
+        self.period = period
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def hit(self, client, slug):
+        """Count a reaction from a client to a page, if the client's limit allows it.
+
+        :param client: A string identifying the client, e.g. its address.
+        :param slug: A slug representing the page.
+
+        :return: Zero if the reaction is allowed, or else the number of seconds until it would be.
+        """
+        key = (client, slug)
+        refill = self.rate / self.period
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / refill
@@ -0,0 +1,77 @@
+"""A replica set chooses which read replica of a database to read reactions from."""
+
+import itertools
+import os
+import threading
+import time
+
+_replica_sets = {}
+_replica_sets_lock = threading.Lock()
+
+
+def get_replica_set(uris, retry_interval):
+    """Get the process-wide replica set for the given replica URIs, creating it if necessary.
+
+    :param uris: The database URIs of the read replicas, as a tuple.
+    :param retry_interval: The number of seconds for which a replica which has failed is skipped.
+
+    :return: A ReplicaSet object.
+    """
+    key = (uris, retry_interval)
+    with _replica_sets_lock:
+        replica_set = _replica_sets.get(key)
+        if replica_set is None:
+            replica_set = ReplicaSet(uris, retry_interval)
+            _replica_sets[key] = replica_set
+    return replica_set
+
+
+def reset_replica_sets():
+    """Forget all replica sets, and which replicas have failed.
+
+    This is called automatically in a child process after a fork.
+    """
+    global _replica_sets_lock  # noqa: PLW0603 the lock may have been held by another thread during the fork
+    _replica_sets_lock = threading.Lock()
+    _replica_sets.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_replica_sets)
+
+
+class ReplicaSet:
+    """Spreads reads across read replicas in turn, skipping replicas which have recently failed."""
+
+    def __init__(self, uris, retry_interval):
+        """Create a new ReplicaSet instance.
+
+        :param uris: The database URIs of the read replicas.
+        :param retry_interval: The number of seconds for which a replica which has failed is skipped.
+        """
+        self.uris = tuple(uris)
+        self.retry_interval = retry_interval
+        self._next = itertools.count()
+        self._failed = {}
+
+    def candidates(self):
+        """Get the replicas to try for a read, in order.
+
+        Each read starts with the next replica in turn. Replicas which have failed within the last `retry_interval`
+        seconds are left out.
+
+        :return: A list of database URIs, which may be empty.
+        """
+        if not self.uris:
+            return []
+        start = next(self._next) % len(self.uris)
+        now = time.monotonic()
+        rotated = self.uris[start:] + self.uris[:start]
+        return [uri for uri in rotated if self._failed.get(uri, 0) <= now]
+
+    def failed(self, uri):
+        """Record that a replica has failed, so that it is skipped for a while.
+
+        :param uri: The database URI of the replica.
+        """
+        self._failed[uri] = time.monotonic() + self.retry_interval
@@ -0,0 +1,355 @@
+"""The sharded backend spreads reactions across several databases, each of which holds every reaction for some pages.
+
+Each page is assigned to a shard by consistent hashing of its slug: every shard is placed at many points on a ring of
+hash values, and a page belongs to the shard at the first point after the hash of its slug. When a shard is added, it
+takes over only the pages which hash near its own points, so roughly 1/N of the pages move, rather than almost all of
+them. Those pages are moved by `rebalance` (or the `flask openheart rebalance` command).
+"""
+
+import bisect
+import contextlib
+import hashlib
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_openheart.internal.backend import Backend, BackendError, get_backend
+
+logger = logging.getLogger(__name__)
+
+VIRTUAL_NODES = 128
+"""The number of points on the ring for each shard. More points spread pages more evenly."""
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """A consistent hash ring, which assigns keys to nodes."""
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        """Create a new HashRing instance.
+
+        :param nodes: The nodes, as strings. Each must be unique.
+        :param virtual_nodes: (optional) The number of points on the ring for each node.
+
+        :exception RuntimeError: No nodes, or duplicate nodes
+        """
+        nodes = list(nodes)
+        if not nodes or len(set(nodes)) != len(nodes):
+            msg = "A hash ring needs at least one node, and each node must be unique."
+            raise RuntimeError(msg)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key):
+        """Get the node which a key is assigned to.
+
+        :param key: The key, as a string.
+
+        :return: The node.
+        """
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class ShardedBackend(Backend):
+    """A backend which routes each page to one of several other backends, by consistent hashing of its slug.
+
+    Operations on a single page go to that page's shard. Operations on many pages are split by shard; reads from
+    shards which are not thread-bound run in parallel. Writes to several shards are not atomic as a whole.
+    """
+
+    def __init__(self, uris, *args, pragmas=(), **kwargs):
+        """Create a new ShardedBackend instance.
+
+        :param uris: The database URIs of the shards.
+        :param args: Positional arguments to be passed to the connection function of every shard.
+        :param pragmas: (optional) SQLite pragmas to apply to every connection to a SQLite shard.
+        :param kwargs: Keyword arguments to be passed to the connection function of every shard.
+        """
+        super().__init__()
+        self.uris = tuple(uris)
+        self.ring = HashRing(self.uris)
+        self.shards = {uri: get_backend(uri, *args, pragmas=pragmas, **kwargs) for uri in self.uris}
+        self.thread_bound = any(shard.thread_bound for shard in self.shards.values())
+
+    def shard_for(self, slug):
+        """Get the shard which holds the reactions for a given page.
+
+        :param slug: A slug representing the page.
+
+        :return: A Backend object.
+        """
+        return self.shards[self.ring.node_for(slug)]
+
+    def _group(self, slugs):
+        groups = defaultdict(list)
+        for slug in slugs:
+            groups[self.ring.node_for(slug)].append(slug)
+        return groups
+
+    def connect(self):
+        """Connect to every shard."""
+        with contextlib.ExitStack() as stack:
+            for shard in self.shards.values():
+                stack.enter_context(shard)
+            stack.pop_all()
+
+    def disconnect(self):
+        """Close the connection to every shard."""
+        for shard in self.shards.values():
+            if shard.is_connected():
+                shard.disconnect()
+
+    def is_connected(self):
+        """Check whether every shard is connected.
+
+        :return: True if connected, False otherwise.
+        """
+        return all(shard.is_connected() for shard in self.shards.values())
+
+    def ping(self):
+        """Check whether the connection to every shard is healthy and usable.
+
+        :return: True if healthy, False otherwise.
+        """
+        return all(shard.ping() for shard in self.shards.values())
+
+    def migrate(self):
+        """Bring the stored data in every shard up to date."""
+        for shard in self.shards.values():
+            shard.migrate()
+
+    def iter(self, slug):
+        """Iterate all reactions for a given page.
+
+        :param slug: A slug representing the page.
+
+        :return: A generator yielding: reaction, count.
+        """
+        return self.shard_for(slug).iter(slug)
+
+    def version(self, slug):
+        """Get the version of the reactions on a given page.
+
+        :param slug: A slug representing the page.
+
+        :return: The version, as an int.
+        """
+        return self.shard_for(slug).version(slug)
+
+    def iter_many(self, slugs):
+        """Iterate all reactions for many pages at once, querying each shard once.
+
+        Shards are queried in parallel, unless they are thread-bound (like SQLite), in which case they are queried in
+        turn.
+
+        :param slugs: A collection of slugs representing the pages.
+
+        :return: A generator yielding: slug, reaction, count.
+        """
+        groups = self._group(slugs)
+        if self.thread_bound or len(groups) < 2:  # noqa: PLR2004 there is nothing to parallelize
+            for uri, group in groups.items():
+                yield from self.shards[uri].iter_many(group)
+            return
+        with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="openheart-shard") as executor:
+            futures = [
+                executor.submit(lambda shard, group: list(shard.iter_many(group)), self.shards[uri], group)
+                for uri, group in groups.items()
+            ]
+            for future in futures:
+                yield from future.result()
+
+    def incr(self, slug, reaction):
+        """Add a reaction for a given page.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+        """
+        self.shard_for(slug).incr(slug, reaction)
+
+    def incr_many(self, increments):
+        """Add many reactions, for any number of pages, with one call per shard.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        """
+        groups = defaultdict(dict)
+        for (slug, reaction), count in increments.items():
+            groups[self.ring.node_for(slug)][slug, reaction] = count
+        for uri, group in groups.items():
+            self.shards[uri].incr_many(group)
+
+    def incr_and_fetch(self, slug, reaction):
+        """Add a reaction for a given page, then get all reactions for that page.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+
+        :return: The updated reactions, as a dict.
+        """
+        return self.shard_for(slug).incr_and_fetch(slug, reaction)
+
+    async def aiter(self, slug):
+        """Iterate all reactions for a given page, without blocking the event loop.
+
+        :param slug: A slug representing the page.
+
+        :return: An async generator yielding: reaction, count.
+        """
+        async for row in self.shard_for(slug).aiter(slug):
+            yield row
+
+    async def aversion(self, slug):
+        """Get the version of the reactions on a given page, without blocking the event loop.
+
+        :param slug: A slug representing the page.
+
+        :return: The version, as an int.
+        """
+        return await self.shard_for(slug).aversion(slug)
+
+    async def aincr(self, slug, reaction):
+        """Add a reaction for a given page, without blocking the event loop.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+        """
+        await self.shard_for(slug).aincr(slug, reaction)
+
+    async def aincr_and_fetch(self, slug, reaction):
+        """Add a reaction for a given page, then get all reactions for that page, without blocking the event loop.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+
+        :return: The updated reactions, as a dict.
+        """
+        return await self.shard_for(slug).aincr_and_fetch(slug, reaction)
+
+    def mark(self, slug, positions, size):
+        """Set bits in the deduplication filter for a given page.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to set.
+        :param size: The size of the filter, in bits.
+
+        :return: The positions of the bits which were not already set, as a list.
+        """
+        return self.shard_for(slug).mark(slug, positions, size)
+
+    def unmark(self, slug, positions, size):
+        """Clear bits in the deduplication filter for a given page.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to clear.
+        :param size: The size of the filter, in bits.
+        """
+        self.shard_for(slug).unmark(slug, positions, size)
+
+    def slugs(self):
+        """Iterate the slugs of all pages which have reactions, in every shard.
+
+        :return: A generator yielding slugs.
+        """
+        for shard in self.shards.values():
+            yield from shard.slugs()
+
+    def pop(self, slug):
+        """Remove all reactions for a given page, and return them.
+
+        :param slug: A slug representing the page.
+
+        :return: The removed reactions, as a dict.
+        """
+        return self.shard_for(slug).pop(slug)
+
+    def record(self, increments, timestamp):
+        """Record reactions in the history, with one call per shard.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        :param timestamp: The time at which the reactions were made, in seconds since the epoch.
+        """
+        groups = defaultdict(dict)
+        for (slug, reaction), count in increments.items():
+            groups[self.ring.node_for(slug)][slug, reaction] = count
+        for uri, group in groups.items():
+            self.shards[uri].record(group, timestamp)
+
+    def history(self, slug, resolution, start, end):
+        """Iterate the history buckets of a given resolution for a given page, within a time range.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds.
+        :param start: The earliest bucket start to include, in seconds since the epoch.
+        :param end: The bucket start at which to stop (exclusive), in seconds since the epoch.
+
+        :return: A generator yielding: bucket start, reaction, count.
+        """
+        return self.shard_for(slug).history(slug, resolution, start, end)
+
+    def rolled_up(self, slug, resolution):
+        """Get the time up to which history buckets of a given resolution are complete, for a given page.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds.
+
+        :return: The time, in seconds since the epoch, as an int.
+        """
+        return self.shard_for(slug).rolled_up(slug, resolution)
+
+    def compact(self, now, retention):
+        """Compact the history in every shard.
+
+        :param now: The current time, in seconds since the epoch.
+        :param retention: The number of seconds for which to keep buckets of each resolution (or None, to keep them
+            forever), as a tuple of (resolution, seconds) pairs, finest first.
+        """
+        for shard in self.shards.values():
+            shard.compact(now, retention)
+
+
+def rebalance(uris, drain=(), pragmas=()):
+    """Move every page which is not on the shard it is assigned to, e.g. after adding shards.
+
+    Each page is removed from its old shard and added to its new shard, so reactions made to a page on its old shard
+    while it is being moved are moved with it. Run this after the application starts using the new list of shards;
+    it is safe to run more than once. Deduplication filters and history are not moved.
+
+    :param uris: The database URIs of the current shards.
+    :param drain: (optional) Database URIs of former shards, all of whose pages should be moved to the current shards.
+    :param pragmas: (optional) SQLite pragmas to apply to every connection to a SQLite shard.
+
+    :exception BackendError: If a page could not be moved. Its reactions are put back on its old shard, or logged with
+        the page if that fails too.
+
+    :return: The number of pages moved.
+    """
+    ring = HashRing(uris)
+    moved = 0
+    sources = [*uris, *(uri for uri in drain if uri not in uris)]
+    with contextlib.ExitStack() as stack:
+        backends = {uri: stack.enter_context(get_backend(uri, pragmas=pragmas)) for uri in sources}
+        for uri in sources:
+            source = backends[uri]
+            for slug in list(source.slugs()):
+                owner = ring.node_for(slug)
+                if owner == uri:
+                    continue
+                reactions = source.pop(slug)
+                increments = {(slug, reaction): count for reaction, count in reactions.items()}
+                try:
+                    backends[owner].incr_many(increments)
+                except BackendError:
+                    try:
+                        source.incr_many(increments)
+                    except BackendError:
+                        logger.exception(
+                            "Failed to put the reactions to '%s' back on %s; add them by hand: %r", slug, uri, reactions
+                        )
+                    raise
+                moved += 1
+    return moved
@@ -1,21 +1,225 @@
 """The Sqlite backend can be used to to store data in a local database file."""
 
+import itertools
 import sqlite3
 
-from flask_openheart.internal import Backend, BackendError
+from flask_openheart.internal import Backend, BackendError, dedup, history
+
+MIGRATIONS = (
+    # version 1: the reactions table
+    (
+        """
+        CREATE TABLE IF NOT EXISTS openheart (
+            slug TEXT,
+            reaction TEXT,
+            count INT DEFAULT 1,
+            PRIMARY KEY (slug, reaction)
+        )
+        """,
+    ),
+    # version 2: a version counter per slug, which is the total number of reactions to that slug
+    (
+        """
+        CREATE TABLE openheart_version (
+            slug TEXT PRIMARY KEY,
+            version INT NOT NULL
+        )
+        """,
+        """
+        INSERT INTO openheart_version (slug, version) SELECT slug, SUM(count) FROM openheart GROUP BY slug
+        """,
+        """
+        CREATE TRIGGER openheart_version_insert AFTER INSERT ON openheart BEGIN
+            INSERT INTO openheart_version (slug, version) VALUES (NEW.slug, NEW.count)
+                ON CONFLICT (slug) DO UPDATE SET version=version+NEW.count;
+        END
+        """,
+        """
+        CREATE TRIGGER openheart_version_update AFTER UPDATE OF count ON openheart BEGIN
+            INSERT INTO openheart_version (slug, version) VALUES (NEW.slug, NEW.count-OLD.count)
+                ON CONFLICT (slug) DO UPDATE SET version=version+NEW.count-OLD.count;
+        END
+        """,
+    ),
+    # version 3: a deduplication filter per slug
+    (
+        """
+        CREATE TABLE openheart_seen (
+            slug TEXT PRIMARY KEY,
+            filter BLOB NOT NULL
+        )
+        """,
+    ),
+    # version 4: slugs and reactions are interned, and counts are keyed by their integer ids. The version counter
+    # moves into the slug table, and the original table is replaced by a view with the same columns, for reads.
+    (
+        """
+        CREATE TABLE openheart_slug (
+            id INTEGER PRIMARY KEY,
+            slug TEXT NOT NULL UNIQUE,
+            version INT NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE openheart_reaction (
+            id INTEGER PRIMARY KEY,
+            reaction TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE openheart_count (
+            slug_id INT NOT NULL REFERENCES openheart_slug (id),
+            reaction_id INT NOT NULL REFERENCES openheart_reaction (id),
+            count INT NOT NULL DEFAULT 1,
+            PRIMARY KEY (slug_id, reaction_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO openheart_slug (slug, version) SELECT slug, SUM(count) FROM openheart GROUP BY slug
+        """,
+        """
+        INSERT INTO openheart_reaction (reaction) SELECT DISTINCT reaction FROM openheart
+        """,
+        """
+        INSERT INTO openheart_count (slug_id, reaction_id, count)
+            SELECT openheart_slug.id, openheart_reaction.id, openheart.count FROM openheart
+                JOIN openheart_slug USING (slug)
+                JOIN openheart_reaction USING (reaction)
+        """,
+        """
+        DROP TABLE openheart
+        """,
+        """
+        DROP TABLE openheart_version
+        """,
+        """
+        CREATE VIEW openheart (slug, reaction, count) AS
+            SELECT openheart_slug.slug, openheart_reaction.reaction, openheart_count.count FROM openheart_count
+                JOIN openheart_slug ON openheart_slug.id = openheart_count.slug_id
+                JOIN openheart_reaction ON openheart_reaction.id = openheart_count.reaction_id
+        """,
+        """
+        CREATE TRIGGER openheart_count_insert AFTER INSERT ON openheart_count BEGIN
+            UPDATE openheart_slug SET version=version+NEW.count WHERE id=NEW.slug_id;
+        END
+        """,
+        """
+        CREATE TRIGGER openheart_count_update AFTER UPDATE OF count ON openheart_count BEGIN
+            UPDATE openheart_slug SET version=version+NEW.count-OLD.count WHERE id=NEW.slug_id;
+        END
+        """,
+    ),
+    # version 5: reaction history, as counts per time bucket (see `history`), and the time up to which each
+    # resolution has been rolled up
+    (
+        """
+        CREATE TABLE openheart_history (
+            slug_id INT NOT NULL REFERENCES openheart_slug (id),
+            resolution INT NOT NULL,
+            bucket INT NOT NULL,
+            reaction_id INT NOT NULL REFERENCES openheart_reaction (id),
+            count INT NOT NULL,
+            PRIMARY KEY (slug_id, resolution, bucket, reaction_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE INDEX openheart_history_bucket ON openheart_history (resolution, bucket)
+        """,
+        """
+        CREATE TABLE openheart_rollup (
+            resolution INT PRIMARY KEY,
+            through INT NOT NULL
+        )
+        """,
+    ),
+)
+"""The schema migrations, in order. Each migration is a sequence of SQL statements.
+
+The index of a migration (plus one) is the schema version it produces. The current schema version is recorded in the
+database using SQLite's `user_version` pragma. New migrations must only ever be appended to the end of this sequence.
+"""
+
+SCHEMA_VERSION = len(MIGRATIONS)
+"""The schema version produced by applying all migrations."""
+
+MAX_VARIABLES = 999
+"""The maximum number of variables in a single query. This is the lowest limit of any supported SQLite version."""
+
+ID_CACHE_SIZE = 4096
+"""The maximum number of slug ids, and of reaction ids, cached by each connection. A full cache is emptied."""
+
+
+def _identifier(value):
+    value = str(value)
+    if not value.isalnum():
+        msg = f"Invalid pragma value '{value}'."
+        raise BackendError(msg)
+    return value
+
+
+PRAGMAS = {
+    "busy_timeout": int,
+    "journal_mode": _identifier,
+    "synchronous": _identifier,
+    "cache_size": int,
+    "mmap_size": int,
+}
+"""The pragmas which may be applied to a connection, mapped to functions which check and format their values."""
+
+INTERN_SLUG_QUERY = """
+    INSERT INTO openheart_slug (slug) VALUES (?) ON CONFLICT (slug) DO NOTHING
+"""
+
+INTERN_REACTION_QUERY = """
+    INSERT INTO openheart_reaction (reaction) VALUES (?) ON CONFLICT (reaction) DO NOTHING
+"""
+
+SLUG_ID_QUERY = """
+    SELECT id FROM openheart_slug WHERE slug=?
+"""
+
+REACTION_ID_QUERY = """
+    SELECT id FROM openheart_reaction WHERE reaction=?
+"""
+
+INTERN_QUERIES = ((INTERN_SLUG_QUERY, SLUG_ID_QUERY), (INTERN_REACTION_QUERY, REACTION_ID_QUERY))
+"""The queries to intern a slug and get its id, and to intern a reaction and get its id."""
+
+INCREMENT_QUERY = """
+    INSERT INTO openheart_count (slug_id, reaction_id, count) VALUES (?, ?, ?)
+        ON CONFLICT (slug_id, reaction_id) DO UPDATE SET count=count+excluded.count
+"""
+
+RECORD_QUERY = """
+    INSERT INTO openheart_history (slug_id, resolution, bucket, reaction_id, count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (slug_id, resolution, bucket, reaction_id) DO UPDATE SET count=count+excluded.count
+"""
+
+ROLLUP_QUERY = """
+    INSERT INTO openheart_history (slug_id, resolution, bucket, reaction_id, count)
+        SELECT slug_id, :coarse, bucket - bucket % :coarse, reaction_id, SUM(count) FROM openheart_history
+            WHERE resolution=:fine AND bucket>=:start AND bucket<:through
+            GROUP BY slug_id, bucket - bucket % :coarse, reaction_id
+    ON CONFLICT (slug_id, resolution, bucket, reaction_id) DO UPDATE SET count=count+excluded.count
+"""
 
 
 class SqliteBackend(Backend):
     """The Sqlite backend can be used to to store data in a local database file."""
 
-    def __init__(self, *args, **kwargs):
+    thread_bound = True
+
+    def __init__(self, *args, pragmas=(), **kwargs):
         """Create a new Sqlite backend instance.
 
         :param args: Positional arguments to be passed to the connection function.
+        :param pragmas: (optional) Pragmas to apply whenever a connection is made, as (name, value) pairs, in order.
         :param kwargs: Keyword arguments to be passed to the connection function.
         """
         super().__init__(*args, **kwargs)
+        self.pragmas = tuple(pragmas)
         self.connection = None
+        self._ids_cache = ({}, {})  # slug ids and reaction ids, as in INTERN_QUERIES
 
     def connect(self, uri, *args, **kwargs):
         """Initiate the connection.
@@ -26,17 +230,43 @@ class SqliteBackend(Backend):
         """
         if self.connection is not None:
             self.disconnect()
+        # a connection is only used by one caller at a time, but async callers run its queries in worker threads
+        kwargs.setdefault("check_same_thread", False)
         try:
             self.connection = sqlite3.connect(uri, *args, **kwargs)
         except sqlite3.DatabaseError as e:
             self.connection = None
             msg = "A database error occurred while connecting."
             raise BackendError(msg) from e
+        try:
+            self.apply_pragmas()
+            self.migrate()
+        except BackendError:
+            self.disconnect()
+            raise
+
+    def apply_pragmas(self):
+        """Apply the configured pragmas to the connection.
+
+        This runs automatically whenever a connection is made, before any migrations.
+        """
+        self._check_if_connected()
+        try:
+            for name, value in self.pragmas:
+                if name not in PRAGMAS:
+                    msg = f"Unsupported pragma '{name}'."
+                    raise BackendError(msg)
+                self.connection.execute(f"PRAGMA {name} = {PRAGMAS[name](value)}").fetchall()
+        except sqlite3.DatabaseError as e:
+            msg = "A database error occurred while applying pragmas."
+            raise BackendError(msg) from e
 
     def disconnect(self):
         """Close the connection."""
         self.connection.close()
         self.connection = None
+        for cache in self._ids_cache:
+            cache.clear()
 
     def is_connected(self):
         """Check whether the backend is connected.
@@ -46,21 +276,97 @@ class SqliteBackend(Backend):
         """
         return self.connection is not None
 
-    def _create(self, cursor):
-        query = """
-                CREATE TABLE IF NOT EXISTS openheart ( \
-                    slug TEXT, \
-                    reaction TEXT, \
-                    count INT DEFAULT 1, \
-                    PRIMARY KEY (slug, reaction) \
-                )
-            """
+    def ping(self):
+        """Check whether the connection is healthy and usable.
+
+        :return: True if healthy, False otherwise.
+        """
+        if not self.is_connected():
+            return False
+        try:
+            self.connection.execute("SELECT 1")
+        except sqlite3.Error:
+            return False
+        return True
+
+    def schema_version(self):
+        """Get the schema version of the connected database.
+
+        :return: The schema version, as an int. A new database has version zero.
+        """
+        self._check_if_connected()
         try:
-            cursor.execute(query)
+            return self.connection.execute("PRAGMA user_version").fetchone()[0]
         except sqlite3.DatabaseError as e:
-            msg = "A database error occurred while setting up the table."
+            msg = "A database error occurred while checking the schema version."
+            raise BackendError(msg) from e
+
+    def migrate(self):
+        """Bring the database schema up to date by applying any migrations it has not had yet.
+
+        This runs automatically whenever a connection is made. If the schema is already up to date, it costs a single
+        pragma query. Migrations are applied in a single transaction, so concurrent connections cannot apply the same
+        migration twice.
+        """
+        if self.schema_version() >= SCHEMA_VERSION:
+            return
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            version = self.schema_version()  # another connection may have migrated while we waited for the lock
+            for migration in MIGRATIONS[version:]:
+                for statement in migration:
+                    self.connection.execute(statement)
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION:d}")
+            self.connection.commit()
+        except (sqlite3.DatabaseError, BackendError) as e:
+            self.connection.rollback()
+            msg = "A database error occurred while setting up the schema."
             raise BackendError(msg) from e
 
+    def _intern(self, cursor, kind, value, learned):
+        interned = self._ids_cache[kind].get(value)
+        if interned is None:
+            interned = learned[kind].get(value)
+        if interned is None:
+            intern_query, id_query = INTERN_QUERIES[kind]
+            cursor.execute(intern_query, (value,))
+            interned = learned[kind][value] = cursor.execute(id_query, (value,)).fetchone()[0]
+        return interned
+
+    def _ids(self, cursor, pairs):
+        """Get the ids of some (slug, reaction) pairs, interning the slugs and reactions whose ids are not cached.
+
+        Ids are only cached by `_learn`, once the transaction which interned them has committed; a rolled back id may
+        be given to another slug or reaction later. Interned rows are never deleted, so cached ids stay valid.
+
+        :return: A list of (slug id, reaction id) pairs, and the newly learned ids, as a pair of dicts.
+        """
+        learned = ({}, {})
+        ids = [
+            (self._intern(cursor, 0, slug, learned), self._intern(cursor, 1, reaction, learned))
+            for slug, reaction in pairs
+        ]
+        return ids, learned
+
+    def _learn(self, learned):
+        for cache, ids in zip(self._ids_cache, learned, strict=True):
+            if len(cache) + len(ids) > ID_CACHE_SIZE:
+                cache.clear()
+            if len(ids) <= ID_CACHE_SIZE:
+                cache.update(ids)
+
+    def _increment(self, cursor, rows):
+        """Add counts, by slug and reaction. Once ids are cached, this is a single statement per row.
+
+        :return: The newly learned ids, to be passed to `_learn` once the transaction has committed.
+        """
+        ids, learned = self._ids(cursor, [(slug, reaction) for slug, reaction, _ in rows])
+        cursor.executemany(
+            INCREMENT_QUERY,
+            [(slug_id, reaction_id, count) for (slug_id, reaction_id), (_, _, count) in zip(ids, rows, strict=True)],
+        )
+        return learned
+
     def incr(self, slug, reaction):
         """Increment the reaction count for a certain reaction on a certain page.
 
@@ -68,15 +374,10 @@ class SqliteBackend(Backend):
         :param reaction: The emoji reaction to be incremented.
         """
         self._check_if_connected()
-        cursor = self.connection.cursor()
-        self._create(cursor)
-        query = """
-                INSERT INTO openheart (slug, reaction) VALUES (:slug, :reaction)
-                    ON CONFLICT (slug, reaction) DO UPDATE SET count=count+1
-            """
         try:
-            cursor.execute(query, {"slug": slug, "reaction": reaction})
-            self.connection.commit()
+            with self.connection:
+                learned = self._increment(self.connection.cursor(), [(slug, reaction, 1)])
+            self._learn(learned)
         except sqlite3.DatabaseError as e:
             msg = f"A database error occurred while processing a reaction for '{slug}'."
             raise BackendError(msg) from e
@@ -96,11 +397,306 @@ class SqliteBackend(Backend):
         try:
             result = cursor.execute(query, {"slug": slug})
         except sqlite3.DatabaseError as e:
-            if isinstance(e, sqlite3.OperationalError) and str(e) == "no such table: openheart":
-                return
             msg = f"A database error occurred while querying reactions for '{slug}'."
             raise BackendError(msg) from e
         row = result.fetchone()
         while row:
             yield row
             row = result.fetchone()
+
+    def version(self, slug):
+        """Get the version of the reactions on a certain page, without reading the reactions themselves.
+
+        The version is maintained by triggers, in the same transaction as every increment.
+
+        :param slug: A slug representing the page.
+
+        :return: The version, as an int.
+        """
+        self._check_if_connected()
+        cursor = self.connection.cursor()
+        query = """
+                SELECT version FROM openheart_slug WHERE slug=:slug
+            """
+        try:
+            row = cursor.execute(query, {"slug": slug}).fetchone()
+        except sqlite3.DatabaseError as e:
+            msg = f"A database error occurred while querying the version for '{slug}'."
+            raise BackendError(msg) from e
+        return row[0] if row is not None else 0
+
+    def iter_many(self, slugs):
+        """Iterate through all the reactions on many pages at once.
+
+        The pages are queried with a single `IN` query per 999 slugs.
+
+        :param slugs: A collection of slugs representing the pages.
+
+        :return: A generator yielding: slug, reaction, count.
+        """
+        self._check_if_connected()
+        slugs = list(slugs)
+        cursor = self.connection.cursor()
+        for start in range(0, len(slugs), MAX_VARIABLES):
+            chunk = slugs[start : start + MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(chunk))
+            query = f"""
+                    SELECT slug, reaction, count FROM openheart WHERE slug IN ({placeholders})
+                """  # noqa: S608 only placeholders are interpolated
+            try:
+                result = cursor.execute(query, chunk)
+                rows = result.fetchall()
+            except sqlite3.DatabaseError as e:
+                msg = "A database error occurred while querying reactions for many pages."
+                raise BackendError(msg) from e
+            yield from rows
+
+    def incr_many(self, increments):
+        """Increment the counts for many reactions, on any number of pages, in a single transaction.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        """
+        self._check_if_connected()
+        try:
+            with self.connection:
+                learned = self._increment(
+                    self.connection.cursor(),
+                    [(slug, reaction, count) for (slug, reaction), count in increments.items()],
+                )
+            self._learn(learned)
+        except sqlite3.DatabaseError as e:
+            msg = "A database error occurred while processing a batch of reactions."
+            raise BackendError(msg) from e
+
+    def incr_and_fetch(self, slug, reaction):
+        """Increment the reaction count for a certain reaction on a certain page, then get all reactions for that page.
+
+        Both statements run in a single transaction, with a single commit.
+
+        :param slug: A slug representing the page.
+        :param reaction: The emoji reaction to be incremented.
+
+        :return: The updated reactions, as a dict.
+        """
+        self._check_if_connected()
+        cursor = self.connection.cursor()
+        select_query = """
+                SELECT reaction, count FROM openheart WHERE slug=:slug
+            """
+        try:
+            with self.connection:
+                learned = self._increment(cursor, [(slug, reaction, 1)])
+                reactions = dict(cursor.execute(select_query, {"slug": slug}).fetchall())
+            self._learn(learned)
+        except sqlite3.DatabaseError as e:
+            msg = f"A database error occurred while processing a reaction for '{slug}'."
+            raise BackendError(msg) from e
+        return reactions
+
+    def mark(self, slug, positions, size):
+        """Set bits in the deduplication filter for a certain page.
+
+        The filter is read and written in a single immediate transaction, so concurrent connections cannot both see the
+        same bits as unset. A stored filter of a different size is discarded and replaced.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to set.
+        :param size: The size of the filter, in bits.
+
+        :return: The positions of the bits which were not already set, as a list.
+        """
+        self._check_if_connected()
+        length = -(-size // 8)
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            row = self.connection.execute("SELECT filter FROM openheart_seen WHERE slug=?", (slug,)).fetchone()
+            bits = bytearray(row[0]) if row is not None and len(row[0]) == length else bytearray(length)
+            added = dedup.mark(bits, positions)
+            if added:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO openheart_seen (slug, filter) VALUES (?, ?)", (slug, bytes(bits))
+                )
+            self.connection.commit()
+        except sqlite3.DatabaseError as e:
+            self.connection.rollback()
+            msg = f"A database error occurred while checking for a duplicate reaction to '{slug}'."
+            raise BackendError(msg) from e
+        return added
+
+    def unmark(self, slug, positions, size):
+        """Clear bits in the deduplication filter for a certain page.
+
+        The filter is read and written in a single immediate transaction. A stored filter of a different size is left
+        as it is.
+
+        :param slug: A slug representing the page.
+        :param positions: The positions of the bits to clear.
+        :param size: The size of the filter, in bits.
+        """
+        self._check_if_connected()
+        length = -(-size // 8)
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            row = self.connection.execute("SELECT filter FROM openheart_seen WHERE slug=?", (slug,)).fetchone()
+            if row is not None and len(row[0]) == length:
+                bits = bytearray(row[0])
+                dedup.unmark(bits, positions)
+                self.connection.execute("UPDATE openheart_seen SET filter=? WHERE slug=?", (bytes(bits), slug))
+            self.connection.commit()
+        except sqlite3.DatabaseError as e:
+            self.connection.rollback()
+            msg = f"A database error occurred while undoing a reaction to '{slug}'."
+            raise BackendError(msg) from e
+
+    def slugs(self):
+        """Iterate the slugs of all pages which have reactions.
+
+        :return: A generator yielding slugs.
+        """
+        self._check_if_connected()
+        try:
+            rows = self.connection.execute(
+                """
+                SELECT slug FROM openheart_slug
+                    WHERE EXISTS (SELECT 1 FROM openheart_count WHERE slug_id=openheart_slug.id)
+                """
+            ).fetchall()
+        except sqlite3.DatabaseError as e:
+            msg = "A database error occurred while listing pages."
+            raise BackendError(msg) from e
+        for (slug,) in rows:
+            yield slug
+
+    def pop(self, slug):
+        """Remove all reactions (and the deduplication filter) for a certain page, and return the reactions.
+
+        The reactions are read and removed in a single immediate transaction. The history of the page is kept, and so
+        is its interned slug, whose id other connections may have cached.
+
+        :param slug: A slug representing the page.
+
+        :return: The removed reactions, as a dict.
+        """
+        self._check_if_connected()
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            reactions = dict(self.connection.execute("SELECT reaction, count FROM openheart WHERE slug=?", (slug,)))
+            self.connection.execute(
+                "DELETE FROM openheart_count WHERE slug_id=(SELECT id FROM openheart_slug WHERE slug=?)", (slug,)
+            )
+            self.connection.execute("UPDATE openheart_slug SET version=0 WHERE slug=?", (slug,))
+            self.connection.execute("DELETE FROM openheart_seen WHERE slug=?", (slug,))
+            self.connection.commit()
+        except sqlite3.DatabaseError as e:
+            self.connection.rollback()
+            msg = f"A database error occurred while removing reactions for '{slug}'."
+            raise BackendError(msg) from e
+        return reactions
+
+    def record(self, increments, timestamp):
+        """Record reactions in the minute bucket for a given point in time, in a single transaction.
+
+        :param increments: A dict in which the keys are (slug, reaction) tuples and the values are the amounts to add.
+        :param timestamp: The time at which the reactions were made, in seconds since the epoch.
+        """
+        self._check_if_connected()
+        minute = history.bucket(timestamp, history.MINUTE)
+        try:
+            with self.connection:
+                cursor = self.connection.cursor()
+                ids, learned = self._ids(cursor, increments)
+                rows = [
+                    (slug_id, history.MINUTE, minute, reaction_id, count)
+                    for (slug_id, reaction_id), count in zip(ids, increments.values(), strict=True)
+                ]
+                cursor.executemany(RECORD_QUERY, rows)
+            self._learn(learned)
+        except sqlite3.DatabaseError as e:
+            msg = "A database error occurred while recording the history of reactions."
+            raise BackendError(msg) from e
+
+    def history(self, slug, resolution, start, end):
+        """Iterate the history buckets of a given resolution for a certain page, within a time range.
+
+        The buckets are found with a range scan of the primary key.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds.
+        :param start: The earliest bucket start to include, in seconds since the epoch.
+        :param end: The bucket start at which to stop (exclusive), in seconds since the epoch.
+
+        :return: A generator yielding: bucket start, reaction, count.
+        """
+        self._check_if_connected()
+        query = """
+                SELECT bucket, reaction, count FROM openheart_history
+                    JOIN openheart_reaction ON openheart_reaction.id = openheart_history.reaction_id
+                    WHERE slug_id=(SELECT id FROM openheart_slug WHERE slug=:slug)
+                        AND resolution=:resolution AND bucket>=:start AND bucket<:end
+            """
+        try:
+            rows = self.connection.execute(
+                query, {"slug": slug, "resolution": resolution, "start": start, "end": end}
+            ).fetchall()
+        except sqlite3.DatabaseError as e:
+            msg = f"A database error occurred while querying the history for '{slug}'."
+            raise BackendError(msg) from e
+        yield from rows
+
+    def rolled_up(self, slug, resolution):  # noqa: ARG002 every page is rolled up at once
+        """Get the time up to which history buckets of a given resolution are complete.
+
+        :param slug: A slug representing the page.
+        :param resolution: The size of the buckets, in seconds.
+
+        :return: The time, in seconds since the epoch, as an int.
+        """
+        self._check_if_connected()
+        return self._rolled_up(resolution)
+
+    def _rolled_up(self, resolution):
+        query = "SELECT through FROM openheart_rollup WHERE resolution=?"
+        try:
+            row = self.connection.execute(query, (resolution,)).fetchone()
+        except sqlite3.DatabaseError as e:
+            msg = "A database error occurred while querying the history."
+            raise BackendError(msg) from e
+        return row[0] if row is not None else 0
+
+    def compact(self, now, retention):
+        """Roll up complete history buckets into coarser buckets, then remove buckets older than their retention period.
+
+        Every page is compacted in a single immediate transaction, with one query per resolution.
+
+        :param now: The current time, in seconds since the epoch.
+        :param retention: The number of seconds for which to keep buckets of each resolution (or None, to keep them
+            forever), as a tuple of (resolution, seconds) pairs, finest first.
+        """
+        self._check_if_connected()
+        resolutions = [resolution for resolution, _ in retention]
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            finer_through = None
+            for fine, coarse in itertools.pairwise(resolutions):
+                start = self._rolled_up(coarse)
+                through = history.rollup_through(now, coarse, finer_through)
+                if through > start:
+                    params = {"fine": fine, "coarse": coarse, "start": start, "through": through}
+                    self.connection.execute(ROLLUP_QUERY, params)
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO openheart_rollup (resolution, through) VALUES (?, ?)", (coarse, through)
+                    )
+                finer_through = max(start, through)
+            for index, (resolution, keep) in enumerate(retention):
+                if keep is None:
+                    continue
+                coarser_through = self._rolled_up(resolutions[index + 1]) if index + 1 < len(retention) else None
+                cutoff = history.remove_before(now, resolution, keep, coarser_through)
+                self.connection.execute(
+                    "DELETE FROM openheart_history WHERE resolution=? AND bucket<?", (resolution, cutoff)
+                )
+            self.connection.commit()
+        except (sqlite3.DatabaseError, BackendError) as e:
+            self.connection.rollback()
+            msg = "A database error occurred while compacting the history."
+            raise BackendError(msg) from e
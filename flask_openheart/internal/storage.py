@@ -1,8 +1,34 @@
 """The storage is an interface between the extension and the backend."""
 
-from emoji import EMOJI_DATA
+import asyncio
+import functools
+import logging
+import random
+import time
 
-from flask_openheart.internal.backend import get_backend
+from flask_openheart.internal import dedup, emojis
+from flask_openheart.internal.backend import BackendError
+from flask_openheart.internal.pool import get_pool
+from flask_openheart.internal.writebehind import get_write_buffer
+
+logger = logging.getLogger(__name__)
+
+COUNTER_SEPARATOR = "\x1f"
+"""Separates a slug from the number of one of its sub-counters, in the slug under which that sub-counter is stored."""
+
+
+def counter_slugs(slug, shards):
+    """Get the slugs under which the sub-counters for a page are stored.
+
+    The first sub-counter is stored under the slug itself, so a page with a single counter is stored as it always was,
+    and raising the number of sub-counters keeps all existing counts.
+
+    :param slug: A slug representing the page.
+    :param shards: The number of sub-counters.
+
+    :return: A list of slugs.
+    """
+    return [slug, *(f"{slug}{COUNTER_SEPARATOR}{i}" for i in range(1, shards))]
 
 
 class InvalidReactionError(Exception):
@@ -25,6 +51,37 @@ class InvalidReactionError(Exception):
         return self.message
 
 
+class DuplicateReactionError(Exception):
+    """A duplicate reaction error occurs when a client repeats a reaction it has already made to a page."""
+
+
+@functools.cache
+def _emoji_index():
+    """Build a lookup structure for finding the longest emoji at the start of a string.
+
+    The index is built once per process, on first use, from the compact emoji data file. It consists of the set of all
+    known emojis, plus the distinct emoji lengths (in code points) sorted from longest to shortest. Finding a match then
+    costs one set lookup per distinct length, rather than one comparison per known emoji.
+
+    :return: A tuple of: the known emojis as a frozenset, and the distinct emoji lengths in descending order.
+    """
+    known = emojis.load()
+    lengths = tuple(sorted({len(emoji) for emoji in known}, reverse=True))
+    return known, lengths
+
+
+@functools.cache
+def max_reaction_size():
+    """Get the size of the longest known emoji, in bytes, when encoded as UTF-8.
+
+    No more than this many bytes of input are ever needed to find the emoji at the start of a reaction.
+
+    :return: The size, in bytes.
+    """
+    known, _ = _emoji_index()
+    return max(len(emoji.encode("utf-8")) for emoji in known)
+
+
 def sanitize_reaction(data):
     """Check that the data matches OpenHeart spec and strip extraneous data.
 
@@ -38,12 +95,13 @@ def sanitize_reaction(data):
         msg = "No emoji data supplied."
         raise InvalidReactionError(msg)
     match = None
-    emojis = EMOJI_DATA.keys()
-    for emoji in emojis:
-        if match is not None and len(match) >= len(emoji):
+    known, lengths = _emoji_index()
+    for length in lengths:
+        if length > len(data):
             continue
-        if data.startswith(emoji):
-            match = emoji
+        if data[:length] in known:
+            match = data[:length]
+            break
     if match is None:
         msg = "This is not a recognized emoji."
         raise InvalidReactionError(msg)
@@ -53,15 +111,20 @@ def sanitize_reaction(data):
 class Storage:
     """The storage is an interface between the extension and the backend."""
 
-    def __init__(self, slug, config):
+    def __init__(self, slug, config, database_uri=None):
         """Create a new instance of OpenHeartStorage.
 
         :param config: An instance of OpenHeartConfig.
-        :param slug: A slug representing the page.
+        :param slug: A slug representing the page. May be None if only `reactions_many` is used.
+        :param database_uri: (optional) The database to connect to, such as a read replica. Defaults to the configured
+            database. Reactions must only be added through the configured database.
         """
         self.slug = slug
         self.config = config
+        self.database_uri = database_uri if database_uri is not None else config.database_uri
+        self.pool = None
         self.backend = None
+        self.write_buffer = None
 
     def _check_if_connected(self):
         if self.backend is None:
@@ -74,29 +137,256 @@ class Storage:
         :return: A dict in which the reactions are the keys and the counts are the values.
         """
         self._check_if_connected()
-        return dict(self.backend.iter(self.slug))
+        if self.config.counter_shards > 1:
+            reactions = self._sum_counters(self.backend.iter_many(counter_slugs(self.slug, self.config.counter_shards)))
+        else:
+            reactions = dict(self.backend.iter(self.slug))
+        if self.write_buffer is not None:
+            for reaction, count in self.write_buffer.pending(self.slug).items():
+                reactions[reaction] = reactions.get(reaction, 0) + count
+        return reactions
+
+    @property
+    def version(self):
+        """Get the version of the reactions for a given page, which changes whenever the reactions change.
+
+        The version is the sum of all counts in `reactions`, but can be read without reading the reactions themselves.
+
+        :return: The version, as an int.
+        """
+        self._check_if_connected()
+        if self.config.counter_shards > 1:
+            # there is no version per page, only per sub-counter, so all of them are read in one round trip instead
+            slugs = counter_slugs(self.slug, self.config.counter_shards)
+            version = sum(count for _, _, count in self.backend.iter_many(slugs))
+        else:
+            version = self.backend.version(self.slug)
+        if self.write_buffer is not None:
+            version += sum(self.write_buffer.pending(self.slug).values())
+        return version
 
-    def react(self, reaction):
+    @staticmethod
+    def _sum_counters(rows):
+        reactions = {}
+        for _, reaction, count in rows:
+            reactions[reaction] = reactions.get(reaction, 0) + count
+        return reactions
+
+    def _counter_slug(self):
+        """Choose the slug of the sub-counter to add a reaction to, at random."""
+        shards = self.config.counter_shards
+        if shards <= 1:
+            return self.slug
+        return counter_slugs(self.slug, shards)[random.randrange(shards)]  # noqa: S311 not used for security
+
+    def reactions_many(self, slugs):
+        """Get all reactions for many pages at once, all of which use this storage's configuration.
+
+        :param slugs: A collection of slugs representing the pages.
+
+        :return: A dict in which the slugs are the keys and the values are dicts of reactions and counts.
+        """
+        self._check_if_connected()
+        results = {slug: {} for slug in slugs}
+        owners = {sub: slug for slug in results for sub in counter_slugs(slug, self.config.counter_shards)}
+        for sub, reaction, count in self.backend.iter_many(owners):
+            reactions = results[owners[sub]]
+            reactions[reaction] = reactions.get(reaction, 0) + count
+        if self.write_buffer is not None:
+            for slug, reactions in results.items():
+                for reaction, count in self.write_buffer.pending(slug).items():
+                    reactions[reaction] = reactions.get(reaction, 0) + count
+        return results
+
+    def react(self, reaction, client=None):
         """Add a reaction for a given page.
 
         :param reaction: The reaction to add.
+        :param client: (optional) A string identifying the client. If deduplication is enabled, each client may only
+            make each reaction to the page once.
+
+        :exception DuplicateReactionError: The client has already made this reaction to the page.
+
+        :return: The updated reactions, as a dict.
+        """
+        self._check_if_connected()
+        reaction = sanitize_reaction(reaction)[0]
+        marked = self._mark(client, reaction)
+        if self.write_buffer is not None:
+            # the write buffer already turns many reactions into one write, so it always writes to the first counter
+            self.write_buffer.add(self.slug, reaction)
+            return self.reactions
+        reactions = None
+        try:
+            if self.config.counter_shards > 1:
+                self.backend.incr(self._counter_slug(), reaction)
+            else:
+                reactions = self.backend.incr_and_fetch(self.slug, reaction)
+        except BackendError:
+            self._unmark(marked)
+            raise
+        if reactions is None:
+            reactions = self.reactions
+        self._record(reaction)
+        return reactions
+
+    def _mark(self, client, reaction):
+        """Record that a client has made a reaction in the deduplication filter, if enabled.
+
+        :exception DuplicateReactionError: The client has already made this reaction to the page.
+
+        :return: The positions of the bits which were set, so that they can be cleared if the reaction is not counted.
+        """
+        if not self.config.dedup or client is None:
+            return []
+        positions = dedup.positions(client, reaction, self.config.dedup_size, key=self.config.dedup_key)
+        marked = self.backend.mark(self.slug, positions, self.config.dedup_size)
+        if not marked:
+            msg = f"Duplicate reaction to '{self.slug}'."
+            raise DuplicateReactionError(msg)
+        return marked
+
+    def _unmark(self, marked):
+        """Clear the bits set by `_mark`, after the reaction failed to be counted, so the client may try again."""
+        if not marked:
+            return
+        try:
+            self.backend.unmark(self.slug, marked, self.config.dedup_size)
+        except BackendError:
+            logger.exception("Failed to undo a reaction to '%s' in the deduplication filter.", self.slug)
+
+    def _record(self, reaction):
+        """Record a reaction in the history, if enabled.
+
+        The reaction has already been counted by now, so a failure is logged rather than raised; raising would invite
+        the client to repeat the reaction, counting it twice.
+        """
+        if not self.config.history:
+            return
+        try:
+            self.backend.record({(self.slug, reaction): 1}, time.time())
+        except BackendError:
+            logger.exception("Failed to record the history of a reaction to '%s'.", self.slug)
+
+    def reactions_between(self, start, end=None):
+        """Count the reactions made to a given page within a time window, from its history.
+
+        :param start: The start of the window, in seconds since the epoch. It is rounded down to the start of a bucket,
+            whose size depends on how far back it is.
+        :param end: (optional) The end of the window, in seconds since the epoch. Defaults to now, in which case
+            reactions which are still in the write buffer are counted too.
+
+        :return: A dict in which the reactions are the keys and the counts are the values.
+        """
+        self._check_if_connected()
+        now = end is None
+        if now:
+            end = time.time()
+        reactions = self.backend.reactions_between(self.slug, start, end, self.config.history_retention)
+        if now and self.write_buffer is not None:
+            for reaction, count in self.write_buffer.pending(self.slug).items():
+                reactions[reaction] = reactions.get(reaction, 0) + count
+        return reactions
+
+    async def areactions(self):
+        """Get all reactions for a given page, as a dict, without blocking the event loop.
+
+        :return: A dict in which the reactions are the keys and the counts are the values.
+        """
+        self._check_if_connected()
+        if self.config.counter_shards > 1:
+            slugs = counter_slugs(self.slug, self.config.counter_shards)
+            reactions = self._sum_counters(await asyncio.to_thread(lambda: list(self.backend.iter_many(slugs))))
+        else:
+            reactions = {reaction: count async for reaction, count in self.backend.aiter(self.slug)}
+        if self.write_buffer is not None:
+            for reaction, count in self.write_buffer.pending(self.slug).items():
+                reactions[reaction] = reactions.get(reaction, 0) + count
+        return reactions
+
+    async def aversion(self):
+        """Get the version of the reactions for a given page, without blocking the event loop.
+
+        :return: The version, as an int.
+        """
+        self._check_if_connected()
+        if self.config.counter_shards > 1:
+            slugs = counter_slugs(self.slug, self.config.counter_shards)
+            rows = await asyncio.to_thread(lambda: list(self.backend.iter_many(slugs)))
+            version = sum(count for _, _, count in rows)
+        else:
+            version = await self.backend.aversion(self.slug)
+        if self.write_buffer is not None:
+            version += sum(self.write_buffer.pending(self.slug).values())
+        return version
+
+    async def areact(self, reaction, client=None):
+        """Add a reaction for a given page, without blocking the event loop.
+
+        :param reaction: The reaction to add.
+        :param client: (optional) A string identifying the client. If deduplication is enabled, each client may only
+            make each reaction to the page once.
+
+        :exception DuplicateReactionError: The client has already made this reaction to the page.
 
         :return: The updated reactions, as a dict.
         """
         self._check_if_connected()
         reaction = sanitize_reaction(reaction)[0]
-        self.backend.incr(self.slug, reaction)
-        return self.reactions
+        marked = []
+        if self.config.dedup and client is not None:
+            marked = await asyncio.to_thread(self._mark, client, reaction)
+        if self.write_buffer is not None:
+            self.write_buffer.add(self.slug, reaction)
+            return await self.areactions()
+        reactions = None
+        try:
+            if self.config.counter_shards > 1:
+                await self.backend.aincr(self._counter_slug(), reaction)
+            else:
+                reactions = await self.backend.aincr_and_fetch(self.slug, reaction)
+        except BackendError:
+            await asyncio.to_thread(self._unmark, marked)
+            raise
+        if reactions is None:
+            reactions = await self.areactions()
+        if self.config.history:
+            await asyncio.to_thread(self._record, reaction)
+        return reactions
 
     def __enter__(self):
-        """Enter a conectext manager. This initiates a connection."""
-        self.backend = get_backend(self.config.database_uri)
-        self.backend.__enter__()
+        """Enter a conectext manager. This checks out a connection from the pool."""
+        self.pool = get_pool(
+            self.database_uri,
+            self.config.pool_size,
+            self.config.pool_check_interval,
+            self.config.sqlite_pragmas,
+        )
+        if self.config.write_behind:
+            # pending increments belong to the configured database, even when reading from a replica
+            primary = self.pool
+            if self.database_uri != self.config.database_uri:
+                primary = get_pool(
+                    self.config.database_uri,
+                    self.config.pool_size,
+                    self.config.pool_check_interval,
+                    self.config.sqlite_pragmas,
+                )
+            self.write_buffer = get_write_buffer(
+                primary,
+                self.config.write_behind_interval,
+                self.config.write_behind_max_events,
+                history=self.config.history,
+            )
+        self.backend = self.pool.acquire()
         return self
 
     def __exit__(self, exc_type, exc, traceback):
-        """Exit a conectext manager. This closes the connection."""
+        """Exit a conectext manager. This returns the connection to the pool."""
         if self.backend is None:
             return
-        self.backend.__exit__(exc_type, exc, traceback)
+        if exc_type is not None and issubclass(exc_type, BackendError):
+            self.pool.discard(self.backend)
+        else:
+            self.pool.release(self.backend)
         self.backend = None
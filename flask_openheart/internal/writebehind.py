@@ -0,0 +1,186 @@
+"""A write buffer collects reaction increments in memory and writes them to the backend in batches."""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask_openheart.internal.counts import Counts
+
+logger = logging.getLogger(__name__)
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_write_buffer(pool, interval, max_events, *, history=False):
+    """Get the process-wide write buffer for a given pool, creating it if necessary.
+
+    :param pool: The BackendPool used to write increments to the database.
+    :param interval: The maximum number of milliseconds to hold increments before writing them.
+    :param max_events: The maximum number of increments to hold before writing them.
+    :param history: (optional) Whether to also record the increments in the history, when they are written.
+
+    :return: A WriteBuffer object.
+    """
+    key = (pool, interval, max_events, history)
+    with _buffers_lock:
+        buffer = _buffers.get(key)
+        if buffer is None:
+            buffer = WriteBuffer(pool, interval, max_events, history=history)
+            _buffers[key] = buffer
+    return buffer
+
+
+def flush_write_buffers():
+    """Write all pending increments in every write buffer. This is called automatically at exit."""
+    with _buffers_lock:
+        buffers = list(_buffers.values())
+    for buffer in buffers:
+        buffer.close()
+
+
+def reset_write_buffers():
+    """Forget all write buffers, including their pending increments.
+
+    This is called automatically in a child process after a fork. Any increments pending at the time of the fork belong
+    to the parent process, which remains responsible for writing them.
+    """
+    global _buffers_lock  # noqa: PLW0603 the lock may have been held by another thread at the time of the fork
+    _buffers_lock = threading.Lock()
+    _buffers.clear()
+
+
+atexit.register(flush_write_buffers)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_write_buffers)
+
+
+class WriteBuffer:
+    """Buffers reaction increments in memory, and writes them to the backend in batches from a background thread.
+
+    Increments are written whenever `interval` milliseconds have passed or `max_events` increments are pending,
+    whichever comes first, in a single call to `Backend.incr_many`. If history is enabled, they are then recorded in the
+    history as having been made at the time they are written, in a single call to `Backend.record`.
+    """
+
+    def __init__(self, pool, interval, max_events, *, history=False):
+        """Create a new WriteBuffer instance.
+
+        :param pool: The BackendPool used to write increments to the database.
+        :param interval: The maximum number of milliseconds to hold increments before writing them.
+        :param max_events: The maximum number of increments to hold before writing them.
+        :param history: (optional) Whether to also record the increments in the history, when they are written.
+        """
+        self.pool = pool
+        self.interval = interval
+        self.max_events = max_events
+        self.history = history
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = defaultdict(Counts)
+        self._writing = defaultdict(Counts)
+        self._events = 0
+        self._thread = None
+        self._closed = False
+
+    def _start(self):
+        # a thread which has died, or which belongs to the parent process after a fork, is replaced
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="openheart-write-buffer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval / 1000)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # the thread must keep running whatever the failure, or later increments would never be written
+                logger.exception("Failed to write buffered reactions; they will be retried.")
+
+    def add(self, slug, reaction):
+        """Add an increment to the buffer.
+
+        :param slug: A slug representing the page.
+        :param reaction: The reaction to add.
+        """
+        with self._lock:
+            self._pending[slug].add(reaction)
+            self._events += 1
+            if self._events >= self.max_events:
+                self._wake.set()
+            self._start()
+
+    def pending(self, slug):
+        """Get the increments for a page which have not been written to the backend yet.
+
+        This includes increments which are in the process of being written. While a write is being committed, a
+        reader which has already seen the committed counts may briefly see those increments counted twice.
+
+        :param slug: A slug representing the page.
+
+        :return: A dict in which the reactions are the keys and the pending increments are the values.
+        """
+        with self._lock:
+            pending = Counts(self._writing.get(slug))
+            pending.update(self._pending.get(slug, {}))
+        return pending.as_dict()
+
+    def flush(self):
+        """Write all pending increments to the backend, in a single call to `Backend.incr_many`.
+
+        :exception BackendError: If the write failed. The increments are kept, to be retried by the next flush. The same
+            applies to any other exception raised while writing them.
+        """
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            writing, self._pending = self._pending, defaultdict(Counts)
+            self._writing = writing
+            self._events = 0
+        if not writing:
+            return
+        increments = {(slug, reaction): count for slug, counts in writing.items() for reaction, count in counts.items()}
+        backend = None
+        written = False
+        try:
+            backend = self.pool.acquire()
+            backend.incr_many(increments)
+            written = True
+            if self.history:
+                backend.record(increments, time.time())
+        except Exception:
+            if backend is not None:
+                self.pool.discard(backend)
+            if written:
+                # the increments have already been counted, so retrying them would count them twice
+                logger.exception("Failed to record the history of buffered reactions; it is lost.")
+                return
+            with self._lock:
+                for slug, counts in writing.items():
+                    self._pending[slug].update(counts)
+                    self._events += counts.total()
+            raise
+        else:
+            self.pool.release(backend)
+        finally:
+            with self._lock:
+                self._writing = defaultdict(Counts)
+
+    def close(self):
+        """Stop the background thread, then write any remaining increments."""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,334 @@
+"""Test cases for the ValkeyBackend object."""
+
+import asyncio
+import json
+
+import pytest
+import valkey
+
+from flask_openheart.internal import broadcast
+from flask_openheart.internal.keystore import CHANNEL, ValkeyBackend, ValkeyBroadcaster, ValkeyRateLimiter
+from tests.backend.util import FakeValkey
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """Pytest fixture to replace the Valkey client with an in-process fake.
+
+    Returns:
+        FakeValkey: The fake client returned by `valkey.from_url`.
+    """
+    fake = FakeValkey()
+    monkeypatch.setattr(valkey, "from_url", lambda *_args, **_kwargs: fake)
+    return fake
+
+
+@pytest.fixture
+def backend(fake):
+    """Pytest fixture to easily generate a Valkey backend, backed by an in-process fake, for testing.
+
+    Yields:
+        ValkeyBackend: The Valkey backend object.
+    """
+    with ValkeyBackend("valkey://localhost") as backend:
+        fake.commands.clear()
+        yield backend
+
+
+class TestValkeyBackend:
+    """Test cases for the ValkeyBackend object."""
+
+    def test_incr_hash(self, backend, fake):
+        """Test that incrementing a reaction stores it in a hash for the slug.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        backend.incr("foo", "❤️")
+        backend.incr("foo", "🥨")
+        assert fake.data == {"openheart:foo": {"❤️": "2", "🥨": "1"}, "openheart-version:foo": "3"}
+
+    def test_iter_single_command(self, backend, fake):
+        """Test that iterating the reactions for a slug costs a single command.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        backend.incr("bar", "🥨")
+        fake.commands.clear()
+        assert dict(backend.iter("foo")) == {"❤️": 1}
+        assert fake.commands == ["HGETALL"]
+
+    def test_iter_empty(self, backend):
+        """Test that iterating a slug with no reactions yields nothing.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        """
+        assert list(backend.iter("foo")) == []
+
+    def test_incr_and_fetch(self, backend, fake):
+        """Test that incr_and_fetch increments and reads back the slug in a single transaction.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        backend.incr("foo", "🥨")
+        backend.incr("bar", "❤️")
+        fake.commands.clear()
+        assert backend.incr_and_fetch("foo", "❤️") == {"❤️": 1, "🥨": 1}
+        assert fake.commands == ["EXEC", "HINCRBY", "INCR", "HGETALL"]
+
+    def test_incr_many(self, backend, fake):
+        """Test that incr_many applies increments of any amount, to any number of slugs, in a single transaction.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        fake.commands.clear()
+        backend.incr_many({("foo", "❤️"): 2, ("foo", "🥨"): 3, ("bar", "❤️"): 1})
+        assert fake.commands == ["EXEC", "HINCRBY", "INCR", "HINCRBY", "INCR", "HINCRBY", "INCR"]
+        assert dict(backend.iter("foo")) == {"❤️": 3, "🥨": 3}
+        assert dict(backend.iter("bar")) == {"❤️": 1}
+
+    def test_version(self, backend, fake):
+        """Test that the version of a slug is the total of its counts, and is read with a single command.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        assert backend.version("foo") == 0
+        backend.incr("foo", "❤️")
+        backend.incr_many({("foo", "🥨"): 2})
+        backend.incr_and_fetch("foo", "❤️")
+        fake.commands.clear()
+        assert backend.version("foo") == 4
+        assert fake.commands == ["GET"]
+
+    def test_iter_many(self, backend, fake):
+        """Test that iter_many fetches every requested slug in a single pipeline.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        backend.incr("bar", "🥨")
+        fake.commands.clear()
+        results = sorted(backend.iter_many(["foo", "bar", "missing"]))
+        assert results == [("bar", "🥨", 1), ("foo", "❤️", 1)]
+        assert fake.commands == ["EXEC", "HGETALL", "HGETALL", "HGETALL"]
+
+    def test_migrate(self, backend, fake):
+        """Test that legacy string keys are merged into the hash for their slug.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        fake.set("openheart:foo:❤️", 2)
+        fake.set("openheart:foo:🥨", 3)
+        fake.set("openheart:page:1:❤️", 4)
+        fake.set("unrelated", 5)
+        assert backend.migrate() == 3
+        assert backend.migrate() == 0
+        assert dict(backend.iter("foo")) == {"❤️": 3, "🥨": 3}
+        assert dict(backend.iter("page:1")) == {"❤️": 4}
+        assert backend.version("foo") == 6
+        assert backend.version("page:1") == 4
+        assert fake.data["unrelated"] == "5"
+        assert set(fake.data) == {
+            "openheart:foo",
+            "openheart:page:1",
+            "openheart-version:foo",
+            "openheart-version:page:1",
+            "unrelated",
+        }
+
+    def test_mark(self, backend, fake):
+        """Test that marking bits reports whether any of them were new, in a single transaction.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        assert backend.mark("foo", [1, 9], 64)
+        assert fake.commands == ["EXEC", "SETBIT", "SETBIT"]
+        assert not backend.mark("foo", [1, 9], 64)
+        assert backend.mark("foo", [1, 10], 64)
+        assert backend.mark("bar", [1, 9], 64)
+        assert "openheart-seen:foo" in fake.data
+
+    def test_unmark(self, backend, fake):
+        """Test that unmarking clears only the given bits, in a single transaction.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        assert backend.mark("foo", [1, 9], 64) == [1, 9]
+        assert backend.mark("foo", [9, 10], 64) == [10]
+        fake.commands.clear()
+        backend.unmark("foo", [10], 64)
+        assert fake.commands == ["EXEC", "SETBIT"]
+        assert backend.mark("foo", [1, 9, 10], 64) == [10]
+
+    def test_slugs_pop(self, backend, fake):
+        """Test that pages can be listed, and removed along with their version and deduplication filter.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        backend.incr_many({("foo", "❤️"): 2, ("page:1", "❤️"): 1})
+        backend.mark("foo", [1], 64)
+        fake.set("openheart:legacy:❤️", 1)
+        assert sorted(backend.slugs()) == ["foo", "page:1"]
+        fake.commands.clear()
+        assert backend.pop("foo") == {"❤️": 2}
+        assert fake.commands == ["EXEC", "HGETALL", "DEL"]
+        assert set(fake.data) == {"openheart:page:1", "openheart-version:page:1", "openheart:legacy:❤️"}
+
+    def test_async(self, backend, fake):
+        """Test that the asyncio methods use the pooled client, with the same commands as the blocking ones.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+
+        async def run():
+            await backend.aincr("foo", "🥨")
+            fake.commands.clear()
+            reactions = await backend.aincr_and_fetch("foo", "❤️")
+            assert fake.commands == ["EXEC", "HINCRBY", "INCR", "HGETALL"]
+            return reactions, [row async for row in backend.aiter("foo")], await backend.aversion("foo")
+
+        reactions, rows, version = asyncio.run(run())
+        assert reactions == {"❤️": 1, "🥨": 1}
+        assert sorted(rows) == [("❤️", 1), ("🥨", 1)]
+        assert version == 2
+        assert dict(backend.iter("foo")) == reactions
+
+    def test_history(self, backend, fake):
+        """Test that history is recorded per minute, indexed per page, and read with two round trips.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        now = 1_700_000_000
+        minute = now - now % 60
+        backend.record({("foo", "❤️"): 2, ("foo", "🥨"): 1}, now - 120)
+        backend.record({("foo", "❤️"): 1}, now)
+        assert fake.data[f"openheart-history:60:{minute}:foo"] == {"❤️": "1"}
+        fake.commands.clear()
+        assert sorted(backend.history("foo", 60, minute - 60, minute + 60)) == [(minute, "❤️", 1)]
+        assert fake.commands == ["ZRANGEBYSCORE", "EXEC", "HGETALL"]
+        retention = ((60, 3600), (3600, 86400), (86400, None))
+        assert backend.reactions_between("foo", now - 180, now + 1, retention) == {"❤️": 3, "🥨": 1}
+
+    def test_compact(self, backend, fake):
+        """Test that compaction rolls up complete buckets once per page, then removes those past their retention period.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        now = 1_700_000_000
+        retention = ((60, 3600), (3600, 86400), (86400, None))
+        for offset in range(0, 3 * 86400, 600):
+            backend.record({("foo", "❤️"): 1, ("bar", "🥨"): 1}, now - offset)
+        backend.compact(now + 1, retention)
+        backend.compact(now + 1, retention)
+        assert backend.reactions_between("foo", 0, now + 1, retention) == {"❤️": 432}
+        assert backend.reactions_between("bar", now - 300, now + 1, retention) == {"🥨": 1}
+        assert backend.rolled_up("foo", 86400) == now - now % 86400
+        minutes = fake.zrangebyscore("openheart-history-index:60:foo", "-inf", "+inf")
+        assert min(int(minute) for minute in minutes) >= now - 3600 - 60
+        assert not any(
+            key.startswith("openheart-history:60:") and int(key.split(":")[2]) < now - 3660 for key in fake.data
+        )
+
+    def test_compact_overlapping(self, backend, monkeypatch):
+        """Test that two compactions of the same page at once roll each bucket up only once.
+
+        :param backend: The Valkey backend (supplied by fixture).
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        now = 1_700_000_000
+        retention = ((60, 3600), (3600, 86400), (86400, None))
+        for offset in range(0, 2 * 86400, 600):
+            backend.record({("foo", "❤️"): 1}, now - offset)
+        other = ValkeyBackend("valkey://localhost")
+        other.connect("valkey://localhost")
+        history = backend.history
+
+        def overlapping_history(*args):
+            # the other compaction finishes while this one is reading the buckets to roll up
+            if not other.rolled_up("foo", 3600):
+                other.compact(now + 1, retention)
+            return history(*args)
+
+        monkeypatch.setattr(backend, "history", overlapping_history)
+        backend.compact(now + 1, retention)
+        assert backend.reactions_between("foo", 0, now + 1, retention) == {"❤️": 288}
+
+
+class TestValkeyBroadcaster:
+    """Test cases for the ValkeyBroadcaster object."""
+
+    def test_publish(self, fake):
+        """Test that publishing delivers locally and publishes to the server.
+
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        broadcaster = ValkeyBroadcaster("valkey://localhost")
+        received = []
+        broadcaster.deliver = received.append
+        broadcaster.publish("foo", {"❤️": 1})
+        message = {"origin": broadcast.ORIGIN, "slug": "foo", "reactions": {"❤️": 1}}
+        assert received == [message]
+        assert fake.published == [(CHANNEL, json.dumps(message))]
+
+    @pytest.mark.usefixtures("fake")
+    def test_receive(self):
+        """Test that messages received from the server are delivered, unless they were published by this process."""
+        broadcaster = ValkeyBroadcaster("valkey://localhost")
+        received = []
+        broadcaster.deliver = received.append
+        message = {"origin": broadcast.ORIGIN, "slug": "foo", "reactions": {"❤️": 1}}
+        broadcaster.receive(json.dumps(message))
+        assert received == []
+        message["origin"] = "other"
+        broadcaster.receive(json.dumps(message))
+        assert received == [message]
+
+
+class TestValkeyRateLimiter:
+    """Test cases for the ValkeyRateLimiter object."""
+
+    def test_limit(self, fake):
+        """Test that reactions are counted in a single expiring key per window, client and page.
+
+        :param fake: The fake Valkey client (supplied by fixture).
+        """
+        limiter = ValkeyRateLimiter("valkey://localhost", 2, 60)
+        assert limiter.hit("client", "foo") == 0
+        assert fake.commands == ["EXEC", "INCR", "EXPIRE"]
+        assert limiter.hit("client", "foo") == 0
+        assert limiter.hit("other", "foo") == 0
+        assert 0 < limiter.hit("client", "foo") <= 60
+        keys = [key for key in fake.data if key.endswith(":client:foo")]
+        assert len(keys) == 1
+        assert fake.expiry[keys[0]] == 60
+
+    def test_unavailable(self, fake, monkeypatch):
+        """Test that reactions are allowed when the server cannot be reached.
+
+        :param fake: The fake Valkey client (supplied by fixture).
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+
+        def fail(*_args):
+            raise valkey.exceptions.ConnectionError
+
+        monkeypatch.setattr(fake, "incr", fail)
+        limiter = ValkeyRateLimiter("valkey://localhost", 1, 60)
+        assert limiter.hit("client", "foo") == 0
+        assert limiter.hit("client", "foo") == 0
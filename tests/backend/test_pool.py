@@ -0,0 +1,120 @@
+"""Test cases for the BackendPool object."""
+
+import os
+import threading
+
+import pytest
+
+from flask_openheart.internal.pool import BackendPool, get_pool, reset_pools
+
+
+@pytest.fixture
+def pool():
+    """Pytest fixture to easily generate a pool of in-memory SQLite backends for testing.
+
+    Yields:
+        BackendPool: The pool object.
+    """
+    pool = BackendPool("file::memory:", 2, 30)
+    yield pool
+    pool.close()
+
+
+class TestBackendPool:
+    """Test cases for the BackendPool object."""
+
+    def test_acquire_connects(self, pool):
+        """Test that acquired backends are connected.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        backend = pool.acquire()
+        assert backend.is_connected()
+        pool.release(backend)
+
+    def test_release_reuses(self, pool):
+        """Test that a released backend is reused by the next acquire.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        backend = pool.acquire()
+        backend.incr("foo", "❤️")
+        pool.release(backend)
+        other = pool.acquire()
+        assert other is backend
+        assert dict(other.iter("foo")) == {"❤️": 1}
+        pool.release(other)
+
+    def test_size_limit(self, pool):
+        """Test that the pool closes connections instead of keeping more than `size` of them idle.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        backends = [pool.acquire() for _ in range(3)]
+        for backend in backends:
+            pool.release(backend)
+        assert [backend.is_connected() for backend in backends] == [True, True, False]
+
+    def test_unhealthy_discarded(self, pool):
+        """Test that a connection which fails its health check is replaced.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        pool.check_interval = 0
+        backend = pool.acquire()
+        pool.release(backend)
+        backend.connection.close()
+        other = pool.acquire()
+        assert other is not backend
+        assert other.ping()
+        pool.release(other)
+
+    def test_per_thread(self, pool):
+        """Test that SQLite connections are never shared between threads.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        backend = pool.acquire()
+        pool.release(backend)
+        acquired = []
+
+        def target():
+            other = pool.acquire()
+            acquired.append(other)
+            pool.release(other)
+            pool.close()
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        assert acquired[0] is not backend
+
+    def test_fork_resets(self, pool, monkeypatch):
+        """Test that connections inherited from a parent process are not reused.
+
+        :param pool: The backend pool (supplied by fixture).
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        backend = pool.acquire()
+        pool.release(backend)
+        monkeypatch.setattr(os, "getpid", lambda: -1)
+        other = pool.acquire()
+        assert other is not backend
+
+    def test_get_pool_shared(self):
+        """Test that pools are shared per-process by database URI, and forgotten after a fork."""
+        pool = get_pool("file::memory:", 2, 30)
+        assert get_pool("file::memory:", 2, 30) is pool
+        reset_pools()
+        assert get_pool("file::memory:", 2, 30) is not pool
+
+    def test_pragmas(self, tmp_path):
+        """Test that the pool applies its pragmas to new connections.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        pool = BackendPool(f"file:{tmp_path / 'openheart.db'}", 2, 30, (("journal_mode", "WAL"),))
+        backend = pool.acquire()
+        assert backend.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        pool.release(backend)
+        pool.close()
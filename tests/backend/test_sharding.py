@@ -0,0 +1,169 @@
+"""Test cases for the ShardedBackend object."""
+
+import logging
+
+import pytest
+import valkey
+
+from flask_openheart.internal import get_backend
+from flask_openheart.internal.backend import BackendError
+from flask_openheart.internal.sharding import HashRing, ShardedBackend, rebalance
+from flask_openheart.internal.sqlite import SqliteBackend
+from tests.backend.util import FakeValkey
+
+
+@pytest.fixture
+def uris(tmp_path):
+    """Pytest fixture to generate the URIs of three SQLite shards.
+
+    Returns:
+        list: The database URIs.
+    """
+    return [f"file:{tmp_path / f'shard{i}.db'}" for i in range(3)]
+
+
+class TestHashRing:
+    """Test cases for the HashRing object."""
+
+    def test_node_for(self):
+        """Test that keys are assigned to nodes stably and roughly evenly."""
+        ring = HashRing(["a", "b", "c"])
+        keys = [f"page.{i}" for i in range(3000)]
+        assignments = [ring.node_for(key) for key in keys]
+        assert assignments == [HashRing(["c", "b", "a"]).node_for(key) for key in keys]
+        for node in ("a", "b", "c"):
+            assert 600 < assignments.count(node) < 1400
+
+    def test_add_node(self):
+        """Test that adding a node only moves keys to the new node, and only about 1/N of them."""
+        keys = [f"page.{i}" for i in range(3000)]
+        before = HashRing(["a", "b", "c"])
+        after = HashRing(["a", "b", "c", "d"])
+        moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+        assert all(after.node_for(key) == "d" for key in moved)
+        assert 450 < len(moved) < 1050
+
+    def test_invalid(self):
+        """Test that a ring needs at least one node, and no duplicates."""
+        with pytest.raises(RuntimeError):
+            HashRing([])
+        with pytest.raises(RuntimeError):
+            HashRing(["a", "a"])
+
+
+class TestShardedBackend:
+    """Test cases for the ShardedBackend object."""
+
+    def test_get_backend(self, uris):
+        """Test that a list of URIs gets a sharded backend.
+
+        :param uris: The shard URIs (supplied by fixture).
+        """
+        backend = get_backend(uris)
+        assert isinstance(backend, ShardedBackend)
+        assert backend.thread_bound
+
+    def test_routing(self, uris):
+        """Test that every operation on a page goes to the page's shard, and only to it.
+
+        :param uris: The shard URIs (supplied by fixture).
+        """
+        with ShardedBackend(uris) as backend:
+            slugs = [f"page.{i}" for i in range(20)]
+            for slug in slugs:
+                backend.incr(slug, "❤️")
+                assert backend.incr_and_fetch(slug, "🥨") == {"❤️": 1, "🥨": 1}
+            backend.incr_many({(slug, "❤️"): 2 for slug in slugs})
+            for slug in slugs:
+                shard = backend.shard_for(slug)
+                assert dict(shard.iter(slug)) == {"❤️": 3, "🥨": 1}
+                assert backend.version(slug) == 4
+                others = [other for other in backend.shards.values() if other is not shard]
+                assert all(dict(other.iter(slug)) == {} for other in others)
+            assert sorted(slug for slug, _, _ in backend.iter_many(slugs)) == sorted(slugs * 2)
+            assert sorted(backend.slugs()) == sorted(slugs)
+            assert len({backend.ring.node_for(slug) for slug in slugs}) == 3
+
+    def test_history(self, uris):
+        """Test that the history of each page is recorded in, compacted in and read from the page's shard.
+
+        :param uris: The shard URIs (supplied by fixture).
+        """
+        retention = ((60, 3600), (3600, 86400), (86400, None))
+        now = 1_700_000_000
+        with ShardedBackend(uris) as backend:
+            slugs = [f"page.{i}" for i in range(20)]
+            backend.record({(slug, "❤️"): 1 for slug in slugs}, now - 7200)
+            backend.compact(now, retention)
+            for slug in slugs:
+                assert backend.reactions_between(slug, now - 10800, now, retention) == {"❤️": 1}
+                assert backend.rolled_up(slug, 3600) == now - now % 3600
+                others = [other for other in backend.shards.values() if other is not backend.shard_for(slug)]
+                assert all(other.reactions_between(slug, 0, now, retention) == {} for other in others)
+
+    def test_iter_many_parallel(self, monkeypatch):
+        """Test that shards which are not thread-bound are queried in parallel, once each.
+
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        fakes = {}
+        monkeypatch.setattr(valkey, "from_url", lambda uri, **_kwargs: fakes.setdefault(uri, FakeValkey()))
+        uris = [f"valkey://10.0.0.{i}" for i in range(3)]
+        with ShardedBackend(uris) as backend:
+            assert not backend.thread_bound
+            slugs = [f"page.{i}" for i in range(20)]
+            backend.incr_many({(slug, "❤️"): 1 for slug in slugs})
+            for fake in fakes.values():
+                fake.commands.clear()
+            assert sorted(slug for slug, _, _ in backend.iter_many(slugs)) == sorted(slugs)
+            assert all(fake.commands.count("EXEC") == 1 for fake in fakes.values())
+
+    def test_rebalance(self, uris):
+        """Test that rebalancing moves pages to their shards after a shard is added, without losing reactions.
+
+        :param uris: The shard URIs (supplied by fixture).
+        """
+        slugs = [f"page.{i}" for i in range(50)]
+        with ShardedBackend(uris[:2]) as backend:
+            backend.incr_many({(slug, "❤️"): i + 1 for i, slug in enumerate(slugs)})
+        moved = rebalance(uris)
+        assert 0 < moved < len(slugs)
+        assert rebalance(uris) == 0
+        with ShardedBackend(uris) as backend:
+            for i, slug in enumerate(slugs):
+                assert dict(backend.shard_for(slug).iter(slug)) == {"❤️": i + 1}
+                assert backend.version(slug) == i + 1
+            assert sorted(backend.slugs()) == sorted(slugs)
+
+    def test_rebalance_drain(self, uris):
+        """Test that rebalancing moves every page off a drained shard.
+
+        :param uris: The shard URIs (supplied by fixture).
+        """
+        slugs = [f"page.{i}" for i in range(50)]
+        with ShardedBackend(uris) as backend:
+            backend.incr_many({(slug, "❤️"): 1 for slug in slugs})
+        rebalance(uris[:2], drain=uris[2:])
+        with get_backend(uris[2]) as drained:
+            assert list(drained.slugs()) == []
+        with ShardedBackend(uris[:2]) as backend:
+            assert {slug: dict(backend.iter(slug)) for slug in slugs} == {slug: {"❤️": 1} for slug in slugs}
+
+    def test_rebalance_failed(self, uris, monkeypatch, caplog):
+        """Test that a page which cannot be moved or put back has its reactions logged, rather than silently lost.
+
+        :param uris: The shard URIs (supplied by fixture).
+        :param monkeypatch: The pytest monkeypatch fixture.
+        :param caplog: The pytest log capture fixture.
+        """
+        with get_backend(uris[1]) as backend:
+            backend.incr_many({("page", "❤️"): 3})
+
+        def incr_many(*_):
+            raise BackendError
+
+        monkeypatch.setattr(SqliteBackend, "incr_many", incr_many)
+        with caplog.at_level(logging.ERROR), pytest.raises(BackendError):
+            rebalance(uris[:1], drain=uris[1:])
+        assert "'page'" in caplog.text
+        assert "{'❤️': 3}" in caplog.text
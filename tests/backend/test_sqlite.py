@@ -1,13 +1,18 @@
 """Test cases for the SQLiteBackend object."""
 
+import asyncio
+import multiprocessing
+import sqlite3
+
 import pytest
 
-from flask_openheart.internal.sqlite import SqliteBackend
+from flask_openheart.internal import BackendError, history, sqlite
+from flask_openheart.internal.sqlite import SCHEMA_VERSION, SqliteBackend
 
 
 def _table_exists(conn):
     cursor = conn.cursor()
-    query = 'SELECT name FROM sqlite_master WHERE type="table" AND name="openheart"'
+    query = 'SELECT name FROM sqlite_master WHERE type IN ("table", "view") AND name="openheart"'
     result = cursor.execute(query)
     return result.fetchone() is not None
 
@@ -24,6 +29,18 @@ def _get_table(conn):
     return [dict(zip(keys, row, strict=False)) for row in result.fetchall()]
 
 
+def _react_many(path, count):
+    pragmas = (("busy_timeout", 10000), ("journal_mode", "WAL"), ("synchronous", "NORMAL"))
+    with SqliteBackend(path, pragmas=pragmas) as backend:
+        for _ in range(count):
+            backend.incr_and_fetch("foo", "❤️")
+            dict(backend.iter("foo"))
+
+
+NOW = 1_700_000_000
+RETENTION = ((history.MINUTE, history.HOUR), (history.HOUR, history.DAY), (history.DAY, None))
+
+
 @pytest.fixture
 def backend():
     """Pytest fixture to easily generate an in-memory SQLite backend for testing.
@@ -39,27 +56,47 @@ def backend():
 class TestSqliteBackend:
     """Test cases for the SQLiteBackend object."""
 
-    def test_iter_no_create_table(self, backend):
-        """Test that iterating on an empty database does not create a table.
+    def test_connect_create_table(self, backend):
+        """Test that connecting to an empty database creates the table.
 
         :param backend: The SQLite backend (supplied by fixture).
         """
-        slug = "foo"
-        assert not _table_exists(backend.connection)
-        results = list(backend.iter(slug))
-        assert len(results) == 0
-        assert not _table_exists(backend.connection)
+        assert _table_exists(backend.connection)
 
-    def test_incr_create_table(self, backend):
-        """Test that incrementing a reaction on an empty database creates a table.
+    def test_connect_schema_version(self, backend):
+        """Test that connecting to an empty database records the current schema version.
 
         :param backend: The SQLite backend (supplied by fixture).
         """
-        slug = "foo"
-        reaction = "❤️"
-        assert not _table_exists(backend.connection)
-        backend.incr(slug, reaction)
-        assert _table_exists(backend.connection)
+        assert backend.schema_version() == SCHEMA_VERSION
+
+    def test_migrate_idempotent(self, backend):
+        """Test that migrating an up-to-date database leaves the data alone.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        backend.migrate()
+        assert dict(backend.iter("foo")) == {"❤️": 1}
+        assert backend.schema_version() == SCHEMA_VERSION
+
+    def test_migrate_unversioned(self, tmp_path):
+        """Test that a database created before schema versioning keeps its reactions.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        path = tmp_path / "openheart.db"
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE openheart (slug TEXT, reaction TEXT, count INT DEFAULT 1, PRIMARY KEY (slug, reaction))"
+        )
+        conn.execute("INSERT INTO openheart (slug, reaction, count) VALUES ('foo', '❤️', 5)")
+        conn.commit()
+        conn.close()
+        with SqliteBackend(str(path)) as backend:
+            assert backend.schema_version() == SCHEMA_VERSION
+            assert dict(backend.iter("foo")) == {"❤️": 5}
+            assert backend.version("foo") == 5
 
     def test_incr_performs_insert(self, backend):
         """Test that incrementing a reaction on an empty database causes it to be inserted into the database.
@@ -146,3 +183,240 @@ class TestSqliteBackend:
         results = dict(backend.iter(other_slug))
         assert len(results) == 2
         assert results[reaction] == 1
+
+    def test_incr_and_fetch(self, backend):
+        """Test that incr_and_fetch increments the reaction and returns all reactions for the slug.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        slug = "foo"
+        backend.incr(slug, "🥨")
+        backend.incr("bar", "❤️")
+        assert backend.incr_and_fetch(slug, "❤️") == {"❤️": 1, "🥨": 1}
+        assert backend.incr_and_fetch(slug, "❤️") == {"❤️": 2, "🥨": 1}
+        assert not backend.connection.in_transaction
+
+    def test_incr_many(self, backend):
+        """Test that incr_many applies increments of any amount, to any number of slugs.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        backend.incr_many({("foo", "❤️"): 2, ("foo", "🥨"): 3, ("bar", "❤️"): 1})
+        assert dict(backend.iter("foo")) == {"❤️": 3, "🥨": 3}
+        assert dict(backend.iter("bar")) == {"❤️": 1}
+
+    def test_iter_many(self, backend):
+        """Test that iter_many yields the reactions for every requested slug, and only those slugs.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        backend.incr("bar", "🥨")
+        backend.incr("baz", "❤️")
+        results = sorted(backend.iter_many(["foo", "bar", "missing"]))
+        assert results == [("bar", "🥨", 1), ("foo", "❤️", 1)]
+
+    def test_iter_many_chunks(self, backend, monkeypatch):
+        """Test that iter_many splits large queries to stay within SQLite's variable limit.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        monkeypatch.setattr(sqlite, "MAX_VARIABLES", 2)
+        slugs = [f"page.{i}" for i in range(5)]
+        backend.incr_many({(slug, "❤️"): 1 for slug in slugs})
+        assert sorted(slug for slug, _, _ in backend.iter_many(slugs)) == slugs
+
+    def test_version(self, backend):
+        """Test that the version of a slug is the total of its counts, however they were incremented.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        assert backend.version("foo") == 0
+        backend.incr("foo", "❤️")
+        backend.incr_many({("foo", "🥨"): 2, ("bar", "❤️"): 1})
+        backend.incr_and_fetch("foo", "❤️")
+        assert backend.version("foo") == 4
+        assert backend.version("bar") == 1
+
+    def test_mark(self, backend):
+        """Test that marking bits reports whether any of them were new, separately for each slug.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        assert backend.mark("foo", [1, 9], 64)
+        assert not backend.mark("foo", [1, 9], 64)
+        assert backend.mark("foo", [1, 10], 64)
+        assert backend.mark("bar", [1, 9], 64)
+        assert backend.mark("foo", [1, 9], 128)
+
+    def test_unmark(self, backend):
+        """Test that unmarking clears only the given bits, so they can be marked again.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        assert backend.mark("foo", [1, 9], 64) == [1, 9]
+        assert backend.mark("foo", [9, 10], 64) == [10]
+        backend.unmark("foo", [10], 64)
+        assert backend.mark("foo", [1, 9, 10], 64) == [10]
+        backend.unmark("foo", [1], 128)
+        assert not backend.mark("foo", [1], 64)
+
+    def test_interning(self, backend):
+        """Test that each slug and reaction is stored once, and counts refer to them by id.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.incr_many({("foo", "❤️"): 2, ("bar", "❤️"): 1, ("foo", "🥨"): 1})
+        backend.incr_and_fetch("bar", "🥨")
+        cursor = backend.connection.cursor()
+        assert cursor.execute("SELECT COUNT(*) FROM openheart_slug").fetchone()[0] == 2
+        assert cursor.execute("SELECT COUNT(*) FROM openheart_reaction").fetchone()[0] == 2
+        counts = cursor.execute("SELECT slug_id, reaction_id, count FROM openheart_count").fetchall()
+        assert all(isinstance(slug_id, int) and isinstance(reaction_id, int) for slug_id, reaction_id, _ in counts)
+        assert sorted(count for _, _, count in counts) == [1, 1, 1, 2]
+        assert dict(backend.iter("foo")) == {"❤️": 2, "🥨": 1}
+
+    def test_interning_cached(self, backend):
+        """Test that ids are cached, so that incrementing a known slug and reaction is a single statement.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        statements = []
+        backend.connection.set_trace_callback(statements.append)
+        backend.incr("foo", "❤️")
+        assert backend.incr_and_fetch("foo", "❤️") == {"❤️": 3}
+        backend.connection.set_trace_callback(None)
+        assert not [statement for statement in statements if "INTO openheart_slug" in statement]
+        assert not [statement for statement in statements if "openheart_reaction WHERE" in statement]
+        assert backend.pop("foo") == {"❤️": 3}
+        backend.incr("foo", "❤️")
+        assert dict(backend.iter("foo")) == {"❤️": 1}
+        assert backend.version("foo") == 1
+
+    def test_pragmas(self, tmp_path):
+        """Test that pragmas are applied whenever a connection is made.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        pragmas = (("busy_timeout", 1234), ("journal_mode", "WAL"), ("synchronous", "NORMAL"), ("cache_size", -4096))
+        with SqliteBackend(str(tmp_path / "openheart.db"), pragmas=pragmas) as backend:
+            assert backend.connection.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+            assert backend.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert backend.connection.execute("PRAGMA synchronous").fetchone()[0] == 1
+            assert backend.connection.execute("PRAGMA cache_size").fetchone()[0] == -4096
+
+    def test_pragmas_invalid(self, tmp_path):
+        """Test that unsupported pragmas and malformed values are rejected.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        path = str(tmp_path / "openheart.db")
+        with pytest.raises(BackendError):
+            SqliteBackend(path, pragmas=(("writable_schema", 1),)).__enter__()
+        with pytest.raises(BackendError):
+            SqliteBackend(path, pragmas=(("journal_mode", "WAL; DROP TABLE openheart_count"),)).__enter__()
+
+    @pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="requires fork")
+    def test_contention(self, tmp_path):
+        """Test that several processes can read and write the same database at once without losing reactions.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        path = str(tmp_path / "openheart.db")
+        with SqliteBackend(path):
+            pass  # create the schema up front, so that the workers only contend over reactions
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=_react_many, args=(path, 200)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+        with SqliteBackend(path) as backend:
+            assert dict(backend.iter("foo")) == {"❤️": 800}
+            assert backend.version("foo") == 800
+
+    def test_slugs_pop(self, backend):
+        """Test that pages can be listed, and removed along with their version and deduplication filter.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.incr_many({("foo", "❤️"): 2, ("foo", "🥨"): 1, ("bar", "❤️"): 1})
+        backend.mark("foo", [1], 64)
+        assert sorted(backend.slugs()) == ["bar", "foo"]
+        assert backend.pop("foo") == {"❤️": 2, "🥨": 1}
+        assert backend.pop("foo") == {}
+        assert list(backend.slugs()) == ["bar"]
+        assert backend.version("foo") == 0
+        assert backend.mark("foo", [1], 64)
+        assert dict(backend.iter("bar")) == {"❤️": 1}
+
+    def test_pop_keeps_history(self, backend):
+        """Test that removing the reactions for a page keeps its history.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.incr("foo", "❤️")
+        backend.record({("foo", "❤️"): 1}, NOW)
+        assert backend.pop("foo") == {"❤️": 1}
+        assert list(backend.slugs()) == []
+        assert backend.version("foo") == 0
+        assert backend.reactions_between("foo", NOW - 60, NOW + 60, RETENTION) == {"❤️": 1}
+
+    def test_history(self, backend):
+        """Test that reactions are recorded per minute, and counted within a window with an index range scan.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        backend.record({("foo", "❤️"): 2, ("foo", "🥨"): 1, ("bar", "❤️"): 5}, NOW - 120)
+        backend.record({("foo", "❤️"): 1}, NOW)
+        assert sorted(backend.history("foo", history.MINUTE, 0, NOW + 60)) == [
+            (history.bucket(NOW - 120, history.MINUTE), "❤️", 2),
+            (history.bucket(NOW - 120, history.MINUTE), "🥨", 1),
+            (history.bucket(NOW, history.MINUTE), "❤️", 1),
+        ]
+        assert backend.reactions_between("foo", NOW - 60, NOW + 1, RETENTION) == {"❤️": 1}
+        assert backend.reactions_between("foo", NOW - 180, NOW + 1, RETENTION) == {"❤️": 3, "🥨": 1}
+        plan = backend.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT count FROM openheart_history WHERE slug_id=1 AND resolution=60 AND bucket>=0"
+        ).fetchall()
+        assert "USING PRIMARY KEY" in plan[0][3]
+
+    def test_compact(self, backend):
+        """Test that compaction rolls up complete buckets once, then removes those past their retention period.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+        for offset in range(0, 3 * history.DAY, 600):
+            backend.record({("foo", "❤️"): 1}, NOW - offset)
+        total = {"❤️": 3 * history.DAY // 600}
+        now = NOW + 1
+        assert backend.reactions_between("foo", 0, now, RETENTION) == total
+        backend.compact(now, RETENTION)
+        backend.compact(now, RETENTION)
+        assert backend.rolled_up("foo", history.HOUR) == history.bucket(now - history.ROLLUP_DELAY, history.HOUR)
+        assert backend.rolled_up("foo", history.DAY) == history.bucket(now, history.DAY)
+        oldest_minute = min(bucket for bucket, _, _ in backend.history("foo", history.MINUTE, 0, now))
+        assert oldest_minute >= history.bucket(now - history.HOUR, history.MINUTE)
+        assert backend.reactions_between("foo", 0, now, RETENTION) == total
+        assert backend.reactions_between("foo", now - 300, now, RETENTION) == {"❤️": 1}
+
+    def test_async(self, backend):
+        """Test that the asyncio methods run the queries in worker threads, on the same connection.
+
+        :param backend: The SQLite backend (supplied by fixture).
+        """
+
+        async def run():
+            await backend.aincr("foo", "🥨")
+            reactions = await backend.aincr_and_fetch("foo", "❤️")
+            return reactions, [row async for row in backend.aiter("foo")], await backend.aversion("foo")
+
+        reactions, rows, version = asyncio.run(run())
+        assert reactions == {"❤️": 1, "🥨": 1}
+        assert sorted(rows) == [("❤️", 1), ("🥨", 1)]
+        assert version == 2
+        assert dict(backend.iter("foo")) == reactions
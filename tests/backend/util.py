@@ -0,0 +1,246 @@
+"""Utilities for backend tests."""
+
+import copy
+import fnmatch
+
+import valkey
+
+
+class _SortedSet(dict):
+    """The members of a sorted set, mapped to their scores."""
+
+
+def _score_bound(bound):
+    if bound == "-inf":
+        return float("-inf"), False
+    if bound == "+inf":
+        return float("inf"), False
+    if isinstance(bound, str) and bound.startswith("("):
+        return float(bound[1:]), True
+    return float(bound), False
+
+
+def _in_range(score, low, high):
+    (low, low_exclusive), (high, high_exclusive) = _score_bound(low), _score_bound(high)
+    above = score > low if low_exclusive else score >= low
+    below = score < high if high_exclusive else score <= high
+    return above and below
+
+
+class FakeValkey:
+    """A minimal in-process stand-in for a `valkey.Valkey` client, supporting only the commands OpenHeart uses.
+
+    Values are stored as strings, as if the client were created with `decode_responses=True`.
+    """
+
+    def __init__(self):
+        """Create a new, empty FakeValkey instance."""
+        self.data = {}
+        self.commands = []
+        self.published = []
+        self.expiry = {}
+
+    def _check_type(self, key, kind):
+        if key in self.data and not isinstance(self.data[key], kind):
+            msg = "WRONGTYPE Operation against a key holding the wrong kind of value"
+            raise valkey.exceptions.ResponseError(msg)
+
+    def close(self):
+        """Close the fake connection."""
+
+    def ping(self):
+        """Check the fake connection."""
+        self.commands.append("PING")
+        return True
+
+    def publish(self, channel, message):
+        """Publish a message to a channel."""
+        self.commands.append("PUBLISH")
+        self.published.append((channel, message))
+        return 0
+
+    def type(self, key):
+        """Get the type of the value stored at a key."""
+        self.commands.append("TYPE")
+        value = self.data.get(key)
+        if value is None:
+            return "none"
+        if isinstance(value, _SortedSet):
+            return "zset"
+        return "hash" if isinstance(value, dict) else "string"
+
+    def get(self, key):
+        """Get the value of a string key."""
+        self.commands.append("GET")
+        self._check_type(key, str)
+        return self.data.get(key)
+
+    def set(self, key, value):
+        """Set the value of a string key."""
+        self.commands.append("SET")
+        self.data[key] = str(value)
+        return True
+
+    def incr(self, key, amount=1):
+        """Increment the value of a string key."""
+        self.commands.append("INCR")
+        self._check_type(key, str)
+        value = int(self.data.get(key, 0)) + amount
+        self.data[key] = str(value)
+        return value
+
+    def expire(self, key, seconds):
+        """Set a timeout on a key (recorded, but never enforced)."""
+        self.commands.append("EXPIRE")
+        self.expiry[key] = seconds
+        return key in self.data
+
+    def setbit(self, key, offset, value):
+        """Set a bit of a string key, returning its previous value."""
+        self.commands.append("SETBIT")
+        bits = self.data.setdefault(key, bytearray())
+        index, shift = divmod(offset, 8)
+        if len(bits) <= index:
+            bits.extend(bytes(index + 1 - len(bits)))
+        mask = 0x80 >> shift
+        previous = int(bool(bits[index] & mask))
+        bits[index] = bits[index] | mask if value else bits[index] & ~mask
+        return previous
+
+    def delete(self, *keys):
+        """Delete keys."""
+        self.commands.append("DEL")
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def hincrby(self, key, field, amount=1):
+        """Increment a field of a hash key."""
+        self.commands.append("HINCRBY")
+        self._check_type(key, dict)
+        fields = self.data.setdefault(key, {})
+        value = int(fields.get(field, 0)) + amount
+        fields[field] = str(value)
+        return value
+
+    def hget(self, key, field):
+        """Get a field of a hash key."""
+        self.commands.append("HGET")
+        self._check_type(key, dict)
+        return self.data.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        """Set a field of a hash key."""
+        self.commands.append("HSET")
+        self._check_type(key, dict)
+        fields = self.data.setdefault(key, {})
+        added = field not in fields
+        fields[field] = str(value)
+        return int(added)
+
+    def zadd(self, key, mapping):
+        """Add members to a sorted set key."""
+        self.commands.append("ZADD")
+        self._check_type(key, _SortedSet)
+        members = self.data.setdefault(key, _SortedSet())
+        added = sum(str(member) not in members for member in mapping)
+        members.update({str(member): float(score) for member, score in mapping.items()})
+        return added
+
+    def zrangebyscore(self, key, low, high):
+        """Get the members of a sorted set key within a range of scores, ordered by score."""
+        self.commands.append("ZRANGEBYSCORE")
+        self._check_type(key, _SortedSet)
+        members = self.data.get(key, _SortedSet())
+        return [
+            member for member, score in sorted(members.items(), key=lambda item: item[1]) if _in_range(score, low, high)
+        ]
+
+    def zremrangebyscore(self, key, low, high):
+        """Remove the members of a sorted set key within a range of scores."""
+        self.commands.append("ZREMRANGEBYSCORE")
+        self._check_type(key, _SortedSet)
+        members = self.data.get(key, _SortedSet())
+        removed = [member for member, score in members.items() if _in_range(score, low, high)]
+        for member in removed:
+            del members[member]
+        if not members:
+            self.data.pop(key, None)
+        return len(removed)
+
+    def hgetall(self, key):
+        """Get all fields of a hash key."""
+        self.commands.append("HGETALL")
+        self._check_type(key, dict)
+        return dict(self.data.get(key, {}))
+
+    def scan_iter(self, match=None, count=None, _type=None):  # noqa: ARG002
+        """Iterate all keys matching a pattern."""
+        self.commands.append("SCAN")
+        for key in list(self.data):
+            if match is not None and not fnmatch.fnmatchcase(key, match):
+                continue
+            if _type is not None and self.type(key) != _type.lower():
+                continue
+            yield key
+
+    def pipeline(self, transaction=True):  # noqa: ARG002, FBT002
+        """Create a pipeline."""
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """A minimal stand-in for a `valkey.client.Pipeline`, which runs against a FakeValkey instance.
+
+    Like the real thing, commands are buffered until `execute` is called, except between `watch` and `multi`.
+    """
+
+    def __init__(self, client):
+        """Create a new FakePipeline instance."""
+        self.client = client
+        self.buffer = []
+        self.immediate = False
+        self.watched = {}
+
+    def __enter__(self):
+        """Enter a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        """Exit a context manager."""
+        self.reset()
+
+    def __getattr__(self, name):
+        """Run or buffer a command."""
+        command = getattr(self.client, name)
+
+        def wrapper(*args, **kwargs):
+            if self.immediate:
+                return command(*args, **kwargs)
+            self.buffer.append((command, args, kwargs))
+            return self
+
+        return wrapper
+
+    def watch(self, *keys):
+        """Watch keys, entering immediate-execution mode. The transaction fails if any of them changes first."""
+        self.watched.update({key: copy.deepcopy(self.client.data.get(key)) for key in keys})
+        self.immediate = True
+
+    def multi(self):
+        """Start buffering commands for a transaction."""
+        self.immediate = False
+
+    def execute(self):
+        """Run all buffered commands."""
+        self.client.commands.append("EXEC")
+        if any(self.client.data.get(key) != value for key, value in self.watched.items()):
+            self.reset()
+            raise valkey.exceptions.WatchError
+        results = [command(*args, **kwargs) for command, args, kwargs in self.buffer]
+        self.reset()
+        return results
+
+    def reset(self):
+        """Discard all buffered commands, and stop watching keys."""
+        self.buffer = []
+        self.immediate = False
+        self.watched = {}
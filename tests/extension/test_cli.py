@@ -0,0 +1,112 @@
+"""Test cases for the `flask openheart` command-line tools."""
+
+import time
+
+from flask import Flask
+
+from flask_openheart import OpenHeart
+from flask_openheart.internal import get_backend
+
+
+def _create_app(database_uri):
+    app = Flask(__name__)
+    OpenHeart(app, database_uri=database_uri)
+
+    @app.route("/", openheart=True)
+    def index():
+        return "index"
+
+    return app
+
+
+class TestCli:
+    """Test cases for the `flask openheart` command-line tools."""
+
+    def test_migrate_configured(self, tmp_path):
+        """Test that `flask openheart migrate` migrates every database used by an OpenHeart endpoint.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        uri = f"file:{tmp_path / 'openheart.db'}"
+        app = _create_app(uri)
+        result = app.test_cli_runner().invoke(args=["openheart", "migrate"])
+        assert result.exit_code == 0
+        assert result.output == f"Migrated {uri}\n"
+        assert (tmp_path / "openheart.db").is_file()
+
+    def test_migrate_uri(self, tmp_path):
+        """Test that `flask openheart migrate --uri` migrates only the given databases.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_app(f"file:{tmp_path / 'openheart.db'}")
+        uri = f"file:{tmp_path / 'other.db'}"
+        result = app.test_cli_runner().invoke(args=["openheart", "migrate", "--uri", uri])
+        assert result.exit_code == 0
+        assert result.output == f"Migrated {uri}\n"
+        assert not (tmp_path / "openheart.db").exists()
+
+    def test_migrate_sharded(self, tmp_path):
+        """Test that `flask openheart migrate` migrates every shard of a sharded database.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        uris = [f"file:{tmp_path / 'a.db'}", f"file:{tmp_path / 'b.db'}"]
+        app = _create_app(uris)
+        result = app.test_cli_runner().invoke(args=["openheart", "migrate"])
+        assert result.exit_code == 0
+        assert result.output == "".join(f"Migrated {uri}\n" for uri in uris)
+
+    def test_rebalance(self, tmp_path):
+        """Test that `flask openheart rebalance` moves pages onto a new shard.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        uris = [f"file:{tmp_path / 'a.db'}", f"file:{tmp_path / 'b.db'}"]
+        with get_backend(uris[0]) as backend:
+            backend.incr_many({(f"page.{i}", "❤️"): 1 for i in range(20)})
+        app = _create_app(uris)
+        result = app.test_cli_runner().invoke(args=["openheart", "rebalance"])
+        assert result.exit_code == 0
+        assert result.output.startswith("Moved ")
+        with get_backend(uris[1]) as backend:
+            assert list(backend.slugs())
+
+    def test_rebalance_unsharded(self, tmp_path):
+        """Test that `flask openheart rebalance` fails if no database is sharded.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_app(f"file:{tmp_path / 'openheart.db'}")
+        result = app.test_cli_runner().invoke(args=["openheart", "rebalance"])
+        assert result.exit_code != 0
+
+    def test_compact(self, tmp_path):
+        """Test that `flask openheart compact` rolls up the history of every database which records it.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        uri = f"file:{tmp_path / 'openheart.db'}"
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=uri, history=True)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        with get_backend(uri) as backend:
+            backend.record({("index", "❤️"): 1}, time.time() - 2 * 60 * 60)
+        result = app.test_cli_runner().invoke(args=["openheart", "compact"])
+        assert result.exit_code == 0
+        assert result.output == f"Compacted {uri}\n"
+        with get_backend(uri) as backend:
+            assert backend.rolled_up("index", 60 * 60) > 0
+
+    def test_compact_disabled(self, tmp_path):
+        """Test that `flask openheart compact` fails if no endpoint records history.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_app(f"file:{tmp_path / 'openheart.db'}")
+        result = app.test_cli_runner().invoke(args=["openheart", "compact"])
+        assert result.exit_code != 0
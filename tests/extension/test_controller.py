@@ -0,0 +1,359 @@
+"""Test cases for the OpenHeartController object."""
+
+import asyncio
+
+import pytest
+from flask import Flask, render_template_string, request
+
+from flask_openheart import OpenHeart
+from flask_openheart.internal import BackendError, DuplicateReactionError, get_backend
+from flask_openheart.internal.sqlite import SqliteBackend
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Pytest fixture to create a Flask application with a single OpenHeart endpoint and a read cache.
+
+    Returns:
+        Flask: The application.
+    """
+    app = Flask(__name__)
+    OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", cache_ttl=60)
+
+    @app.route("/", openheart=True)
+    def index():
+        return "index"
+
+    return app
+
+
+def _create_counting_app(tmp_path, **options):
+    app = Flask(__name__)
+    OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", **options)
+    app.slug_calls = []
+
+    @app.route("/page/<int:page_id>/", openheart=True)
+    def page(page_id):  # noqa: ARG001
+        return render_template_string("{{ request.openheart.reactions }} {{ request.openheart.get_url }}")
+
+    @page.slug
+    def page_slug(page_id):
+        app.slug_calls.append(page_id)
+        return page_id
+
+    return app
+
+
+def _incr_behind_cache(app, slug, reaction):
+    with get_backend(app.openheart.config_for("index").database_uri) as backend:
+        backend.incr(slug, reaction)
+
+
+class TestOpenHeartController:
+    """Test cases for the OpenHeartController object."""
+
+    def test_reactions_cached(self, app):
+        """Test that reads are served from the cache once it is populated.
+
+        :param app: The Flask application (supplied by fixture).
+        """
+        with app.app_context():
+            assert app.openheart.reactions_for("index") == {}
+            _incr_behind_cache(app, "index", "❤️")
+            assert app.openheart.reactions_for("index") == {}
+
+    def test_react_updates_cache(self, app):
+        """Test that reacting updates the cached reactions.
+
+        :param app: The Flask application (supplied by fixture).
+        """
+        with app.app_context():
+            assert app.openheart.reactions_for("index") == {}
+            _incr_behind_cache(app, "index", "🥨")
+            assert app.openheart.react_to("❤️", "index") == {"❤️": 1, "🥨": 1}
+            assert app.openheart.reactions_for("index") == {"❤️": 1, "🥨": 1}
+
+    def test_async(self, app):
+        """Test that the async variants read and add the same reactions, and share the cache.
+
+        :param app: The Flask application (supplied by fixture).
+        """
+
+        async def run():
+            assert await app.openheart.areactions_for("index") == {}
+            _incr_behind_cache(app, "index", "🥨")
+            assert await app.openheart.areactions_for("index") == {}
+            assert await app.openheart.areact_to("❤️", "index") == {"❤️": 1, "🥨": 1}
+            assert await app.openheart.aversion_for("index") == 2
+
+        with app.app_context():
+            asyncio.run(run())
+            assert app.openheart.reactions_for("index") == {"❤️": 1, "🥨": 1}
+
+    def test_disabled_endpoint(self, app):
+        """Test that reading or adding reactions for an endpoint without OpenHeart raises a descriptive error.
+
+        :param app: The Flask application (supplied by fixture).
+        """
+        with app.app_context():
+            with pytest.raises(RuntimeError, match="not enabled for 'missing'"):
+                app.openheart.reactions_for("missing")
+            with pytest.raises(RuntimeError, match="not enabled for 'missing'"):
+                asyncio.run(app.openheart.areactions_for("missing"))
+            with pytest.raises(RuntimeError, match="not enabled for 'missing'"):
+                asyncio.run(app.openheart.areact_to("❤️", "missing"))
+
+    def test_stream_url_disabled(self, app):
+        """Test that the stream URL is None, rather than an error, if the stream is not enabled.
+
+        :param app: The Flask application (supplied by fixture).
+        """
+        with app.test_request_context("/"):
+            app.preprocess_request()
+            assert app.openheart.stream_url_for("index") is None
+            assert app.openheart.url_for("index", _method="STREAM") is None
+            assert request.openheart.stream_url is None
+            assert request.openheart.get_url == "/openheart/"
+
+    def test_async_dedup(self, tmp_path):
+        """Test that the async variant of react_to rejects duplicate reactions.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", dedup=True, write_behind=True)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        with app.app_context():
+            assert asyncio.run(app.openheart.areact_to("❤️", "index", _client="a")) == {"❤️": 1}
+            with pytest.raises(DuplicateReactionError):
+                asyncio.run(app.openheart.areact_to("❤️", "index", _client="a"))
+            assert asyncio.run(app.openheart.areact_to("❤️", "index", _client="b")) == {"❤️": 2}
+
+    def test_dedup_failed_reaction(self, tmp_path, monkeypatch):
+        """Test that a reaction which fails to be counted does not count as a duplicate when the client tries again.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", dedup=True)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        def incr_and_fetch(*_):
+            msg = "The database is down."
+            raise BackendError(msg)
+
+        with app.app_context():
+            with monkeypatch.context() as patch:
+                patch.setattr(SqliteBackend, "incr_and_fetch", incr_and_fetch)
+                with pytest.raises(BackendError):
+                    app.openheart.react_to("❤️", "index", _client="a")
+            assert app.openheart.react_to("❤️", "index", _client="a") == {"❤️": 1}
+            with pytest.raises(DuplicateReactionError):
+                app.openheart.react_to("❤️", "index", _client="a")
+
+    def test_slug_once_per_request(self, tmp_path):
+        """Test that the slug function is called only once while handling a request.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_counting_app(tmp_path)
+        response = app.test_client().get("/page/1/")
+        assert response.text == "{} /openheart/page/1/"
+        assert app.slug_calls == [1]
+
+    def test_slug_memoized(self, tmp_path):
+        """Test that slug_cache_size memoizes the slug function by URL values.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_counting_app(tmp_path, slug_cache_size=1)
+        with app.test_request_context():
+            assert app.openheart.slug_for("page", page_id=1) == "page.1"
+            assert app.openheart.slug_for("page", page_id=1) == "page.1"
+            assert app.slug_calls == [1]
+            assert app.openheart.slug_for("page", page_id=2) == "page.2"
+            assert app.openheart.slug_for("page", page_id=1) == "page.1"
+            assert app.slug_calls == [1, 2, 1]
+
+    def test_slug_not_memoized(self, tmp_path):
+        """Test that the slug function is called every time by default.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_counting_app(tmp_path)
+        with app.test_request_context():
+            app.openheart.slug_for("page", page_id=1)
+            app.openheart.slug_for("page", page_id=1)
+            assert app.slug_calls == [1, 1]
+
+    def test_enabled_endpoints(self, tmp_path):
+        """Test that only OpenHeart-enabled endpoints are in the precomputed set of enabled endpoints.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_counting_app(tmp_path)
+
+        @app.route("/plain/")
+        def plain():
+            return "plain"
+
+        assert app.openheart.enabled_endpoints == frozenset({"page"})
+        response = app.test_client().get("/plain/")
+        assert response.text == "plain"
+        assert app.slug_calls == []
+
+    def test_reactions_for_many(self, tmp_path):
+        """Test that reactions_for_many returns the reactions for every enabled item, keyed by slug.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_counting_app(tmp_path)
+        with app.test_request_context():
+            app.openheart.react_to("❤️", "page", page_id=1)
+            app.openheart.react_to("🥨", "page", page_id=2)
+            items = [("page", {"page_id": 1}), ("page", {"page_id": 2}), ("page", {"page_id": 3}), ("plain", {})]
+            assert app.openheart.reactions_for_many(items) == {
+                "page.1": {"❤️": 1},
+                "page.2": {"🥨": 1},
+                "page.3": {},
+            }
+
+    def test_async_counter_shards(self, tmp_path, monkeypatch):
+        """Test that the async reads add up every sub-counter of a page in a single query.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        app = _create_counting_app(tmp_path, counter_shards=4)
+        calls = []
+        iter_many = SqliteBackend.iter_many
+
+        def counting_iter_many(self, slugs):
+            calls.append(slugs)
+            return iter_many(self, slugs)
+
+        monkeypatch.setattr(SqliteBackend, "iter_many", counting_iter_many)
+        with app.test_request_context():
+            for _ in range(10):
+                app.openheart.react_to("❤️", "page", page_id=1)
+            calls.clear()
+            assert asyncio.run(app.openheart.areactions_for("page", page_id=1)) == {"❤️": 10}
+            assert asyncio.run(app.openheart.aversion_for("page", page_id=1)) == 10
+        assert len(calls) == 2
+
+    def test_reactions_for_many_mixed_configs(self, tmp_path):
+        """Test that reactions_for_many reads each endpoint with its own options, even if they share a database.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}")
+
+        @app.route("/a/", openheart=True)
+        def a():
+            return "a"
+
+        @app.route("/b/", openheart={"counter_shards": 4})
+        def b():
+            return "b"
+
+        with app.test_request_context():
+            for _ in range(2):
+                app.openheart.react_to("❤️", "a")
+            for _ in range(20):
+                app.openheart.react_to("❤️", "b")
+            assert app.openheart.reactions_for("b") == {"❤️": 20}
+            assert app.openheart.reactions_for_many([("a", {}), ("b", {})]) == {"a": {"❤️": 2}, "b": {"❤️": 20}}
+
+    def test_counter_shards(self, tmp_path):
+        """Test that reactions are spread across sub-counters, which are added up whenever reactions are read.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_counting_app(tmp_path, counter_shards=4)
+        with get_backend(app.openheart.config_for("page").database_uri) as backend:
+            backend.incr("page.1", "🥨")
+        with app.test_request_context():
+            for _ in range(40):
+                reactions = app.openheart.react_to("❤️", "page", page_id=1)
+            assert reactions == {"❤️": 40, "🥨": 1}
+            assert app.openheart.reactions_for("page", page_id=1) == reactions
+            assert app.openheart.version_for("page", page_id=1) == 41
+            assert app.openheart.reactions_for_many([("page", {"page_id": 1}), ("page", {"page_id": 2})]) == {
+                "page.1": reactions,
+                "page.2": {},
+            }
+            assert asyncio.run(app.openheart.areact_to("❤️", "page", page_id=1)) == {"❤️": 41, "🥨": 1}
+            assert asyncio.run(app.openheart.aversion_for("page", page_id=1)) == 42
+        with get_backend(app.openheart.config_for("page").database_uri) as backend:
+            slugs = set(backend.slugs())
+        assert slugs <= {"page.1", "page.1\x1f1", "page.1\x1f2", "page.1\x1f3"}
+        assert len(slugs) > 1
+
+    def test_reactions_within(self, tmp_path):
+        """Test that reactions are recorded in the history, and counted within a window, if history is enabled.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = _create_counting_app(tmp_path, history=True, counter_shards=2)
+        with app.test_request_context():
+            app.openheart.react_to("❤️", "page", page_id=1)
+            asyncio.run(app.openheart.areact_to("🥨", "page", page_id=1))
+            assert app.openheart.reactions_within("page", 60, page_id=1) == {"❤️": 1, "🥨": 1}
+            assert app.openheart.reactions_within("page", 60, page_id=2) == {}
+        app = _create_counting_app(tmp_path)
+        with app.test_request_context(), pytest.raises(RuntimeError):
+            app.openheart.reactions_within("page", 60, page_id=1)
+
+    def test_read_replicas(self, tmp_path):
+        """Test that reactions are read from replicas in turn, but added to (and returned from) the primary.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        primary = f"file:{tmp_path / 'primary.db'}"
+        replicas = [f"file:{tmp_path / 'replica1.db'}", f"file:{tmp_path / 'replica2.db'}"]
+        for i, uri in enumerate(replicas):
+            with get_backend(uri) as backend:
+                backend.incr_many({("index", "❤️"): i + 1})
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=primary, read_database_uris=replicas)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        with app.test_request_context():
+            assert app.openheart.react_to("🥨", "index") == {"🥨": 1}
+            results = [app.openheart.reactions_for("index") for _ in range(2)]
+            assert sorted(results, key=str) == [{"❤️": 1}, {"❤️": 2}]
+            assert app.openheart.version_for("index") in {1, 2}
+            assert app.openheart.reactions_for_many([("index", {})])["index"] in results
+        with get_backend(primary) as backend:
+            assert dict(backend.iter("index")) == {"🥨": 1}
+
+    def test_read_replica_failover(self, tmp_path):
+        """Test that reads fall back to another replica, or to the primary, when a replica fails.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        primary = f"file:{tmp_path / 'primary.db'}"
+        broken = f"file:{tmp_path / 'missing' / 'replica.db'}"
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=primary, read_database_uris=[broken])
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        with app.test_request_context():
+            app.openheart.react_to("❤️", "index")
+            assert app.openheart.reactions_for("index") == {"❤️": 1}
+            assert app.openheart.reactions_for("index") == {"❤️": 1}
@@ -0,0 +1,265 @@
+"""Test cases for the OpenHeart endpoint handler."""
+
+import http
+import json
+import secrets
+import time
+
+import pytest
+from flask import Flask
+
+from flask_openheart import OpenHeart
+from flask_openheart.internal import get_backend, storage
+from flask_openheart.internal.ratelimit import reset_rate_limiters
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Pytest fixture to create a test client for an application with a single OpenHeart endpoint.
+
+    Returns:
+        FlaskClient: The test client.
+    """
+    app = Flask(__name__)
+    OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", cache_max_age=10)
+
+    @app.route("/", openheart=True)
+    def index():
+        return "index"
+
+    return app.test_client()
+
+
+class TestHandler:
+    """Test cases for the OpenHeart endpoint handler."""
+
+    def test_etag(self, client):
+        """Test that GET responses carry an ETag which changes whenever the reactions change.
+
+        :param client: The test client (supplied by fixture).
+        """
+        response = client.get("/openheart/")
+        assert response.status_code == http.HTTPStatus.OK
+        etag = response.get_etag()[0]
+        client.post("/openheart/", data="❤️".encode())
+        response = client.get("/openheart/")
+        assert response.json == {"❤️": 1}
+        assert response.get_etag()[0] != etag
+
+    def test_not_modified(self, client):
+        """Test that a GET request with a matching If-None-Match header gets a 304 response.
+
+        :param client: The test client (supplied by fixture).
+        """
+        client.post("/openheart/", data="❤️".encode())
+        etag = client.get("/openheart/").get_etag()[0]
+        response = client.get("/openheart/", headers={"If-None-Match": f'"{etag}"'})
+        assert response.status_code == http.HTTPStatus.NOT_MODIFIED
+        assert response.get_etag()[0] == etag
+        client.post("/openheart/", data="❤️".encode())
+        response = client.get("/openheart/", headers={"If-None-Match": f'"{etag}"'})
+        assert response.status_code == http.HTTPStatus.OK
+        assert response.json == {"❤️": 2}
+
+    def test_cache_control(self, client):
+        """Test that GET responses carry the configured Cache-Control max-age.
+
+        :param client: The test client (supplied by fixture).
+        """
+        response = client.get("/openheart/")
+        assert response.cache_control.public
+        assert response.cache_control.max_age == 10
+
+    def test_react_trailing_data(self, client):
+        """Test that trailing data after the emoji is ignored, even when it is longer than any emoji.
+
+        :param client: The test client (supplied by fixture).
+        """
+        response = client.post("/openheart/", data=("❤️" + "x" * 500).encode())
+        assert response.status_code == http.HTTPStatus.OK
+        assert response.json == {"❤️": 1}
+
+    def test_react_truncated_character(self, client):
+        """Test that a multi-byte character cut off by the end of the prefix which is read does not cause an error.
+
+        :param client: The test client (supplied by fixture).
+        """
+        response = client.post("/openheart/", data=("❤️" + "é" * 100).encode())
+        assert response.status_code == http.HTTPStatus.OK
+        assert response.json == {"❤️": 1}
+
+    def test_react_too_large(self, client):
+        """Test that a request body larger than the maximum is rejected.
+
+        :param client: The test client (supplied by fixture).
+        """
+        response = client.post("/openheart/", data=("❤️" + "x" * 2000).encode())
+        assert response.status_code == http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        assert client.get("/openheart/").json == {}
+
+    def test_react_invalid(self, client):
+        """Test that a request body which does not start with an emoji is rejected.
+
+        :param client: The test client (supplied by fixture).
+        """
+        response = client.post("/openheart/", data=b"not an emoji")
+        assert response.status_code == http.HTTPStatus.BAD_REQUEST
+        response = client.post("/openheart/", data=b"\xff\xfe")
+        assert response.status_code == http.HTTPStatus.BAD_REQUEST
+
+    def test_rate_limit(self, tmp_path, monkeypatch):
+        """Test that reactions beyond the rate limit are rejected before any storage is touched.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        reset_rate_limiters()
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", rate_limit=2)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        client = app.test_client()
+        assert client.post("/openheart/", data="❤️".encode()).status_code == http.HTTPStatus.OK
+        assert client.post("/openheart/", data="❤️".encode()).status_code == http.HTTPStatus.OK
+
+        def fail(*_args):
+            raise AssertionError
+
+        monkeypatch.setattr(storage, "get_pool", fail)
+        response = client.post("/openheart/", data="❤️".encode())
+        assert response.status_code == http.HTTPStatus.TOO_MANY_REQUESTS
+        assert 0 < int(response.headers["Retry-After"]) <= 30
+        monkeypatch.undo()
+        response = client.post("/openheart/", data="❤️".encode(), environ_base={"REMOTE_ADDR": "10.0.0.1"})
+        assert response.json == {"❤️": 3}
+
+    def test_dedup(self, tmp_path):
+        """Test that each client may only make each reaction once.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = Flask(__name__)
+        app.config["SECRET_KEY"] = secret_key = secrets.token_hex(16)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", dedup=True)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        assert app.openheart.configs["index"].dedup_key == secret_key
+        client = app.test_client()
+        assert client.post("/openheart/", data="❤️".encode()).json == {"❤️": 1}
+        response = client.post("/openheart/", data="❤️".encode())
+        assert response.status_code == http.HTTPStatus.CONFLICT
+        assert client.post("/openheart/", data="🥨".encode()).json == {"❤️": 1, "🥨": 1}
+        response = client.post("/openheart/", data="❤️".encode(), environ_base={"REMOTE_ADDR": "10.0.0.1"})
+        assert response.json == {"❤️": 2, "🥨": 1}
+
+    def test_dedup_cookie(self, tmp_path):
+        """Test that clients can be identified by a cookie, which is set on their first reaction.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", dedup=True, dedup_cookie="openheart")
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        client = app.test_client()
+        response = client.post("/openheart/", data="❤️".encode())
+        assert response.json == {"❤️": 1}
+        assert client.get_cookie("openheart") is not None
+        response = client.post("/openheart/", data="❤️".encode())
+        assert response.status_code == http.HTTPStatus.CONFLICT
+        client.delete_cookie("openheart")
+        assert client.post("/openheart/", data="❤️".encode()).json == {"❤️": 2}
+
+    def test_window(self, tmp_path):
+        """Test that a window query counts only the reactions made within the window, if history is enabled.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        uri = f"file:{tmp_path / 'openheart.db'}"
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=uri, history=True)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        with get_backend(uri) as backend:
+            backend.incr("index", "🥨")
+            backend.record({("index", "🥨"): 1}, time.time() - 7200)
+        client = app.test_client()
+        client.post("/openheart/", data="❤️".encode())
+        assert client.get("/openheart/").json == {"❤️": 1, "🥨": 1}
+        assert client.get("/openheart/?window=3600").json == {"❤️": 1}
+        assert client.get("/openheart/?window=86400").json == {"❤️": 1, "🥨": 1}
+        assert client.get(f"/openheart/?window={10**20}").json == {"❤️": 1, "🥨": 1}
+        assert client.get("/openheart/?window=0").status_code == http.HTTPStatus.BAD_REQUEST
+        assert client.get("/openheart/?window=soon").status_code == http.HTTPStatus.BAD_REQUEST
+
+    def test_window_disabled(self, client):
+        """Test that a window query is rejected if history is not enabled.
+
+        :param client: The test client (supplied by fixture).
+        """
+        assert client.get("/openheart/?window=3600").status_code == http.HTTPStatus.BAD_REQUEST
+
+    def test_async_handler(self, tmp_path):
+        """Test that the async view serves the same responses as the blocking one.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", async_handler=True, dedup=True, history=True)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        client = app.test_client()
+        assert client.post("/openheart/", data="❤️".encode()).json == {"❤️": 1}
+        assert client.post("/openheart/", data="❤️".encode()).status_code == http.HTTPStatus.CONFLICT
+        assert client.post("/openheart/", data=b"x").status_code == http.HTTPStatus.BAD_REQUEST
+        assert client.get("/openheart/?window=60").json == {"❤️": 1}
+        response = client.get("/openheart/")
+        assert response.json == {"❤️": 1}
+        response = client.get("/openheart/", headers={"If-None-Match": f'"{response.get_etag()[0]}"'})
+        assert response.status_code == http.HTTPStatus.NOT_MODIFIED
+
+    def test_stream(self, tmp_path):
+        """Test that the stream sends the current reactions, then each update.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        app = Flask(__name__)
+        OpenHeart(app, database_uri=f"file:{tmp_path / 'openheart.db'}", stream=True)
+
+        @app.route("/", openheart=True)
+        def index():
+            return "index"
+
+        client = app.test_client()
+        with app.test_request_context():
+            assert app.openheart.stream_url_for("index") == "/openheart/stream/"
+        response = client.get("/openheart/stream/", buffered=False)
+        assert response.mimetype == "text/event-stream"
+        events = iter(response.response)
+        assert next(events) == b"id: 0\ndata: {}\n\n"
+        client.post("/openheart/", data="❤️".encode())
+        assert next(events) == f"id: 1\ndata: {json.dumps({'❤️': 1})}\n\n".encode()
+        response.close()
+
+    def test_stream_disabled(self, client):
+        """Test that the stream is not served unless it is enabled.
+
+        :param client: The test client (supplied by fixture).
+        """
+        response = client.get("/openheart/stream/")
+        assert response.status_code == http.HTTPStatus.NOT_FOUND
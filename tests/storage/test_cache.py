@@ -0,0 +1,54 @@
+"""Test cases for the reaction cache."""
+
+import time
+
+from flask_openheart.internal import broadcast
+from flask_openheart.internal.broadcast import Broadcaster
+from flask_openheart.internal.cache import ReactionCache
+
+
+class TestReactionCache:
+    """Test cases for the ReactionCache object."""
+
+    def test_get_set(self):
+        """Test that cached reactions are returned as a copy."""
+        cache = ReactionCache(2, 60)
+        assert cache.get("foo") is None
+        cache.set("foo", {"❤️": 1})
+        reactions = cache.get("foo")
+        assert reactions == {"❤️": 1}
+        reactions["❤️"] = 2
+        assert cache.get("foo") == {"❤️": 1}
+
+    def test_ttl(self, monkeypatch):
+        """Test that entries expire after the TTL.
+
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        cache = ReactionCache(2, 60)
+        cache.set("foo", {"❤️": 1})
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+        assert cache.get("foo") is None
+
+    def test_lru(self):
+        """Test that the least recently used entry is evicted when the cache is full."""
+        cache = ReactionCache(2, 60)
+        cache.set("foo", {"❤️": 1})
+        cache.set("bar", {"❤️": 2})
+        cache.get("foo")
+        cache.set("baz", {"❤️": 3})
+        assert cache.get("bar") is None
+        assert cache.get("foo") == {"❤️": 1}
+        assert cache.get("baz") == {"❤️": 3}
+
+    def test_on_message(self):
+        """Test that messages from other processes invalidate entries, and messages from this process do not."""
+        cache = ReactionCache(2, 60)
+        broadcaster = Broadcaster()
+        broadcaster.subscribe(cache.on_message)
+        cache.set("foo", {"❤️": 1})
+        broadcaster.publish("foo", {"❤️": 1})
+        assert cache.get("foo") == {"❤️": 1}
+        broadcaster.deliver({"origin": f"not-{broadcast.ORIGIN}", "slug": "foo", "reactions": {"❤️": 2}})
+        assert cache.get("foo") is None
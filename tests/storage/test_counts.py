@@ -0,0 +1,34 @@
+"""Test cases for compact reaction counts."""
+
+from flask_openheart.internal.counts import Counts, intern
+
+
+class TestCounts:
+    """Test cases for the Counts object."""
+
+    def test_intern(self):
+        """Test that each reaction gets a single, stable id."""
+        assert intern("❤️") == intern("❤️")
+        assert intern("❤️") != intern("🥨")
+
+    def test_add(self):
+        """Test that counts can be added, and converted to a dict with only the non-zero counts."""
+        counts = Counts()
+        assert not counts
+        assert counts.as_dict() == {}
+        counts.add("🥨")
+        counts.add("❤️", 2)
+        assert counts
+        assert counts.as_dict() == {"❤️": 2, "🥨": 1}
+        assert counts.total() == 3
+
+    def test_update(self):
+        """Test that counts can be created from, and updated with, dicts or other Counts."""
+        counts = Counts({"❤️": 2})
+        counts.update(Counts({"❤️": 1, "🥨": 1}))
+        counts.update({"🥨": 3})
+        assert dict(counts.items()) == {"❤️": 3, "🥨": 4}
+
+    def test_slots(self):
+        """Test that Counts objects have no per-instance dict."""
+        assert not hasattr(Counts(), "__dict__")
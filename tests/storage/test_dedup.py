@@ -0,0 +1,40 @@
+"""Test cases for the deduplication filter."""
+
+from flask_openheart.internal import dedup
+
+
+class TestDedup:
+    """Test cases for the dedup module."""
+
+    def test_positions(self):
+        """Test that positions are stable, within the filter, and depend on both the client and the reaction."""
+        positions = dedup.positions("client", "❤️", 64)
+        assert positions == dedup.positions("client", "❤️", 64)
+        assert len(positions) == dedup.HASHES
+        assert all(0 <= position < 64 for position in positions)
+        assert dedup.positions("client", "🥨", 65536) != dedup.positions("client", "❤️", 65536)
+        assert dedup.positions("other", "❤️", 65536) != dedup.positions("client", "❤️", 65536)
+
+    def test_key(self):
+        """Test that positions depend on the key."""
+        positions = dedup.positions("192.0.2.1", "❤️", 65536, key="secret")
+        assert positions == dedup.positions("192.0.2.1", "❤️", 65536, key=b"secret")
+        assert positions != dedup.positions("192.0.2.1", "❤️", 65536)
+        assert positions != dedup.positions("192.0.2.1", "❤️", 65536, key="other")
+
+    def test_mark(self):
+        """Test that marking reports whether any bit was newly set."""
+        bits = bytearray(8)
+        assert dedup.mark(bits, [0, 9])
+        assert bits[:2] == b"\x01\x02"
+        assert not dedup.mark(bits, [9, 0])
+        assert dedup.mark(bits, [9, 63])
+
+    def test_unmark(self):
+        """Test that unmarking clears only the given bits."""
+        bits = bytearray(8)
+        added = dedup.mark(bits, [0, 9])
+        assert added == [0, 9]
+        assert dedup.mark(bits, [9, 10]) == [10]
+        dedup.unmark(bits, added)
+        assert bits[:2] == b"\x00\x04"
@@ -0,0 +1,57 @@
+"""Test cases for the compact emoji data file."""
+
+from importlib.metadata import version
+
+from emoji import EMOJI_DATA
+
+from flask_openheart.internal import emojis
+
+
+class TestEmojis:
+    """Test cases for the emojis module."""
+
+    def test_load(self):
+        """Test that the data file is up to date with the installed emoji database.
+
+        If this fails after upgrading `emoji`, regenerate the data file with `just emojis`.
+        """
+        assert emojis.load() == frozenset(EMOJI_DATA)
+        header = emojis.DATA_FILE.read_text(encoding="utf-8").split("\n")[0]
+        assert header.startswith(f"{emojis.HEADER_PREFIX}{version('emoji')} {emojis.DIGEST_PREFIX}")
+
+    def test_load_mismatched_data(self, tmp_path, monkeypatch):
+        """Test that the full emoji database is used if the data file was generated from other emoji data.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        path = tmp_path / "emojis.txt"
+        path.write_text(f"# emoji {version('emoji')} {emojis.DIGEST_PREFIX}0\n❤️\n", encoding="utf-8")
+        monkeypatch.setattr(emojis, "DATA_FILE", path)
+        assert emojis.load() == frozenset(EMOJI_DATA)
+
+    def test_load_other_version(self, tmp_path, monkeypatch):
+        """Test that the data file is used for another version of `emoji`, if its emoji data is the same.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        path = tmp_path / "emojis.txt"
+        emojis.generate(path)
+        header, rest = path.read_text(encoding="utf-8").split("\n", 1)
+        path.write_text(f"# emoji 0.0.0 {header.rpartition(' ')[2]}\n{rest}", encoding="utf-8")
+        monkeypatch.setattr(emojis, "DATA_FILE", path)
+        monkeypatch.setitem(EMOJI_DATA, "not an emoji", {})
+        assert "not an emoji" not in emojis.load()
+
+    def test_generate(self, tmp_path, monkeypatch):
+        """Test that a generated data file can be loaded.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        path = tmp_path / "emojis.txt"
+        emojis.generate(path)
+        monkeypatch.setattr(emojis, "DATA_FILE", path)
+        monkeypatch.setitem(EMOJI_DATA, "not an emoji", {})
+        assert "not an emoji" not in emojis.load()
@@ -0,0 +1,43 @@
+"""Test cases for the event hub."""
+
+from flask_openheart.internal.broadcast import Broadcaster
+from flask_openheart.internal.events import EventHub
+
+
+def _hub(queue_size):
+    broadcaster = Broadcaster()
+    hub = EventHub(queue_size)
+    broadcaster.subscribe(hub.on_message)
+    return broadcaster, hub
+
+
+class TestEventHub:
+    """Test cases for the EventHub object."""
+
+    def test_fan_out(self):
+        """Test that updates are delivered to every subscriber of the page, and only to subscribers of that page."""
+        broadcaster, hub = _hub(4)
+        with hub.subscribe("foo") as first, hub.subscribe("foo") as second, hub.subscribe("bar") as other:
+            broadcaster.publish("foo", {"❤️": 1})
+            assert first.get(timeout=0) == {"❤️": 1}
+            assert second.get(timeout=0) == {"❤️": 1}
+            assert other.get(timeout=0) is None
+
+    def test_bounded(self):
+        """Test that a slow subscriber only keeps the most recent updates."""
+        broadcaster, hub = _hub(2)
+        with hub.subscribe("foo") as subscription:
+            for count in range(1, 6):
+                broadcaster.publish("foo", {"❤️": count})
+            assert subscription.get(timeout=0) == {"❤️": 4}
+            assert subscription.get(timeout=0) == {"❤️": 5}
+            assert subscription.get(timeout=0) is None
+
+    def test_close(self):
+        """Test that a closed subscription stops receiving updates, and is forgotten by the hub."""
+        broadcaster, hub = _hub(2)
+        subscription = hub.subscribe("foo")
+        subscription.close()
+        broadcaster.publish("foo", {"❤️": 1})
+        assert subscription.get(timeout=0) is None
+        assert not hub._subscribers  # noqa: SLF001
@@ -0,0 +1,52 @@
+"""Test cases for planning reads of the reaction history."""
+
+from flask_openheart.internal import history
+
+RETENTION = ((history.MINUTE, history.HOUR), (history.HOUR, history.DAY), (history.DAY, None))
+NOW = 1_700_000_000
+
+
+class TestHistory:
+    """Test cases for the history module."""
+
+    def test_bucket(self):
+        """Test that a point in time falls in the bucket which starts at or before it."""
+        assert history.bucket(NOW + 0.5, history.MINUTE) == NOW - NOW % 60
+        assert history.bucket(NOW - NOW % 3600, history.HOUR) == NOW - NOW % 3600
+
+    def test_rollup_through(self):
+        """Test that only buckets which have been complete for a while are rolled up, and only from complete buckets."""
+        hour = NOW - NOW % 3600
+        assert history.rollup_through(hour + 30, history.HOUR) == hour - 3600
+        assert history.rollup_through(hour + 90, history.HOUR) == hour
+        assert history.rollup_through(hour + 90, history.DAY, finer_through=hour) == history.bucket(hour, history.DAY)
+
+    def test_remove_before(self):
+        """Test that buckets overlapping the retention period, or not yet rolled up, are not removed."""
+        hour = NOW - NOW % 3600
+        assert history.remove_before(hour + 3630, history.MINUTE, 3600) == hour
+        assert history.remove_before(hour + 3630, history.MINUTE, 3600, coarser_through=hour - 3600) == hour - 3600
+
+    def test_plan_minutes(self):
+        """Test that a window within the minute retention period is read from minute buckets only."""
+        ranges = history.plan(NOW - 600, NOW, RETENTION, lambda _: NOW - NOW % 3600)
+        assert ranges == [(history.MINUTE, history.bucket(NOW - 600, history.MINUTE), NOW)]
+
+    def test_plan_rolled_up(self):
+        """Test that a longer window reads coarse buckets up to where they are rolled up, then finer buckets."""
+        hour = NOW - NOW % 3600
+        rolled_up = {history.HOUR: hour, history.DAY: 0}
+        ranges = history.plan(NOW - 7200, NOW, RETENTION, rolled_up.get)
+        start = history.bucket(NOW - 7200, history.HOUR)
+        assert ranges == [(history.HOUR, start, hour), (history.MINUTE, hour, NOW)]
+
+    def test_plan_not_rolled_up(self):
+        """Test that a window is read from minute buckets if nothing has been rolled up yet."""
+        ranges = history.plan(NOW - 7200, NOW, RETENTION, lambda _: 0)
+        assert ranges == [(history.MINUTE, history.bucket(NOW - 7200, history.HOUR), NOW)]
+
+    def test_plan_clipped(self):
+        """Test that a window longer than every retention period is cut short."""
+        retention = ((history.MINUTE, history.HOUR), (history.HOUR, history.DAY))
+        ranges = history.plan(0, NOW, retention, lambda _: 0)
+        assert ranges == [(history.MINUTE, history.bucket(NOW - history.DAY, history.HOUR), NOW)]
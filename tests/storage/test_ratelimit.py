@@ -0,0 +1,48 @@
+"""Test cases for the rate limiter."""
+
+import time
+
+from flask_openheart.internal.ratelimit import RateLimiter
+
+
+class TestRateLimiter:
+    """Test cases for the RateLimiter object."""
+
+    def test_limit(self):
+        """Test that a client may react up to the rate, and is then told how long to wait."""
+        limiter = RateLimiter(2, 60, 16)
+        assert limiter.hit("client", "foo") == 0
+        assert limiter.hit("client", "foo") == 0
+        assert 0 < limiter.hit("client", "foo") <= 30
+
+    def test_keys(self):
+        """Test that limits are tracked separately for each client and page."""
+        limiter = RateLimiter(1, 60, 16)
+        assert limiter.hit("client", "foo") == 0
+        assert limiter.hit("client", "bar") == 0
+        assert limiter.hit("other", "foo") == 0
+        assert limiter.hit("client", "foo") > 0
+
+    def test_refill(self, monkeypatch):
+        """Test that tokens are refilled over time.
+
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        limiter = RateLimiter(2, 60, 16)
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+        limiter.hit("client", "foo")
+        limiter.hit("client", "foo")
+        assert limiter.hit("client", "foo") == 30
+        monkeypatch.setattr(time, "monotonic", lambda: now + 30)
+        assert limiter.hit("client", "foo") == 0
+        assert limiter.hit("client", "foo") > 0
+
+    def test_eviction(self):
+        """Test that the least recently used bucket is evicted when the limiter is full."""
+        limiter = RateLimiter(1, 60, 2)
+        limiter.hit("client", "foo")
+        limiter.hit("client", "bar")
+        limiter.hit("client", "baz")
+        assert limiter.hit("client", "foo") == 0
+        assert limiter.hit("client", "baz") > 0
@@ -0,0 +1,32 @@
+"""Test cases for read replica selection."""
+
+import time
+
+from flask_openheart.internal.replicas import ReplicaSet
+
+
+class TestReplicaSet:
+    """Test cases for the ReplicaSet object."""
+
+    def test_round_robin(self):
+        """Test that each read starts with the next replica in turn."""
+        replicas = ReplicaSet(["a", "b", "c"], 30)
+        assert [replicas.candidates()[0] for _ in range(4)] == ["a", "b", "c", "a"]
+        assert replicas.candidates() == ["b", "c", "a"]
+
+    def test_failed(self, monkeypatch):
+        """Test that a failed replica is skipped until the retry interval has passed.
+
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        replicas = ReplicaSet(["a", "b"], 30)
+        replicas.failed("a")
+        assert replicas.candidates() == ["b"]
+        assert replicas.candidates() == ["b"]
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 31)
+        assert sorted(replicas.candidates()) == ["a", "b"]
+
+    def test_empty(self):
+        """Test that there are no candidates without replicas."""
+        assert ReplicaSet([], 30).candidates() == []
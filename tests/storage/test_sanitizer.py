@@ -3,6 +3,7 @@
 import urllib
 
 import pytest
+from emoji import EMOJI_DATA
 
 from flask_openheart.internal.storage import InvalidReactionError, sanitize_reaction
 
@@ -12,7 +13,7 @@ def emoji_test_file(tmp_path_factory):
     """Test fixture to download the Unicode 16.0 emoji test data."""
     url = "https://unicode.org/Public/emoji/16.0/emoji-test.txt"
     path = tmp_path_factory.mktemp("data") / "emoji-test.txt"
-    with urllib.request.urlopen(url) as src, path.open("wb") as dest:  # noqa: S310
+    with urllib.request.urlopen(url) as src, path.open("wb") as dest:
         dest.write(src.read())
     return path
 
@@ -79,3 +80,27 @@ class TestEmojiSanitizer:
             e, remainder = sanitize_reaction(details["emoji"])
             assert e == details["emoji"], f"failed to validate: {details['description']}"
             assert not remainder, f"returned remainder: {details['description']}"
+
+    def test_known_emojis(self):
+        """Test that every emoji in the emoji database is accepted as-is."""
+        for emoji in EMOJI_DATA:
+            e, remainder = sanitize_reaction(emoji)
+            assert e == emoji
+            assert not remainder
+
+    def test_trailing_data(self):
+        """Test that trailing data after the emoji is returned as the remainder."""
+        e, remainder = sanitize_reaction("🥨 tasty")
+        assert e == "🥨"
+        assert remainder == " tasty"
+
+    def test_longest_match(self):
+        """Test that the longest matching emoji is preferred over any shorter emoji it starts with."""
+        e, remainder = sanitize_reaction("👍🏽👍")
+        assert e == "👍🏽"
+        assert remainder == "👍"
+
+    def test_not_an_emoji(self):
+        """Test that input which does not start with an emoji causes an error."""
+        with pytest.raises(InvalidReactionError):
+            sanitize_reaction("not an emoji ❤️")
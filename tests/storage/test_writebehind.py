@@ -0,0 +1,170 @@
+"""Test cases for the write-behind buffer."""
+
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from flask_openheart.config import OpenHeartConfig
+from flask_openheart.internal.pool import BackendPool
+from flask_openheart.internal.storage import Storage
+from flask_openheart.internal.writebehind import WriteBuffer
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """Pytest fixture to generate a pool of SQLite backends for a temporary database file.
+
+    Yields:
+        BackendPool: The pool object.
+    """
+    pool = BackendPool(f"file:{tmp_path / 'openheart.db'}", 2, 30)
+    yield pool
+    pool.close()
+
+
+def _stored(pool, slug):
+    backend = pool.acquire()
+    try:
+        return dict(backend.iter(slug))
+    finally:
+        pool.release(backend)
+
+
+class TestWriteBuffer:
+    """Test cases for the WriteBuffer object."""
+
+    def test_pending(self, pool):
+        """Test that buffered increments are reported as pending, and not yet written.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        buffer = WriteBuffer(pool, 60_000, 100)
+        buffer.add("foo", "❤️")
+        buffer.add("foo", "❤️")
+        buffer.add("bar", "🥨")
+        assert buffer.pending("foo") == {"❤️": 2}
+        assert _stored(pool, "foo") == {}
+        buffer.close()
+
+    def test_flush(self, pool):
+        """Test that flushing writes all pending increments to the backend.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        buffer = WriteBuffer(pool, 60_000, 100)
+        buffer.add("foo", "❤️")
+        buffer.add("foo", "❤️")
+        buffer.add("bar", "🥨")
+        buffer.flush()
+        assert buffer.pending("foo") == {}
+        assert _stored(pool, "foo") == {"❤️": 2}
+        assert _stored(pool, "bar") == {"🥨": 1}
+        buffer.close()
+
+    def test_max_events(self, pool):
+        """Test that the background thread writes increments as soon as `max_events` are pending.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        buffer = WriteBuffer(pool, 60_000, 2)
+        buffer.add("foo", "❤️")
+        buffer.add("foo", "❤️")
+        deadline = time.monotonic() + 5
+        while _stored(pool, "foo") != {"❤️": 2} and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _stored(pool, "foo") == {"❤️": 2}
+        buffer.close()
+
+    def test_flush_history(self, pool):
+        """Test that flushing also records the increments in the history, if enabled.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        buffer = WriteBuffer(pool, 60_000, 100, history=True)
+        buffer.add("foo", "❤️")
+        buffer.add("foo", "❤️")
+        buffer.flush()
+        now = time.time()
+        backend = pool.acquire()
+        try:
+            assert backend.reactions_between("foo", now - 60, now + 1, OpenHeartConfig().history_retention) == {"❤️": 2}
+        finally:
+            pool.release(backend)
+        buffer.close()
+
+    def test_failed_flush_kept(self, pool, monkeypatch):
+        """Test that increments are kept for the next flush if writing them raises any exception.
+
+        :param pool: The backend pool (supplied by fixture).
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        buffer = WriteBuffer(pool, 60_000, 100)
+        buffer.add("foo", "❤️")
+        with monkeypatch.context() as patch:
+            patch.setattr(pool, "acquire", Mock(side_effect=RuntimeError("boom")))
+            with pytest.raises(RuntimeError):
+                buffer.flush()
+        assert buffer.pending("foo") == {"❤️": 1}
+        buffer.flush()
+        assert buffer.pending("foo") == {}
+        assert _stored(pool, "foo") == {"❤️": 1}
+        buffer.close()
+
+    def test_thread_survives_failure(self, pool, monkeypatch):
+        """Test that the background thread keeps writing increments after a write raised an unexpected exception.
+
+        :param pool: The backend pool (supplied by fixture).
+        :param monkeypatch: The pytest monkeypatch fixture.
+        """
+        failed = threading.Event()
+
+        def acquire(acquire=pool.acquire):
+            if not failed.is_set():
+                failed.set()
+                raise RuntimeError
+            return acquire()
+
+        monkeypatch.setattr(pool, "acquire", acquire)
+        buffer = WriteBuffer(pool, 10, 100)
+        buffer.add("foo", "❤️")
+        assert failed.wait(5)
+        buffer.add("foo", "❤️")
+        deadline = time.monotonic() + 5
+        while buffer.pending("foo") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert buffer.pending("foo") == {}
+        assert _stored(pool, "foo") == {"❤️": 2}
+        buffer.close()
+
+    def test_close_flushes(self, pool):
+        """Test that closing the buffer writes any pending increments.
+
+        :param pool: The backend pool (supplied by fixture).
+        """
+        buffer = WriteBuffer(pool, 60_000, 100)
+        buffer.add("foo", "❤️")
+        buffer.close()
+        assert _stored(pool, "foo") == {"❤️": 1}
+
+
+class TestWriteBehindStorage:
+    """Test cases for Storage in write-behind mode."""
+
+    def test_react_merges_pending(self, tmp_path):
+        """Test that reacting in write-behind mode returns counts which include the pending increments.
+
+        :param tmp_path: The pytest tmp_path fixture.
+        """
+        config = OpenHeartConfig(
+            database_uri=f"file:{tmp_path / 'openheart.db'}", write_behind=True, write_behind_interval=60_000
+        )
+        with Storage("foo", config) as storage:
+            assert storage.react("❤️") == {"❤️": 1}
+            assert storage.react("❤️") == {"❤️": 2}
+            assert storage.reactions == {"❤️": 2}
+            assert dict(storage.backend.iter("foo")) == {}
+            storage.write_buffer.flush()
+            assert dict(storage.backend.iter("foo")) == {"❤️": 2}
+            assert storage.reactions == {"❤️": 2}